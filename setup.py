@@ -117,5 +117,10 @@ setup(
     packages=find_packages(exclude="tests"),
     python_requires=">=3.8, <4",
     install_requires=["semver", "uplink", "dynaconf", "python-json-logger"],
+    extras_require={
+        "orjson": ["orjson"],
+        "ujson": ["ujson"],
+        "zstd": ["zstandard"],
+    },
     license="MIT",
 )
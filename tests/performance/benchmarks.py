@@ -0,0 +1,548 @@
+"""
+This is the benchmark suite of Trafalgar Log, built only on the standard
+library (timeit), so it runs wherever the tests run.
+
+Each benchmark measures a single operation: the Logger methods with
+different payloads and levels, and each stage of the pipeline in
+isolation (_to_json, _dict_replace_value, the capture of the caller,
+_get_code_line, the formatters and the handler). Every benchmark is
+repeated and its best time per call is divided by the time of a fixed
+calibration workload, so the results of different machines can be
+compared with the same baseline.
+
+Run it with the environment variables of the tests:
+
+    set -a && . tests/.env && set +a
+    python -m tests.performance.benchmarks --output results.json
+    python -m tests.performance.benchmarks --compare
+    python -m tests.performance.benchmarks --save-baseline
+
+--compare exits with status 1 when any benchmark is slower than the
+baseline (tests/performance/baseline.json) by more than the tolerance.
+
+The import time of Trafalgar Log is measured apart, on a new interpreter
+(python -X importtime), since a module is only imported once:
+
+    python -m tests.performance.benchmarks --import-time
+
+The throughput of the file handler (TRA_LOG_FILE), with and without
+rotation, is measured apart too, against stderr redirected to a file:
+
+    python -m tests.performance.benchmarks --file-throughput
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from contextlib import contextmanager
+from typing import Callable, Iterator, NoReturn, Optional
+
+from tests.performance.models import (
+    PerformanceDataTest,
+    PerformanceInnerDataTest,
+    PerformanceSecondInnerDataTest,
+)
+from trafalgar_log.core import logger as logger_module, utils
+from trafalgar_log.core.handlers import TrafalgarRotatingFileHandler
+from trafalgar_log.core.logger import Logger
+from trafalgar_log.core.utils import (
+    LOG_CODE,
+    PAYLOAD,
+    SEVERITY,
+    TrafalgarLogFastFormatter,
+    TrafalgarLogFormatter,
+)
+
+BASELINE: str = os.path.join(os.path.dirname(__file__), "baseline.json")
+TOLERANCE: float = 0.3
+REPEAT: int = 5
+MINIMUM_TIME: float = 0.2
+QUICK_NUMBER: int = 10
+BENCHMARK_LOG_CODE: str = "Benchmark"
+CALIBRATION: str = "calibration"
+IMPORTED_MODULE: str = "trafalgar_log.core.logger"
+FILE_EVENTS: int = 100000
+FILE_MAX_BYTES: int = 4 * 1024 * 1024
+_CALIBRATION_PAYLOAD: dict = {
+    "id": 1,
+    "name": "calibration",
+    "items": list(range(20)),
+}
+
+
+def _get_flat_dict() -> dict:
+    return {f"field_{i}": f"value {i}" for i in range(20)}
+
+
+def _get_nested_dataclass() -> PerformanceDataTest:
+    fields = {key: f"{key} value" * 10 for key in "abcdefghijklmnopqrstuvwxy"}
+    second_inner = PerformanceSecondInnerDataTest(**fields)
+    inner = PerformanceInnerDataTest(second_inner, **fields)
+
+    return PerformanceDataTest(inner, **fields)
+
+
+def _get_large_list() -> list:
+    return [
+        {"id": i, "name": f"item {i}", "password": "secret", "tags": [i]}
+        for i in range(1000)
+    ]
+
+
+def _get_record(payload: object, exc_info: Optional[tuple] = None):
+    record = logging.makeLogRecord(
+        {
+            "name": "benchmark",
+            "msg": "Benchmark log event",
+            "levelno": logging.INFO,
+            "levelname": "INFO",
+            "pathname": utils.__file__,
+            "filename": "utils.py",
+            "funcName": "benchmark",
+            "lineno": 1,
+            "exc_info": exc_info,
+        }
+    )
+    record.__dict__.update(
+        {
+            LOG_CODE: BENCHMARK_LOG_CODE,
+            PAYLOAD: payload,
+            SEVERITY: "INFO",
+        }
+    )
+
+    return record
+
+
+def _get_exc_info() -> tuple:
+    try:
+        {}["invalid_key"]
+    except KeyError:
+        return sys.exc_info()
+
+
+def _log_error() -> NoReturn:
+    try:
+        {}["invalid_key"]
+    except KeyError as e:
+        Logger.error(BENCHMARK_LOG_CODE, "Benchmark log event", e)
+
+
+def _log_without_code_line() -> NoReturn:
+    utils._set_code_line_policy(False)
+
+    try:
+        Logger.info(BENCHMARK_LOG_CODE, "Benchmark log event", 1)
+    finally:
+        utils._set_code_line_policy(True)
+
+
+def _calibrate() -> NoReturn:
+    json.dumps(_CALIBRATION_PAYLOAD)
+
+
+class _NoOpLogger(object):
+    """
+    This is a logger that does nothing, so the cost of a call of a log
+    method of a disabled level can be compared with the cost of a call.
+    """
+
+    @staticmethod
+    def debug(log_code: str, log_message: str, payload: object) -> NoReturn:
+        pass
+
+
+def get_benchmarks() -> dict:
+    """
+    The get_benchmarks function creates the benchmarks of the suite, each
+    one a function without arguments that runs the measured operation once.
+
+    :returns: A dict with the function of each benchmark, by its name.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    flat_dict = _get_flat_dict()
+    nested = _get_nested_dataclass()
+    large_list = _get_large_list()
+    nested_record = _get_record(nested)
+    error_record = _get_record("error", _get_exc_info())
+    json_formatter = TrafalgarLogFormatter(utils._get_format())
+    fast_formatter = TrafalgarLogFastFormatter()
+    handler = logging.StreamHandler(io.StringIO())
+    handler.setFormatter(fast_formatter)
+
+    def handle() -> NoReturn:
+        handler.handle(nested_record)
+        handler.stream.seek(0)
+        handler.stream.truncate()
+
+    return {
+        "logger.info.primitive": lambda: Logger.info(
+            BENCHMARK_LOG_CODE, "Benchmark log event", 1
+        ),
+        "logger.info.primitive.no_code_line": _log_without_code_line,
+        "logger.info.flat_dict": lambda: Logger.info(
+            BENCHMARK_LOG_CODE, "Benchmark log event", flat_dict
+        ),
+        "logger.info.nested_dataclass": lambda: Logger.info(
+            BENCHMARK_LOG_CODE, "Benchmark log event", nested
+        ),
+        "logger.info.large_list": lambda: Logger.info(
+            BENCHMARK_LOG_CODE, "Benchmark log event", large_list
+        ),
+        "logger.error.exception": _log_error,
+        "logger.debug.disabled": lambda: Logger.debug(
+            BENCHMARK_LOG_CODE, "Benchmark log event", nested
+        ),
+        "logger.debug.no_op": lambda: _NoOpLogger.debug(
+            BENCHMARK_LOG_CODE, "Benchmark log event", nested
+        ),
+        "stage.to_json.nested_dataclass": lambda: utils._to_json(nested),
+        "stage.to_json.large_list": lambda: utils._to_json(large_list),
+        "stage.dict_replace_value.flat_dict": lambda: (
+            utils._dict_replace_value(flat_dict)
+        ),
+        "stage.get_payload.large_list": lambda: utils.get_payload(large_list),
+        "stage.find_caller": lambda: logger_module._logger.findCaller(
+            False, 3
+        ),
+        "stage.get_caller": lambda: utils._get_caller(2),
+        "stage.get_code_line": lambda: utils._get_code_line(nested_record),
+        "stage.json_formatter": lambda: json_formatter.format(nested_record),
+        "stage.fast_formatter": lambda: fast_formatter.format(nested_record),
+        "stage.fast_formatter.exception": lambda: fast_formatter.format(
+            error_record
+        ),
+        "stage.stream_handler": handle,
+    }
+
+
+@contextmanager
+def _quiet_logger() -> Iterator[NoReturn]:
+    """
+    The _quiet_logger function is a context manager that makes the logger of
+    Trafalgar Log write to os.devnull, with its own formatter, and log only
+    INFO and above, so the log events of the benchmarks are formatted as
+    usual but not written to stderr, and DEBUG is disabled.
+
+    :returns: Nothing.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    logger = logger_module._logger
+    handlers, level = logger.handlers, logger.level
+
+    with open(os.devnull, "w") as devnull:
+        handler = logging.StreamHandler(devnull)
+        handler.setFormatter(utils._get_formatter())
+        logger.handlers = [handler]
+        Logger.set_level(logging.INFO)
+
+        try:
+            yield
+        finally:
+            logger.handlers = handlers
+            Logger.set_level(level)
+
+
+def _measure(function: Callable, quick: bool) -> dict:
+    """
+    The _measure function times a benchmark: the number of calls of each
+    repetition is chosen by timeit so a repetition takes at least
+    MINIMUM_TIME seconds (QUICK_NUMBER calls on quick runs).
+
+    :param function: Callable: The benchmark.
+    :param quick: bool: True to run each benchmark only a few times.
+    :returns: A dict with the best and the median time per call, in
+            seconds, and the number of calls of each repetition.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    timer = timeit.Timer(function)
+
+    if quick:
+        number = QUICK_NUMBER
+    else:
+        number, elapsed = timer.autorange()
+        number = max(number, int(number * MINIMUM_TIME / elapsed))
+
+    repeat = 1 if quick else REPEAT
+    times = [
+        elapsed / number
+        for elapsed in timer.repeat(repeat=repeat, number=number)
+    ]
+
+    return {
+        "best": min(times),
+        "median": statistics.median(times),
+        "number": number,
+    }
+
+
+def run_benchmarks(name_filter: str = "", quick: bool = False) -> dict:
+    """
+    The run_benchmarks function runs the benchmarks whose names contain the
+    filter and returns their results, with the time of each one relative to
+    the calibration workload, which is measured before and after them.
+
+    :param name_filter: str: A part of the names of the benchmarks to run.
+    :param quick: bool: True to run each benchmark only a few times, e.g.:
+            to check that the suite works.
+    :returns: A dict with the environment and the results.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    calibration = _measure(_calibrate, quick)["best"]
+    results = {}
+
+    with _quiet_logger():
+        for name, function in get_benchmarks().items():
+            if name_filter in name:
+                results[name] = _measure(function, quick)
+
+    calibration = min(calibration, _measure(_calibrate, quick)["best"])
+
+    for result in results.values():
+        result["relative"] = result["best"] / calibration
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        CALIBRATION: calibration,
+        "benchmarks": results,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> dict:
+    """
+    The compare function compares the relative times of the results with
+    the ones of the baseline. Benchmarks missing on either are ignored.
+
+    :param results: dict: The results of run_benchmarks.
+    :param baseline: dict: The results stored as the baseline.
+    :param tolerance: float: The accepted slowdown, e.g.: 0.3 for 30%.
+    :returns: A dict with the ratio of the relative time to the baseline of
+            each benchmark slower than the tolerance.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    regressions = {}
+
+    for name, result in results["benchmarks"].items():
+        expected = baseline["benchmarks"].get(name)
+
+        if expected is None:
+            continue
+
+        ratio = result["relative"] / expected["relative"]
+
+        if ratio > 1 + tolerance:
+            regressions[name] = ratio
+
+    return regressions
+
+
+def measure_import_time(module: str = IMPORTED_MODULE) -> dict:
+    """
+    The measure_import_time function imports a module on a new interpreter,
+    with the environment variables of the current one, and parses the
+    report of python -X importtime.
+
+    :param module: str: The module to import.
+    :returns: A dict with the cumulative import time of each imported
+            module, in microseconds, by its name.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    import_times = {}
+
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+
+        _, cumulative, name = line.split("|")
+
+        if cumulative.strip().isdigit():
+            import_times[name.strip()] = int(cumulative)
+
+    return import_times
+
+
+def measure_file_throughput(
+    number: int = FILE_EVENTS, max_bytes: int = FILE_MAX_BYTES
+) -> dict:
+    """
+    The measure_file_throughput function writes the same log event number
+    times, on a temporary directory, through:
+    - stderr: a StreamHandler on a file, as the default handler writes
+      when stderr is redirected to a file (python app.py 2> app.log);
+    - file: the TrafalgarRotatingFileHandler without rotation;
+    - file.rotating: the TrafalgarRotatingFileHandler rotating the file
+      every max_bytes bytes, with its segments compressed by gzip.
+    The time of each handler does not include closing it, which waits for
+    the compression of the last segments on the background thread.
+
+    :param number: int: The number of log events written by each handler.
+    :param max_bytes: int: The size that makes the file be rotated.
+    :returns: A dict with the seconds, the log events per second and the
+            megabytes per second of each handler, by its name, and the
+            number of segments of the rotated file.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    record = _get_record(_get_flat_dict())
+    formatter = utils._get_formatter()
+    size = len((formatter.format(record) + "\n").encode("utf-8")) * number
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        stderr = open(os.path.join(directory, "stderr.log"), "w")
+        rotating_path = os.path.join(directory, "rotating.log")
+        handlers = {
+            "stderr": logging.StreamHandler(stderr),
+            "file": TrafalgarRotatingFileHandler(
+                os.path.join(directory, "file.log")
+            ),
+            "file.rotating": TrafalgarRotatingFileHandler(
+                rotating_path, max_bytes=max_bytes, backup_count=0
+            ),
+        }
+
+        for name, handler in handlers.items():
+            handler.setFormatter(formatter)
+            start = time.perf_counter()
+
+            for _ in range(number):
+                handler.handle(record)
+
+            elapsed = time.perf_counter() - start
+            handler.close()
+            results[name] = {
+                "seconds": elapsed,
+                "events_per_second": number / elapsed,
+                "megabytes_per_second": size / elapsed / 1024 / 1024,
+            }
+
+        stderr.close()
+        results["file.rotating"]["segments"] = len(
+            [
+                entry
+                for entry in os.listdir(directory)
+                if entry.startswith("rotating.log.")
+                and entry.endswith(".gz")
+            ]
+        )
+
+    return results
+
+
+def _print_results(results: dict, baseline: Optional[dict]) -> NoReturn:
+    for name, result in results["benchmarks"].items():
+        line = (
+            f"{name:<40} {result['best'] * 1e6:12.2f} us "
+            f"{result['relative']:10.2f}x"
+        )
+
+        if baseline and name in baseline["benchmarks"]:
+            expected = baseline["benchmarks"][name]["relative"]
+            line += f" {(result['relative'] / expected - 1) * 100:+8.1f}%"
+
+        print(line)
+
+
+def _write(results: dict, path: str) -> NoReturn:
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def main(arguments: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", help="Write the results to this file.")
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Compare the results with the baseline.",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store the results as the new baseline.",
+    )
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--filter", default="", dest="name_filter")
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument(
+        "--import-time",
+        action="store_true",
+        help=f"Only measure the import time of {IMPORTED_MODULE}.",
+    )
+    parser.add_argument(
+        "--file-throughput",
+        action="store_true",
+        help="Only measure the throughput of the file handler.",
+    )
+    arguments = parser.parse_args(arguments)
+
+    if arguments.import_time:
+        import_times = measure_import_time()
+
+        for name, cumulative in sorted(
+            import_times.items(), key=lambda item: item[1], reverse=True
+        )[:20]:
+            print(f"{name:<40} {cumulative / 1000:12.2f} ms")
+
+        return 0
+
+    if arguments.file_throughput:
+        for name, result in measure_file_throughput().items():
+            print(
+                f"{name:<40} {result['events_per_second']:12.0f} events/s "
+                f"{result['megabytes_per_second']:8.1f} MB/s"
+            )
+
+        return 0
+
+    results = run_benchmarks(arguments.name_filter, arguments.quick)
+    baseline = None
+
+    if arguments.compare:
+        with open(arguments.baseline) as file:
+            baseline = json.load(file)
+
+    _print_results(results, baseline)
+
+    if arguments.output:
+        _write(results, arguments.output)
+    if arguments.save_baseline:
+        _write(results, arguments.baseline)
+
+    if baseline:
+        regressions = compare(results, baseline, arguments.tolerance)
+
+        for name, ratio in regressions.items():
+            print(f"Regression: {name} is {(ratio - 1) * 100:.1f}% slower.")
+
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,38 @@
 import cProfile
+import io
+import json
+import logging
+import os
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime
 
 import pytest
 
+from tests.performance import benchmarks
 from tests.performance.models import (
     PerformanceSecondInnerDataTest,
     PerformanceInnerDataTest,
     PerformanceDataTest,
 )
+from trafalgar_log.core.encoders import get_json_backend, STDLIB
+from trafalgar_log.core.handlers import TrafalgarBufferedHandler
+from trafalgar_log.core.limiter import get_limits
+from trafalgar_log.core.shambles import compile_shambles
+from trafalgar_log.core.stats import STATS
+from trafalgar_log.core import logger as logger_module, utils
 from trafalgar_log.core.logger import Logger
+from trafalgar_log.core.utils import (
+    get_payload,
+    FIELDS_TO_SHAMBLE,
+    LOG_CODE as LOG_CODE_FIELD,
+    PAYLOAD,
+    SEVERITY,
+    TrafalgarLogFastFormatter,
+    TrafalgarLogFormatter,
+    _get_format,
+)
 
 lorem_ipsum = {
     "a": "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt ut labore et dolore magna aliqua. Nunc id cursus metus aliquam. Id aliquet lectus proin nibh. Nulla facilisi etiam dignissim diam quis enim lobortis. Praesent tristique magna sit amet purus. At augue eget arcu dictum varius. Eu consequat ac felis donec et odio pellentesque diam volutpat. At tellus at urna condimentum mattis pellentesque id nibh. Laoreet non curabitur gravida arcu ac. Sem et tortor consequat id porta nibh venenatis cras.",
@@ -44,6 +69,20 @@ TIMEOUT: int = 16
 NUMBER_OF_ITERATIONS = 1000
 
 
+class SyscallCounterFileIO(io.FileIO):
+    syscalls: int = 0
+
+    def write(self, data: bytes) -> int:
+        self.syscalls += 1
+        return super().write(data)
+
+
+def _get_devnull() -> tuple:
+    raw = SyscallCounterFileIO(os.devnull, "w")
+
+    return raw, io.TextIOWrapper(io.BufferedWriter(raw), encoding="utf-8")
+
+
 def _build_performance_second_inner_data_test() -> PerformanceSecondInnerDataTest:
     data = PerformanceSecondInnerDataTest(**lorem_ipsum)
     data.z = z
@@ -62,6 +101,48 @@ def _build_performance_data_test() -> PerformanceDataTest:
     return data
 
 
+def _round_trip_get_payload(payload: object) -> object:
+    """
+    The previous implementation of get_payload, which serialized the payload
+    to a string and parsed it back before shambling it in a second traversal.
+    It is kept here as the reference for output and speed.
+    """
+
+    def _is_primitive(obj: object) -> bool:
+        try:
+            iter(obj)
+            iterable = True
+        except TypeError:
+            iterable = False
+        return isinstance(obj, str) or (
+            not hasattr(obj, "__dict__") and not iterable
+        )
+
+    def _dict_replace_value(value: dict) -> dict:
+        new_value = {}
+        for key, item in value.items():
+            if isinstance(item, dict):
+                item = _dict_replace_value(item)
+            elif isinstance(item, list):
+                item = ["*" for _ in item]
+            elif key.lower() in FIELDS_TO_SHAMBLE and _is_primitive(item):
+                item = "*"
+            new_value[key] = item
+        return new_value
+
+    payload = json.loads(
+        json.dumps(
+            payload,
+            skipkeys=True,
+            default=lambda o: o.__dict__ if hasattr(o, "__dict__") else str(o),
+        )
+    )
+
+    if isinstance(payload, dict):
+        return _dict_replace_value(payload)
+    return payload
+
+
 @pytest.mark.timeout(TIMEOUT)
 def test_performance():
     i: int = 0
@@ -90,6 +171,431 @@ def test_performance_exception():
         i += 1
 
 
+@pytest.mark.timeout(TIMEOUT)
+def test_performance_get_payload():
+    a: PerformanceDataTest = _build_performance_data_test()
+
+    assert json.dumps(get_payload(a)) == json.dumps(_round_trip_get_payload(a))
+
+    single_pass = min(
+        timeit.repeat(lambda: get_payload(a), number=NUMBER_OF_ITERATIONS)
+    )
+    round_trip = min(
+        timeit.repeat(
+            lambda: _round_trip_get_payload(a), number=NUMBER_OF_ITERATIONS
+        )
+    )
+
+    print(f"get_payload: {single_pass:.4f}s, round trip: {round_trip:.4f}s")
+    assert single_pass < round_trip * 10
+
+
+@pytest.mark.timeout(TIMEOUT)
+def test_performance_formatters():
+    record = logging.makeLogRecord(
+        {
+            "msg": "Testing performance",
+            "levelno": logging.INFO,
+            "levelname": "INFO",
+            "pathname": __file__,
+            "filename": "test_performance.py",
+            "funcName": "test_performance_formatters",
+            "lineno": 1,
+            LOG_CODE_FIELD: LOG_CODE,
+            PAYLOAD: {"a": 1, "b": "testing", "c": [1, 2, 3]},
+            SEVERITY: "INFO",
+        }
+    )
+    formatter = TrafalgarLogFormatter(_get_format())
+    fast_formatter = TrafalgarLogFastFormatter()
+
+    assert fast_formatter.format(record) == formatter.format(record)
+
+    fast = min(
+        timeit.repeat(
+            lambda: fast_formatter.format(record), number=NUMBER_OF_ITERATIONS
+        )
+    )
+    default = min(
+        timeit.repeat(
+            lambda: formatter.format(record), number=NUMBER_OF_ITERATIONS
+        )
+    )
+
+    print(f"fast formatter: {fast:.4f}s, json formatter: {default:.4f}s")
+    assert fast < default * 10
+
+
+@pytest.mark.timeout(TIMEOUT)
+def test_performance_json_backends():
+    a: dict = get_payload(_build_performance_data_test())
+    backend = get_json_backend()
+    stdlib = get_json_backend(STDLIB)
+
+    assert backend.dumps(a) == stdlib.dumps(a)
+
+    if backend.name == STDLIB:
+        pytest.skip("No faster JSON backend is installed.")
+
+    fast = min(
+        timeit.repeat(lambda: backend.dumps(a), number=NUMBER_OF_ITERATIONS)
+    )
+    default = min(
+        timeit.repeat(lambda: stdlib.dumps(a), number=NUMBER_OF_ITERATIONS)
+    )
+
+    print(f"{backend.name}: {fast:.4f}s, {STDLIB}: {default:.4f}s")
+    assert fast < default * 10
+
+
+@pytest.mark.timeout(TIMEOUT)
+def test_performance_batch():
+    def log_each():
+        for i in range(NUMBER_OF_ITERATIONS):
+            Logger.info(LOG_CODE, f"Testing performance {i}", {"a": i})
+
+    def log_batch():
+        with Logger.batch() as batch:
+            for i in range(NUMBER_OF_ITERATIONS):
+                batch.info(LOG_CODE, f"Testing performance {i}", {"a": i})
+
+    each = min(timeit.repeat(log_each, number=1, repeat=3))
+    batch = min(timeit.repeat(log_batch, number=1, repeat=3))
+
+    print(f"batch: {batch:.4f}s, each: {each:.4f}s")
+    assert batch < each * 10
+
+
+@pytest.mark.timeout(TIMEOUT)
+def test_performance_buffered_handler():
+    record = logging.makeLogRecord(
+        {"msg": "Testing performance", "levelno": logging.INFO}
+    )
+    stream_raw, stream = _get_devnull()
+    buffered_raw, buffered_stream = _get_devnull()
+    stream_handler = logging.StreamHandler(stream)
+    buffered_handler = TrafalgarBufferedHandler(buffered_stream)
+
+    for handler in [stream_handler, buffered_handler]:
+        handler.setFormatter(TrafalgarLogFastFormatter())
+
+    stream_time = min(
+        timeit.repeat(
+            lambda: stream_handler.handle(record), number=NUMBER_OF_ITERATIONS
+        )
+    )
+    buffered_time = min(
+        timeit.repeat(
+            lambda: buffered_handler.handle(record),
+            number=NUMBER_OF_ITERATIONS,
+        )
+    )
+    buffered_handler.close()
+
+    print(
+        f"buffered handler: {buffered_time:.4f}s "
+        f"({buffered_raw.syscalls} writes), stream handler: "
+        f"{stream_time:.4f}s ({stream_raw.syscalls} writes)"
+    )
+    assert stream_raw.syscalls == 5 * NUMBER_OF_ITERATIONS
+    assert buffered_raw.syscalls < stream_raw.syscalls / 10
+
+
+@pytest.mark.timeout(TIMEOUT)
+def test_performance_shamble_matcher():
+    fields = [f"sensitive_field_{i}" for i in range(60)]
+    keys = [f"Field_{i}" for i in range(40)] + [
+        f"Sensitive_Field_{i}" for i in range(0, 60, 6)
+    ]
+    matcher = compile_shambles(fields)
+
+    def list_scan():
+        return [key.lower() in fields for key in keys]
+
+    def matcher_lookup():
+        return [matcher.is_shambled(key) for key in keys]
+
+    assert matcher_lookup() == list_scan()
+
+    scan = min(timeit.repeat(list_scan, number=NUMBER_OF_ITERATIONS))
+    lookup = min(timeit.repeat(matcher_lookup, number=NUMBER_OF_ITERATIONS))
+
+    print(f"shamble matcher: {lookup:.4f}s, list scan: {scan:.4f}s")
+    assert lookup < scan * 10
+
+
+def _copy_get_payload(payload: object) -> object:
+    """
+    A conversion that copies every dictionary and list of the payload, as
+    get_payload did before it shared the subtrees without changes. It is
+    kept here as the reference for allocations.
+    """
+
+    if isinstance(payload, dict):
+        return {
+            key: "*" if key in FIELDS_TO_SHAMBLE else _copy_get_payload(value)
+            for key, value in payload.items()
+        }
+    if isinstance(payload, (list, tuple)):
+        return [_copy_get_payload(value) for value in payload]
+    return payload
+
+
+def _get_allocated(function, payload: object) -> int:
+    tracemalloc.start()
+    result = function(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return peak
+
+
+@pytest.mark.timeout(TIMEOUT)
+def test_performance_get_payload_allocations():
+    payload = {
+        f"record_{i}": {
+            "values": list(range(10)),
+            "attributes": {f"attribute_{j}": j for j in range(10)},
+        }
+        for i in range(500)
+    }
+    payload["record_0"]["attributes"]["password"] = "secret"
+
+    assert get_payload(payload) == _copy_get_payload(payload)
+
+    copy_on_write = _get_allocated(get_payload, payload)
+    copy = _get_allocated(_copy_get_payload, payload)
+
+    print(f"get_payload: {copy_on_write} bytes, copy: {copy} bytes")
+    assert copy_on_write < copy / 10
+
+
+@pytest.mark.timeout(TIMEOUT)
+def test_performance_payload_limits():
+    payload = {
+        "items": [{"id": i, "name": f"item {i}"} for i in range(50000)],
+        "text": "a" * 1000000,
+    }
+
+    limited = timeit.timeit(lambda: get_payload(payload), number=10)
+    size = len(json.dumps(get_payload(payload)))
+
+    try:
+        utils._set_payload_limits(sys.maxsize, 0, 0, 0)
+        unlimited = timeit.timeit(lambda: get_payload(payload), number=10)
+    finally:
+        utils._set_payload_limits()
+
+    print(f"limited: {limited}s, unlimited: {unlimited}s, size: {size}")
+    assert limited < unlimited / 10
+    assert size < 100000
+
+
+@pytest.mark.timeout(TIMEOUT)
+def test_performance_sampling():
+    payload = _build_performance_data_test()
+
+    def log():
+        Logger.info(LOG_CODE, "Testing performance", payload)
+
+    logged = min(timeit.repeat(log, number=NUMBER_OF_ITERATIONS, repeat=3))
+    limiter = logger_module._limiter
+    limits = limiter.limits
+
+    try:
+        limiter.limits = get_limits(f"{LOG_CODE}=0.01", "")
+        sampled = min(
+            timeit.repeat(log, number=NUMBER_OF_ITERATIONS, repeat=3)
+        )
+        suppressed = limiter.limits[LOG_CODE].suppressed
+    finally:
+        limiter.limits = limits
+
+    print(f"sampled: {sampled:.4f}s, logged: {logged:.4f}s")
+    assert suppressed == 3 * NUMBER_OF_ITERATIONS * 0.99
+    assert sampled < logged / 10
+
+
+@pytest.mark.timeout(TIMEOUT)
+def test_performance_date_time():
+    records = [
+        logging.makeLogRecord({"created": 1700000000 + i / 10000})
+        for i in range(10000)
+    ]
+
+    def format_cached():
+        for record in records:
+            utils._get_date_time(record)
+
+    def format_each():
+        for record in records:
+            datetime.fromtimestamp(record.created).isoformat(
+                sep=" ", timespec="milliseconds"
+            )
+
+    cached = min(timeit.repeat(format_cached, number=10, repeat=5))
+    each = min(timeit.repeat(format_each, number=10, repeat=5))
+
+    print(f"cached date_time: {cached:.4f}s, isoformat: {each:.4f}s")
+    assert cached < each * 10
+
+
+@pytest.mark.timeout(TIMEOUT)
+def test_performance_stacktrace_cache():
+    def fail(depth: int):
+        if depth:
+            fail(depth - 1)
+
+        raise ValueError("Testing performance")
+
+    try:
+        fail(20)
+    except ValueError:
+        exc_info = sys.exc_info()
+
+    formatter = logging.Formatter()
+    cached = min(
+        timeit.repeat(
+            lambda: utils._format_exception(exc_info),
+            number=NUMBER_OF_ITERATIONS,
+            repeat=3,
+        )
+    )
+    formatted = min(
+        timeit.repeat(
+            lambda: formatter.formatException(exc_info),
+            number=NUMBER_OF_ITERATIONS,
+            repeat=3,
+        )
+    )
+
+    print(f"cached stacktrace: {cached:.4f}s, formatted: {formatted:.4f}s")
+    assert utils._format_exception(exc_info) == formatter.formatException(
+        exc_info
+    )
+    assert cached < formatted / 5
+
+
+@pytest.mark.timeout(TIMEOUT)
+def test_performance_stats():
+    payload = _build_performance_data_test()
+
+    def log():
+        Logger.info(LOG_CODE, "Testing performance", payload)
+
+    disabled = min(timeit.repeat(log, number=NUMBER_OF_ITERATIONS, repeat=3))
+    STATS.enabled = True
+
+    try:
+        Logger.stats(reset=True)
+        enabled = min(
+            timeit.repeat(log, number=NUMBER_OF_ITERATIONS, repeat=3)
+        )
+        snapshot = Logger.stats(reset=True)
+    finally:
+        STATS.enabled = False
+
+    print(f"stats enabled: {enabled:.4f}s, disabled: {disabled:.4f}s")
+    assert snapshot["stages"]["log"]["count"] == 3 * NUMBER_OF_ITERATIONS
+    assert snapshot["levels"] == {"INFO": 3 * NUMBER_OF_ITERATIONS}
+    assert enabled < disabled * 10
+
+
+def test_performance_disabled_level():
+    def disabled():
+        Logger.debug(LOG_CODE, "Testing performance", None)
+
+    def no_op():
+        benchmarks._NoOpLogger.debug(LOG_CODE, "Testing performance", None)
+
+    Logger.set_level(logging.INFO)
+
+    try:
+        disabled_time = min(timeit.repeat(disabled, number=100000, repeat=5))
+        no_op_time = min(timeit.repeat(no_op, number=100000, repeat=5))
+    finally:
+        Logger.set_level(logging.DEBUG)
+
+    print(f"disabled: {disabled_time:.4f}s, no-op: {no_op_time:.4f}s")
+    assert disabled_time < no_op_time * 10
+
+
+def test_performance_caller():
+    def find_caller():
+        logger_module._logger.findCaller(False, 3)
+
+    def get_caller():
+        utils._get_caller(2)
+
+    find_caller_time = min(timeit.repeat(find_caller, number=10000, repeat=5))
+    get_caller_time = min(timeit.repeat(get_caller, number=10000, repeat=5))
+
+    print(
+        f"findCaller: {find_caller_time:.4f}s, "
+        f"_get_caller: {get_caller_time:.4f}s"
+    )
+    assert get_caller_time < find_caller_time * 10
+
+
+@pytest.mark.timeout(TIMEOUT)
+def test_performance_file_handler():
+    results = benchmarks.measure_file_throughput(
+        20 * NUMBER_OF_ITERATIONS, 256 * 1024
+    )
+
+    for name, result in results.items():
+        print(f"{name}: {result['events_per_second']:.0f} events/s")
+
+    assert results["file.rotating"]["segments"] > 1
+    assert results["file"]["seconds"] < results["stderr"]["seconds"] * 10
+    assert results["file.rotating"]["seconds"] < (
+        results["stderr"]["seconds"] * 10
+    )
+
+
+def test_performance_import_time():
+    import_times = benchmarks.measure_import_time()
+    imported = import_times[benchmarks.IMPORTED_MODULE]
+
+    print(f"import {benchmarks.IMPORTED_MODULE}: {imported / 1000:.2f}ms")
+    assert "dynaconf" not in import_times
+    assert "trafalgar_log.app" in import_times
+
+
+@pytest.mark.timeout(TIMEOUT)
+def test_benchmarks(tmp_path):
+    output = str(tmp_path / "results.json")
+
+    assert benchmarks.main(["--quick", "--output", output]) == 0
+
+    with open(output) as file:
+        results = json.load(file)
+
+    assert set(results["benchmarks"]) == set(benchmarks.get_benchmarks())
+
+    for result in results["benchmarks"].values():
+        assert 0 < result["best"] <= result["median"]
+        assert result["relative"] > 0
+
+    with open(benchmarks.BASELINE) as file:
+        assert set(json.load(file)["benchmarks"]) == set(results["benchmarks"])
+
+
+def test_benchmarks_compare():
+    baseline = {"benchmarks": {"a": {"relative": 1.0}, "b": {"relative": 2}}}
+    results = {
+        "benchmarks": {
+            "a": {"relative": 1.2},
+            "b": {"relative": 3.0},
+            "c": {"relative": 9.0},
+        }
+    }
+
+    assert benchmarks.compare(results, baseline, 0.3) == {"b": 1.5}
+    assert benchmarks.compare(results, baseline, 0.5) == {}
+
+
 if __name__ == "__main__":
     cProfile.run("test_performance()")
     cProfile.run("test_performance_exception()")
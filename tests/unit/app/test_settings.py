@@ -0,0 +1,217 @@
+import os
+import subprocess
+import sys
+from typing import NoReturn
+
+import pytest
+
+from trafalgar_log import app
+from trafalgar_log.app import (
+    RULES,
+    EnvSettings,
+    Rule,
+    TrafalgarSettings,
+    _MISSING,
+    _parse_value,
+    load_settings,
+)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("true", True),
+        ("false", False),
+        ("True", "True"),
+        ("10", 10),
+        ("1_000", 1000),
+        ("-2", -2),
+        ("0x10", 16),
+        (" 5 ", 5),
+        ("1.5", 1.5),
+        ("1e3", 1000.0),
+        ('"quoted"', "quoted"),
+        ("'single'", "single"),
+        ("007", "007"),
+        ("", ""),
+        ("Row loaded=100/60", "Row loaded=100/60"),
+        ("password, senha", "password, senha"),
+    ],
+)
+def test_parse_value(value: str, expected: object) -> NoReturn:
+    parsed = _parse_value(value)
+
+    assert parsed == expected
+    assert type(parsed) is type(expected)
+
+
+@pytest.mark.parametrize(
+    "value", ["[1, 2]", "{a=1}", "2024-01-01", "@int 3", '"a\\"b"']
+)
+def test_parse_value_needs_dynaconf(value: str) -> NoReturn:
+    assert _parse_value(value) is _MISSING
+
+
+def test_env_settings_are_case_insensitive() -> NoReturn:
+    settings = EnvSettings(APP_NAME="app")
+    settings["domain"] = "tests"
+
+    assert settings.get("app_name") == settings["APP_NAME"] == "app"
+    assert "DOMAIN" in settings and "Domain" in settings
+    assert settings.get("missing", 1) == 1
+
+    del settings["Domain"]
+
+    assert "domain" not in settings
+
+
+def test_rule() -> NoReturn:
+    settings = EnvSettings(QUEUE_SIZE=0, HAKI=1)
+    rules = [
+        Rule("APP_NAME", must_exist=True),
+        Rule("QUEUE_SIZE", default=10, is_type_of=int, gt=0),
+        Rule("HAKI", condition=lambda x: x.upper() == "INFO"),
+        Rule("ASYNC", default=False, is_type_of=bool),
+    ]
+
+    errors = [error for rule in rules for error in rule.validate(settings)]
+
+    assert errors == [
+        "APP_NAME is required in env main",
+        "QUEUE_SIZE must gt 0 but it is 0 in env main",
+        f"HAKI must condition {rules[2].kwargs['condition']} but it is 1 "
+        f"in env main",
+    ]
+    assert settings.get("ASYNC") is False
+
+
+def test_rules_validators() -> NoReturn:
+    validator = RULES[0].to_validator()
+
+    assert list(validator.names) == ["APP_NAME", "DOMAIN"]
+    assert validator.must_exist is True
+
+
+def test_load_settings(monkeypatch, tmp_path) -> NoReturn:
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TRA_LOG_QUEUE_SIZE", "5")
+    settings = load_settings()
+
+    assert isinstance(settings, EnvSettings)
+    assert settings.get("QUEUE_SIZE") == 5
+    assert settings.get("BUFFER_SIZE") == 65536
+    assert settings.get("HAKI") == "DEBUG"
+
+
+def test_load_settings_invalid(monkeypatch, tmp_path, capsys) -> NoReturn:
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TRA_LOG_QUEUE_SIZE", "0")
+    load_settings()
+
+    assert capsys.readouterr().out == (
+        "Exception initializing Trafalgar Log: "
+        "QUEUE_SIZE must gt 0 but it is 0 in env main\n"
+    )
+
+
+def test_load_settings_with_dynaconf(monkeypatch, tmp_path) -> NoReturn:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / app.DOTENV).write_text("TRA_LOG_QUEUE_SIZE=7\n")
+    # Dynaconf exports the variables of the .env file to os.environ
+    monkeypatch.setenv("TRA_LOG_QUEUE_SIZE", "")
+    monkeypatch.delenv("TRA_LOG_QUEUE_SIZE")
+    settings = load_settings()
+
+    assert not isinstance(settings, EnvSettings)
+    assert settings.get("QUEUE_SIZE") == 7
+    assert settings.get("DOMAIN") == "tests"
+
+
+def test_load_settings_with_dynaconf_syntax(
+    monkeypatch, tmp_path
+) -> NoReturn:
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TRA_LOG_EXTRA", "[1, 2]")
+
+    assert load_settings().get("EXTRA") == [1, 2]
+
+
+def test_settings_are_lazy(monkeypatch) -> NoReturn:
+    loads = []
+
+    def load() -> dict:
+        loads.append(1)
+        return EnvSettings(DOMAIN="tests")
+
+    monkeypatch.setattr(app, "load_settings", load)
+    settings = TrafalgarSettings()
+
+    assert loads == []
+    assert settings.get("domain") == settings["DOMAIN"] == "tests"
+    assert loads == [1]
+
+    settings.reload()
+
+    assert "DOMAIN" in settings
+    assert loads == [1, 1]
+
+
+def test_import_is_lazy() -> NoReturn:
+    code = (
+        "import sys\n"
+        "from trafalgar_log.core import logger\n"
+        "print('dynaconf' in sys.modules)\n"
+        "print(type(logger._logger).__name__)\n"
+        "logger.Logger.debug('Lazy', 'First log call', None)\n"
+        "print(type(logger._logger).__name__)\n"
+        "print(type(logger._limiter).__name__)\n"
+    )
+    process = subprocess.run(
+        [sys.executable, "-c", code],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+
+    assert process.stdout.splitlines() == [
+        "False",
+        "_Uninitialized",
+        "Logger",
+        "LogLimiter",
+    ]
+
+
+def test_import_does_not_load_settings(tmp_path) -> NoReturn:
+    code = (
+        "from trafalgar_log.app import SETTINGS\n"
+        "from trafalgar_log.core import logger\n"
+        "from trafalgar_log.core.stats import STATS\n"
+        "print(SETTINGS._settings is None, STATS.enabled)\n"
+    )
+    environment = {
+        variable: value
+        for variable, value in os.environ.items()
+        if not variable.startswith("TRA_LOG_")
+    }
+    environment["PYTHONPATH"] = os.getcwd()
+    process = subprocess.run(
+        [sys.executable, "-c", code],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        cwd=str(tmp_path),
+        env=environment,
+        check=True,
+    )
+
+    assert process.stdout == "True False\n"
+
+
+def test_peek(monkeypatch, tmp_path) -> NoReturn:
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TRA_LOG_COLLECTOR", "true")
+    monkeypatch.delenv("TRA_LOG_APP_NAME")
+    settings = TrafalgarSettings()
+
+    assert settings.peek("COLLECTOR") is True
+    assert settings.peek("BUFFERED", False) is False
+    assert settings._settings is None
@@ -0,0 +1,236 @@
+import json
+import logging
+import multiprocessing
+import os
+import subprocess
+import sys
+from typing import NoReturn
+
+import pytest
+
+from trafalgar_log.app import SETTINGS
+from trafalgar_log.core import collector as collector_module, utils
+from trafalgar_log.core.collector import (
+    TrafalgarCollector,
+    TrafalgarCollectorHandler,
+)
+from trafalgar_log.core.utils import TrafalgarLogFastFormatter
+
+PROCESSES: int = 4
+LOG_EVENTS: int = 50
+
+fork = pytest.mark.skipif(
+    not hasattr(os, "fork"), reason="The collector tests need os.fork."
+)
+
+
+def _get_handler(address: str) -> TrafalgarCollectorHandler:
+    handler = TrafalgarCollectorHandler(address)
+    handler.setFormatter(TrafalgarLogFastFormatter())
+
+    return handler
+
+
+def _get_record(message: str, payload: object) -> logging.LogRecord:
+    return logging.makeLogRecord(
+        {
+            "msg": message,
+            "levelno": logging.INFO,
+            "levelname": "INFO",
+            "log_code": "Collector",
+            "payload": payload,
+        }
+    )
+
+
+def _log(address: str, worker: int) -> NoReturn:
+    handler = _get_handler(address)
+
+    for i in range(LOG_EVENTS):
+        handler.handle(_get_record(f"{worker}-{i}", {"data": "x" * 100000}))
+
+    handler.close()
+
+
+def _read_lines(filename: str) -> list:
+    with open(filename) as file:
+        return [json.loads(line) for line in file.read().splitlines()]
+
+
+@fork
+def test_collector_writes_whole_lines(tmp_path) -> NoReturn:
+    filename = str(tmp_path / "collector.log")
+    collector = TrafalgarCollector(str(tmp_path / "c.sock"), filename)
+    collector.start()
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=_log, args=(collector.address, worker))
+        for worker in range(PROCESSES)
+    ]
+
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(20)
+
+    collector.stop()
+    lines = _read_lines(filename)
+
+    assert len(lines) == PROCESSES * LOG_EVENTS
+
+    for worker in range(PROCESSES):
+        assert [
+            line["log_message"]
+            for line in lines
+            if line["log_message"].startswith(f"{worker}-")
+        ] == [f"{worker}-{i}" for i in range(LOG_EVENTS)]
+
+
+@fork
+def test_collector_handler_after_fork(tmp_path) -> NoReturn:
+    filename = str(tmp_path / "collector.log")
+    collector = TrafalgarCollector(str(tmp_path / "c.sock"), filename)
+    collector.start()
+    handler = _get_handler(collector.address)
+    handler.handle(_get_record("parent", None))
+    connection = handler.connection
+
+    def log_on_child() -> NoReturn:
+        handler.after_fork()
+
+        assert handler.connection is None
+
+        handler.handle(_get_record("child", None))
+
+    process = multiprocessing.get_context("fork").Process(
+        target=log_on_child
+    )
+    process.start()
+    process.join(20)
+    handler.handle(_get_record("parent again", None))
+    handler.close()
+    collector.stop()
+
+    assert process.exitcode == 0
+    assert handler.connection is None
+    assert connection.closed
+    assert sorted(line["log_message"] for line in _read_lines(filename)) == [
+        "child",
+        "parent",
+        "parent again",
+    ]
+
+
+@fork
+def test_collector_is_started_once(tmp_path) -> NoReturn:
+    address = str(tmp_path / "c.sock")
+    collector = TrafalgarCollector(address, str(tmp_path / "c.log")).start()
+    other = TrafalgarCollector(address, str(tmp_path / "c.log")).start()
+
+    assert collector.process is not None
+    assert other.process is None
+
+    other.stop()
+
+    assert collector.process.is_alive()
+
+    collector.stop()
+
+    assert not os.path.exists(address)
+    assert not os.path.exists(f"{address}.lock")
+
+
+def test_collector_handler_fallback(tmp_path, capsys) -> NoReturn:
+    handler = _get_handler(str(tmp_path / "missing.sock"))
+    handler.handle(_get_record("fallback", None))
+
+    assert json.loads(capsys.readouterr().err)["log_message"] == "fallback"
+    assert handler.connection is None
+
+
+@fork
+def test_get_handler_collector(tmp_path, monkeypatch) -> NoReturn:
+    address = str(tmp_path / "c.sock")
+    monkeypatch.setitem(SETTINGS, "COLLECTOR", True)
+    monkeypatch.setitem(SETTINGS, "COLLECTOR_ADDRESS", address)
+    monkeypatch.setattr(collector_module, "_COLLECTOR", None)
+    handler = utils._get_handler()
+
+    try:
+        assert isinstance(handler, TrafalgarCollectorHandler)
+        assert handler.address == address
+        assert utils._get_handler().address == address
+        assert collector_module._COLLECTOR.process.is_alive()
+    finally:
+        handler.close()
+        collector_module._COLLECTOR.stop()
+
+
+def test_collector_is_not_started_without_fork(
+    tmp_path, monkeypatch
+) -> NoReturn:
+    monkeypatch.setattr(
+        collector_module.multiprocessing,
+        "get_all_start_methods",
+        lambda: ["spawn"],
+    )
+    collector = TrafalgarCollector(str(tmp_path / "c.sock"))
+
+    with pytest.warns(RuntimeWarning, match="fork start method"):
+        collector.start()
+
+    assert collector.process is None
+    assert not os.path.exists(collector.address)
+    assert not os.path.exists(f"{collector.address}.lock")
+
+
+@fork
+@pytest.mark.parametrize("address", [True, False])
+def test_collector_with_spawn(tmp_path, address: bool) -> NoReturn:
+    script = tmp_path / "spawned.py"
+    script.write_text(
+        "import multiprocessing\n"
+        "from trafalgar_log.core.logger import Logger\n"
+        "\n"
+        "def work(worker):\n"
+        "    Logger.info('Spawn', f'worker {worker}', None)\n"
+        "\n"
+        "if __name__ == '__main__':\n"
+        "    multiprocessing.set_start_method('spawn')\n"
+        "    processes = [\n"
+        "        multiprocessing.Process(target=work, args=(worker,))\n"
+        "        for worker in range(2)\n"
+        "    ]\n"
+        "    for process in processes:\n"
+        "        process.start()\n"
+        "    for process in processes:\n"
+        "        process.join()\n"
+        "    print([process.exitcode for process in processes])\n"
+        "    Logger.info('Spawn', 'main', None)\n"
+    )
+    environment = dict(
+        os.environ,
+        PYTHONPATH=os.getcwd(),
+        TRA_LOG_COLLECTOR="true",
+        TRA_LOG_COLLECTOR_ADDRESS=str(tmp_path / "c.sock") if address else "",
+    )
+    process = subprocess.run(
+        [sys.executable, str(script)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        cwd=str(tmp_path),
+        env=environment,
+        timeout=30,
+    )
+    messages = sorted(
+        json.loads(line)["log_message"]
+        for line in process.stderr.splitlines()
+        if line.startswith("{")
+    )
+
+    assert process.returncode == 0, process.stderr
+    assert process.stdout == "[0, 0]\n"
+    assert messages == ["main", "worker 0", "worker 1"]
+    # without an address, the children write to stderr themselves
+    assert process.stderr.count("RuntimeWarning") == (0 if address else 2)
@@ -0,0 +1,92 @@
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import NoReturn
+
+import pytest
+
+from trafalgar_log.core import encoders
+from trafalgar_log.core.encoders import (
+    get_json_backend,
+    AUTO,
+    ORJSON,
+    UJSON,
+    STDLIB,
+)
+
+INSTALLED_BACKENDS: list = [
+    name
+    for name, module in [(ORJSON, encoders.orjson), (UJSON, encoders.ujson)]
+    if module
+] + [STDLIB]
+
+
+@dataclass
+class EncodedDataClass(object):
+    a: int
+    b: str
+
+
+def _get_log_record() -> dict:
+    return {
+        "app": "unit-tests",
+        "date_time": "2022-09-18 19:25:43.749",
+        "log_message": "contraseña / senha: \"ação\"\n\t\x01",
+        "payload": {
+            "contraseña": "*",
+            "floats": [1.5, 0.1, -2.0],
+            "big": 2**70,
+            "empty": {},
+            "none": None,
+            "bool": True,
+        },
+        "timestamp": 1663539943749,
+    }
+
+
+def test_stdlib_backend() -> NoReturn:
+    log_record = _get_log_record()
+    encoded = get_json_backend(STDLIB).dumps(log_record)
+
+    assert encoded == json.dumps(
+        log_record, ensure_ascii=False, separators=(",", ":")
+    )
+    assert '"contraseña":"*"' in encoded
+    assert json.loads(encoded) == log_record
+
+
+@pytest.mark.parametrize("name", INSTALLED_BACKENDS)
+def test_backends_write_the_same_json(name: str) -> NoReturn:
+    backend = get_json_backend(name)
+    stdlib = get_json_backend(STDLIB)
+    log_record = _get_log_record()
+    unsupported = {
+        "date": datetime(2022, 9, 18, 19, 25, 43, 749000),
+        "dataclass": EncodedDataClass(1, "ñ"),
+        "bytes": b"bytes",
+        "object": object,
+    }
+
+    assert backend.name == name
+    assert backend.dumps(log_record) == stdlib.dumps(log_record)
+    assert backend.dumps(unsupported) == stdlib.dumps(unsupported)
+
+
+@pytest.mark.parametrize("name", INSTALLED_BACKENDS)
+def test_backends_write_null_for_nan(name: str) -> NoReturn:
+    payload = {"nan": float("nan"), "inf": [float("inf"), -float("inf")]}
+
+    assert (
+        get_json_backend(name).dumps(payload)
+        == '{"nan":null,"inf":[null,null]}'
+    )
+
+
+def test_auto_backend(monkeypatch) -> NoReturn:
+    assert get_json_backend(AUTO).name == INSTALLED_BACKENDS[0]
+
+    monkeypatch.setattr(encoders, "orjson", None)
+    monkeypatch.setattr(encoders, "ujson", None)
+
+    assert get_json_backend(AUTO).name == STDLIB
+    assert get_json_backend(ORJSON).name == STDLIB
@@ -0,0 +1,322 @@
+import gzip
+import io
+import logging
+import math
+import os
+import time
+from datetime import datetime
+from logging import Handler, LogRecord, INFO, ERROR
+from threading import Event
+from typing import NoReturn
+
+from trafalgar_log.app import SETTINGS
+from trafalgar_log.core import handlers as handlers_module, utils
+from trafalgar_log.core.handlers import (
+    TrafalgarBufferedHandler,
+    TrafalgarQueueHandler,
+    TrafalgarRotatingFileHandler,
+    BLOCK,
+    DAY,
+    DROP_NEWEST,
+    DROP_OLDEST,
+    GZIP,
+    HOUR,
+    MINUTE,
+    NONE,
+    ZSTD,
+)
+from trafalgar_log.core.utils import LOG_CODE, PAYLOAD
+
+
+class BlockingHandler(Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.started = Event()
+        self.unblock = Event()
+
+    def emit(self, record: LogRecord) -> NoReturn:
+        self.started.set()
+        self.unblock.wait(5)
+        self.records.append(record)
+
+
+def _get_record(message: str) -> LogRecord:
+    return logging.makeLogRecord({"msg": message, "levelno": INFO})
+
+
+def _fill_queue(overflow: str, messages: int) -> BlockingHandler:
+    handler = BlockingHandler()
+    queue_handler = TrafalgarQueueHandler(handler, 2, overflow)
+
+    queue_handler.handle(_get_record("first"))
+    handler.started.wait(5)
+
+    for i in range(messages):
+        queue_handler.handle(_get_record(str(i)))
+
+    handler.unblock.set()
+    queue_handler.close()
+
+    return handler
+
+
+def test_queue_handler_drop_newest() -> NoReturn:
+    handler = _fill_queue(DROP_NEWEST, 5)
+    messages = [record.getMessage() for record in handler.records]
+
+    assert messages[0] == "first"
+    assert handler.records[1].__dict__[LOG_CODE] == "Trafalgar Log"
+    assert handler.records[1].__dict__[PAYLOAD]["dropped"] == 3
+    assert messages[2:] == ["0", "1"]
+
+
+def test_queue_handler_drop_oldest() -> NoReturn:
+    handler = _fill_queue(DROP_OLDEST, 5)
+    messages = [record.getMessage() for record in handler.records]
+
+    assert messages[0] == "first"
+    assert handler.records[1].__dict__[PAYLOAD]["dropped"] == 3
+    assert messages[2:] == ["3", "4"]
+
+
+def test_queue_handler_block() -> NoReturn:
+    handler = BlockingHandler()
+    handler.unblock.set()
+    queue_handler = TrafalgarQueueHandler(handler, 2, BLOCK)
+
+    for i in range(100):
+        queue_handler.handle(_get_record(str(i)))
+
+    queue_handler.close()
+
+    assert [record.getMessage() for record in handler.records] == [
+        str(i) for i in range(100)
+    ]
+
+
+class CountingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, text: str) -> int:
+        self.writes += 1
+        return super().write(text)
+
+
+def _get_buffered_handler(
+    buffer_size: int = 1000, flush_interval: float = 60
+) -> tuple:
+    stream = CountingStream()
+    handler = TrafalgarBufferedHandler(stream, buffer_size, flush_interval)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+
+    return stream, handler
+
+
+def test_buffered_handler_buffer_size() -> NoReturn:
+    stream, handler = _get_buffered_handler(buffer_size=18)
+
+    for i in range(9):
+        handler.handle(_get_record(f"record {i}"))
+
+    assert stream.writes == 4
+    assert stream.getvalue().splitlines() == [f"record {i}" for i in range(8)]
+
+    handler.close()
+
+    assert stream.writes == 5
+    assert stream.getvalue().splitlines()[-1] == "record 8"
+
+
+def test_buffered_handler_flush_level() -> NoReturn:
+    stream, handler = _get_buffered_handler()
+
+    handler.handle(_get_record("info"))
+
+    assert stream.writes == 0
+
+    handler.handle(logging.makeLogRecord({"msg": "error", "levelno": ERROR}))
+
+    assert stream.writes == 1
+    assert stream.getvalue() == "info\nerror\n"
+    handler.close()
+
+
+def test_buffered_handler_flush_interval() -> NoReturn:
+    stream, handler = _get_buffered_handler(flush_interval=0.05)
+
+    handler.handle(_get_record("info"))
+
+    assert stream.writes == 0
+
+    deadline = time.monotonic() + 5
+
+    while not stream.writes and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert stream.getvalue() == "info\n"
+    handler.close()
+
+
+def test_buffered_handler_after_fork() -> NoReturn:
+    stream, handler = _get_buffered_handler()
+
+    handler.handle(_get_record("parent"))
+    handler.after_fork()
+    handler.handle(_get_record("child"))
+    handler.close()
+
+    assert stream.getvalue() == "child\n"
+
+
+def test_queue_handler_after_fork() -> NoReturn:
+    handler = BlockingHandler()
+    handler.unblock.set()
+    queue_handler = TrafalgarQueueHandler(handler, 2, BLOCK)
+    listener = queue_handler.listener
+    queue = queue_handler.queue
+
+    queue_handler.after_fork()
+    listener.stop()
+
+    assert queue_handler.queue is not queue
+    assert queue_handler.listener is not listener
+
+    queue_handler.handle(_get_record("child"))
+    queue_handler.close()
+
+    assert [record.msg for record in handler.records] == ["child"]
+
+
+def _get_file_handler(path: str, **kwargs) -> TrafalgarRotatingFileHandler:
+    handler = TrafalgarRotatingFileHandler(path, **kwargs)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+
+    return handler
+
+
+def _read_segment(segment: str) -> list:
+    with gzip.open(segment, "rt") as file:
+        return file.read().splitlines()
+
+
+def test_file_handler_max_bytes(tmp_path) -> NoReturn:
+    path = str(tmp_path / "app.log")
+    handler = _get_file_handler(path, max_bytes=20, backup_count=2)
+
+    for i in range(7):
+        handler.handle(_get_record(f"record {i}"))
+
+    handler.close()
+    segments = handlers_module._get_segments(path)
+
+    assert [os.path.splitext(segment)[1] for segment in segments] == [
+        ".gz",
+        ".gz",
+    ]
+    assert _read_segment(segments[0]) == ["record 2", "record 3"]
+    assert _read_segment(segments[1]) == ["record 4", "record 5"]
+
+    with open(path) as file:
+        assert file.read() == "record 6\n"
+
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        ["app.log", *map(os.path.basename, segments)]
+    )
+
+
+def test_file_handler_rotation(tmp_path) -> NoReturn:
+    path = str(tmp_path / "app.log")
+    handler = _get_file_handler(path, rotation=MINUTE, compression=NONE)
+
+    handler.handle(_get_record("first"))
+    started_at = handler.started_at
+
+    assert started_at <= time.time() < handler.rollover_at
+
+    handler.rollover_at = 0
+    handler.handle(_get_record("second"))
+    handler.close()
+    segments = handlers_module._get_segments(path)
+
+    assert handler.rollover_at > time.time()
+    assert segments == [
+        f"{path}."
+        f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(started_at))}"
+    ]
+
+    with open(segments[0]) as first, open(path) as second:
+        assert first.read() == "first\n"
+        assert second.read() == "second\n"
+
+
+def test_file_handler_existing_file(tmp_path) -> NoReturn:
+    path = str(tmp_path / "app.log")
+    last_written = datetime(2024, 1, 31, 10, 30).timestamp()
+
+    with open(path, "w") as file:
+        file.write("yesterday\n")
+
+    os.utime(path, (last_written, last_written))
+    handler = _get_file_handler(path, rotation=DAY)
+    handler.handle(_get_record("today"))
+    handler.close()
+
+    assert handlers_module._get_segments(path) == [
+        f"{path}.20240131-103000.gz"
+    ]
+    assert _read_segment(f"{path}.20240131-103000.gz") == ["yesterday"]
+
+
+def test_file_handler_empty_file_is_not_rotated(tmp_path) -> NoReturn:
+    path = str(tmp_path / "app.log")
+    handler = _get_file_handler(path, rotation=HOUR)
+
+    handler.handle(_get_record("first"))
+    handler.size = 0
+    handler.rollover()
+    handler.close()
+
+    assert handlers_module._get_segments(path) == []
+
+
+def test_get_rollover_at() -> NoReturn:
+    start = datetime(2024, 1, 31, 10, 30, 15).timestamp()
+
+    assert handlers_module._get_rollover_at(MINUTE, start) == (
+        datetime(2024, 1, 31, 10, 31).timestamp()
+    )
+    assert handlers_module._get_rollover_at(HOUR, start) == (
+        datetime(2024, 1, 31, 11).timestamp()
+    )
+    assert handlers_module._get_rollover_at(DAY, start) == (
+        datetime(2024, 2, 1).timestamp()
+    )
+    assert handlers_module._get_rollover_at(NONE, start) == math.inf
+
+
+def test_get_compression(monkeypatch) -> NoReturn:
+    monkeypatch.setattr(handlers_module, "zstandard", None)
+
+    assert handlers_module._get_compression("zstd") == GZIP
+    assert handlers_module._get_compression("none") == NONE
+
+    monkeypatch.setattr(handlers_module, "zstandard", object())
+
+    assert handlers_module._get_compression("zstd") == ZSTD
+
+
+def test_get_handler_file(tmp_path, monkeypatch) -> NoReturn:
+    path = str(tmp_path / "app.log")
+    monkeypatch.setitem(SETTINGS, "FILE", path)
+    monkeypatch.setitem(SETTINGS, "FILE_MAX_BYTES", 1024)
+    handler = utils._get_handler()
+    handler.close()
+
+    assert isinstance(handler, TrafalgarRotatingFileHandler)
+    assert handler.baseFilename == path
+    assert handler.max_bytes == 1024
+    assert handler.compression == GZIP
+    assert isinstance(handler.formatter, type(utils._get_formatter()))
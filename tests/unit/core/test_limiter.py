@@ -0,0 +1,339 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import NoReturn
+
+import pytest
+
+from trafalgar_log.app import (
+    RATE_LIMIT_RULE,
+    SAMPLING_RULE,
+    SETTINGS,
+    _are_valid_rules,
+)
+from trafalgar_log.core import limiter as limiter_module
+from trafalgar_log.core import logger as logger_module
+from trafalgar_log.core.limiter import (
+    LogLimiter,
+    TrafalgarDeduplicationFilter,
+    get_limits,
+    set_deduplication_filter,
+)
+from trafalgar_log.core.logger import Logger
+from trafalgar_log.core.utils import LOG_CODE, PAYLOAD, initialize_logger
+
+LOG_CODE_TEST: str = "Trafalgar Log Limiter Test"
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record: logging.LogRecord) -> NoReturn:
+        self.records.append(record)
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(limiter_module.time, "monotonic", clock)
+
+    return clock
+
+
+@pytest.fixture
+def handler() -> RecordingHandler:
+    handler = RecordingHandler()
+    logger_module._logger.addHandler(handler)
+    yield handler
+    logger_module._logger.removeHandler(handler)
+
+
+@pytest.fixture
+def deduplication(clock) -> TrafalgarDeduplicationFilter:
+    log_filter = TrafalgarDeduplicationFilter(logger_module._logger, 10)
+    logger_module._logger.addFilter(log_filter)
+    yield log_filter
+    logger_module._logger.removeFilter(log_filter)
+    log_filter.close()
+
+
+def _set_limiter(monkeypatch, sampling: str = "", rate_limits: str = ""):
+    limiter = LogLimiter(
+        logger_module._logger, get_limits(sampling, rate_limits), 60.0
+    )
+    monkeypatch.setattr(logger_module, "_limiter", limiter)
+
+    return limiter
+
+
+def _get_messages(handler: RecordingHandler) -> list:
+    return [
+        record.getMessage()
+        for record in handler.records
+        if getattr(record, LOG_CODE) == LOG_CODE_TEST
+    ]
+
+
+def test_sampling(clock, monkeypatch, handler) -> NoReturn:
+    _set_limiter(monkeypatch, sampling=f"{LOG_CODE_TEST}=0.25,Other=0")
+
+    for i in range(20):
+        Logger.info(LOG_CODE_TEST, str(i), None)
+        Logger.debug("Other", str(i), None)
+        Logger.info("Not limited", str(i), None)
+
+    assert _get_messages(handler) == ["0", "4", "8", "12", "16"]
+    assert sum(
+        getattr(record, LOG_CODE) == "Not limited"
+        for record in handler.records
+    ) == 20
+    assert all(getattr(r, LOG_CODE) != "Other" for r in handler.records)
+
+
+def test_rate_limits(clock, monkeypatch, handler) -> NoReturn:
+    _set_limiter(monkeypatch, rate_limits=f"{LOG_CODE_TEST}=2/10")
+
+    for i in range(5):
+        Logger.warn(LOG_CODE_TEST, f"first {i}", None)
+
+    clock.now += 5
+
+    for i in range(5):
+        Logger.warn(LOG_CODE_TEST, f"second {i}", None)
+
+    clock.now += 100
+
+    for i in range(5):
+        Logger.warn(LOG_CODE_TEST, f"third {i}", None)
+
+    assert getattr(handler.records[3], PAYLOAD) == {
+        "suppressed": {LOG_CODE_TEST: 7}
+    }
+    assert _get_messages(handler) == [
+        "first 0",
+        "first 1",
+        "second 0",
+        "third 0",
+        "third 1",
+    ]
+
+
+def test_suppressed_payload_is_not_created(
+    clock, monkeypatch, handler
+) -> NoReturn:
+    _set_limiter(monkeypatch, sampling=f"{LOG_CODE_TEST}=0")
+    payload = {"a": 1}
+
+    Logger.info(LOG_CODE_TEST, "Suppressed", payload)
+    Logger.info_many([(LOG_CODE_TEST, "Suppressed", payload)] * 3)
+
+    with Logger.batch() as batch:
+        batch.info(LOG_CODE_TEST, "Suppressed", payload)
+
+    assert handler.records == []
+
+
+def test_errors_are_not_limited(clock, monkeypatch, handler) -> NoReturn:
+    limiter = _set_limiter(monkeypatch, sampling=f"{LOG_CODE_TEST}=0")
+
+    Logger.error(LOG_CODE_TEST, "Error", None)
+    Logger.critical(LOG_CODE_TEST, "Critical", None)
+
+    assert _get_messages(handler) == ["Error", "Critical"]
+
+    limiter.limit_errors = True
+    Logger.error(LOG_CODE_TEST, "Error", None)
+    Logger.critical(LOG_CODE_TEST, "Critical", None)
+
+    assert len(handler.records) == 2
+
+
+def test_summary(clock, monkeypatch, handler) -> NoReturn:
+    limiter = _set_limiter(
+        monkeypatch, sampling=f"{LOG_CODE_TEST}=0.5,Other=0"
+    )
+
+    for i in range(10):
+        Logger.info(LOG_CODE_TEST, str(i), None)
+        Logger.info("Other", str(i), None)
+
+    assert len(handler.records) == 5
+
+    clock.now += 60
+    Logger.info("Other", "summary", None)
+    summary = handler.records[-1]
+
+    assert getattr(summary, PAYLOAD) == {
+        "suppressed": {LOG_CODE_TEST: 5, "Other": 11}
+    }
+    assert summary.levelno == logging.WARNING
+    assert summary.getMessage() == (
+        "16 log events were suppressed by sampling and rate limits."
+    )
+
+    limiter.flush()
+    Logger.info("Other", "not summarized yet", None)
+    limiter.flush()
+
+    assert getattr(handler.records[-1], PAYLOAD) == {
+        "suppressed": {"Other": 1}
+    }
+    assert len(handler.records) == 7
+
+
+def test_limit_rules_validation() -> NoReturn:
+    assert _are_valid_rules("", SAMPLING_RULE)
+    assert _are_valid_rules("Row loaded=0.1, Cache hit = 1", SAMPLING_RULE)
+    assert not _are_valid_rules("Row loaded=1.5", SAMPLING_RULE)
+    assert not _are_valid_rules("Row loaded", SAMPLING_RULE)
+    assert _are_valid_rules("Row loaded=100/60,Cache hit=10", RATE_LIMIT_RULE)
+    assert not _are_valid_rules("Row loaded=100/", RATE_LIMIT_RULE)
+    assert not _are_valid_rules("Row loaded=-1", RATE_LIMIT_RULE)
+    assert not _are_valid_rules("Row loaded=100/0", RATE_LIMIT_RULE)
+    assert not _are_valid_rules("Row loaded=100/0.0", RATE_LIMIT_RULE)
+    assert not _are_valid_rules("Row loaded=100/-1", RATE_LIMIT_RULE)
+    assert _are_valid_rules("Row loaded=100/.5", RATE_LIMIT_RULE)
+
+    with pytest.raises(ValueError):
+        get_limits("", "Row loaded=100/0")
+
+
+def test_failed_initialization_is_not_kept(monkeypatch) -> NoReturn:
+    monkeypatch.setattr(logger_module, "_initialized", {})
+    monkeypatch.setattr(
+        logger_module, "_logger", logger_module._Uninitialized("_logger")
+    )
+    monkeypatch.setattr(
+        logger_module, "_limiter", logger_module._Uninitialized("_limiter")
+    )
+    monkeypatch.setitem(SETTINGS, "RATE_LIMITS", "Row loaded=100/0")
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            Logger.info(LOG_CODE_TEST, "Not initialized", None)
+
+    assert logger_module._initialized == {}
+
+    monkeypatch.setitem(SETTINGS, "RATE_LIMITS", "")
+    Logger.info(LOG_CODE_TEST, "Initialized", None)
+
+    assert set(logger_module._initialized) == {"_logger", "_limiter"}
+
+
+def _fail(errors: list) -> NoReturn:
+    for error in errors:
+        try:
+            raise error("Dependency failure")
+        except error:
+            Logger.error(LOG_CODE_TEST, "Dependency failed", {"a": 1})
+
+
+def test_deduplication(clock, deduplication, handler) -> NoReturn:
+    _fail([ConnectionError] * 100 + [TimeoutError] * 3)
+
+    for _ in range(2):
+        Logger.info(LOG_CODE_TEST, "Dependency failed", None)
+
+    assert len(handler.records) == 3
+    assert handler.records[0].exc_info[0] is ConnectionError
+    assert handler.records[1].exc_info[0] is TimeoutError
+
+    for event in deduplication._events.values():
+        assert "args" not in event.fields
+        assert "exc_info" not in event.fields
+        assert event.fields["msg"] == "Dependency failed"
+
+    clock.now += 10
+    _fail([ConnectionError])
+    repeated = handler.records[3]
+
+    assert repeated.levelno == logging.ERROR
+    assert repeated.exc_info is None
+    assert repeated.lineno == handler.records[0].lineno
+    assert getattr(repeated, LOG_CODE) == LOG_CODE_TEST
+    assert getattr(repeated, PAYLOAD) == {"repeated": 99}
+    assert [record.getMessage() for record in handler.records[3:]] == [
+        "Dependency failed (repeated 99 times)",
+        "Dependency failed (repeated 2 times)",
+        "Dependency failed (repeated 1 times)",
+        "Dependency failed",
+    ]
+    assert handler.records[-1].exc_info[0] is ConnectionError
+
+    deduplication.flush()
+
+    assert len(handler.records) == 7
+
+
+def test_deduplication_threads(clock, deduplication, handler) -> NoReturn:
+    def fail_many(_) -> NoReturn:
+        _fail([ConnectionError] * 100)
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(fail_many, range(8)))
+
+    deduplication.flush()
+
+    assert len(handler.records) == 2
+    assert getattr(handler.records[1], PAYLOAD) == {"repeated": 799}
+
+
+def test_deduplication_burst_is_reported(handler) -> NoReturn:
+    log_filter = TrafalgarDeduplicationFilter(logger_module._logger, 0.05)
+    logger_module._logger.addFilter(log_filter)
+
+    try:
+        _fail([ConnectionError] * 10)
+        deadline = time.monotonic() + 5
+
+        while len(handler.records) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        logger_module._logger.removeFilter(log_filter)
+        log_filter.close()
+
+    assert len(handler.records) == 2
+    assert getattr(handler.records[1], PAYLOAD) == {"repeated": 9}
+
+
+def test_set_deduplication_filter(monkeypatch) -> NoReturn:
+    def get_filters() -> list:
+        return [
+            log_filter
+            for log_filter in logger.filters
+            if isinstance(log_filter, TrafalgarDeduplicationFilter)
+        ]
+
+    callbacks = []
+    fake_atexit = SimpleNamespace(
+        register=callbacks.append, unregister=callbacks.remove
+    )
+    monkeypatch.setattr(limiter_module, "atexit", fake_atexit)
+    monkeypatch.setitem(SETTINGS, "DEDUPLICATION_WINDOW", 0.5)
+    logger = initialize_logger()
+
+
+    try:
+        for _ in range(3):
+            set_deduplication_filter(logger)
+
+        assert len(get_filters()) == 1
+        assert get_filters()[0].window == 0.5
+        assert callbacks == [get_filters()[0].close]
+    finally:
+        monkeypatch.setitem(SETTINGS, "DEDUPLICATION_WINDOW", 0)
+        set_deduplication_filter(logger)
+
+    assert get_filters() == []
+    assert callbacks == []
@@ -1,7 +1,13 @@
+import asyncio
+import io
 import json
 import logging
 import re
+import sys
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import Context
 from datetime import datetime
 from logging import Logger, INFO, DEBUG, WARN, ERROR, CRITICAL
 from uuid import UUID, uuid4
@@ -9,6 +15,7 @@ from uuid import UUID, uuid4
 import pytest
 from _pytest.logging import LogCaptureFixture
 
+from trafalgar_log.app import SETTINGS
 from trafalgar_log.core.utils import (
     initialize_logger,
     APP,
@@ -189,6 +196,40 @@ def test_critical(caplog: LogCaptureFixture):
         )
 
 
+class ConversionCounterPayload(object):
+    conversions: int = 0
+
+    @property
+    def __dict__(self):
+        ConversionCounterPayload.conversions += 1
+        return {"a": 1}
+
+
+def test_payload_is_converted_only_when_formatted(caplog: LogCaptureFixture):
+    from trafalgar_log.core.logger import Logger
+
+    logger = logging.getLogger(SETTINGS.get("APP_NAME"))
+    _set_formatter(caplog)
+
+    ConversionCounterPayload.conversions = 0
+    payload = ConversionCounterPayload()
+    reject_all = logging.Filter("rejecting every log event")
+
+    logger.addFilter(reject_all)
+    Logger.info(LOG_CODE_TEST, "Filtered log event", payload)
+    logger.removeFilter(reject_all)
+
+    assert ConversionCounterPayload.conversions == 0
+    assert caplog.text == ""
+
+    Logger.info(LOG_CODE_TEST, "Formatted log event", payload)
+
+    assert ConversionCounterPayload.conversions > 0
+    _run_asserts(
+        caplog.text, INFO, LOG_CODE_TEST, "Formatted log event", {"a": 1}
+    )
+
+
 def test_set_correlation_id():
     from trafalgar_log.core.logger import Logger
 
@@ -196,7 +237,7 @@ def test_set_correlation_id():
 
     Logger.set_correlation_id(correlation_id)
 
-    assert Logger.correlation_id == correlation_id
+    assert Logger.get_correlation_id() == correlation_id
 
 
 def test_get_correlation_id():
@@ -216,15 +257,13 @@ def test_set_flow():
 
     Logger.set_flow(flow)
 
-    assert Logger.flow == flow
+    assert Logger.get_flow() == flow
 
 
 def test_get_flow():
     from trafalgar_log.core.logger import Logger
 
-    del Logger.flow
-
-    assert Logger.get_flow() == NOT_SET
+    assert Context().run(Logger.get_flow) == NOT_SET
 
     flow: str = "Unit testing flow"
 
@@ -240,18 +279,462 @@ def test_set_instance_id():
 
     Logger.set_instance_id(instance_id)
 
-    assert Logger.instance_id == instance_id
+    assert Logger.get_instance_id() == instance_id
 
 
 def test_get_instance_id():
     from trafalgar_log.core.logger import Logger
 
-    del Logger.instance_id
-
-    assert Logger.get_instance_id() == NOT_SET
+    assert Context().run(Logger.get_instance_id) == NOT_SET
 
     instance_id: str = "Unit testing instance_id"
 
     Logger.set_instance_id(instance_id)
 
     assert Logger.get_instance_id() == instance_id
+
+
+def test_optional_fields_per_thread():
+    from trafalgar_log.core.logger import Logger
+
+    def set_and_get(i: int) -> tuple:
+        correlation_id = str(uuid4())
+
+        Logger.set_correlation_id(correlation_id)
+        Logger.set_flow(f"flow {i}")
+
+        return correlation_id, Logger.get_correlation_id(), Logger.get_flow()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(set_and_get, range(16)))
+
+    for i, (correlation_id, current_correlation_id, flow) in enumerate(
+        results
+    ):
+        assert current_correlation_id == correlation_id
+        assert flow == f"flow {i}"
+
+
+def test_scope():
+    from trafalgar_log.core.logger import Logger
+
+    correlation_id: str = str(uuid4())
+    scoped_correlation_id: str = str(uuid4())
+
+    Logger.set_correlation_id(correlation_id)
+    Logger.set_flow("Unit testing flow")
+
+    with Logger.scope(correlation_id=scoped_correlation_id, flow="scoped"):
+        assert Logger.get_correlation_id() == scoped_correlation_id
+        assert Logger.get_flow() == "scoped"
+
+        with Logger.scope():
+            assert Logger.get_correlation_id() != scoped_correlation_id
+            assert Logger.get_flow() == "scoped"
+
+        assert Logger.get_correlation_id() == scoped_correlation_id
+
+    assert Logger.get_correlation_id() == correlation_id
+    assert Logger.get_flow() == "Unit testing flow"
+
+
+def test_scope_decorator():
+    from trafalgar_log.core.logger import Logger
+
+    @Logger.scope(flow="decorated")
+    def handle_request() -> tuple:
+        return Logger.get_correlation_id(), Logger.get_flow()
+
+    @Logger.scope(flow="decorated task")
+    async def handle_task() -> tuple:
+        await asyncio.sleep(0)
+        return Logger.get_correlation_id(), Logger.get_flow()
+
+    async def handle_tasks() -> list:
+        return await asyncio.gather(*[handle_task() for _ in range(4)])
+
+    first, second = handle_request(), handle_request()
+
+    assert first[0] != second[0]
+    assert first[1] == second[1] == "decorated"
+
+    results = asyncio.run(handle_tasks())
+
+    assert len({correlation_id for correlation_id, _ in results}) == 4
+    assert {flow for _, flow in results} == {"decorated task"}
+
+
+def test_scope_decorator_does_not_grow_the_context():
+    from trafalgar_log.core.logger import Logger
+
+    @Logger.scope(flow="decorated")
+    def handle_request() -> str:
+        with Logger.scope(instance_id="nested"):
+            return Logger.get_flow()
+
+    def handle_requests() -> list:
+        return [handle_request() for _ in range(1000)]
+
+    context = Context()
+
+    assert context.run(handle_requests) == ["decorated"] * 1000
+    assert len(context) <= 4
+
+
+def test_scope_shared_by_threads_and_tasks():
+    from trafalgar_log.core.logger import Logger
+
+    scope = Logger.scope(flow="shared")
+    entered = threading.Barrier(2)
+    first_exited = threading.Event()
+
+    def enter(first: bool) -> tuple:
+        Logger.set_flow("thread")
+
+        with scope:
+            entered.wait(5)
+            correlation_id = Logger.get_correlation_id()
+
+            if not first:
+                first_exited.wait(5)
+
+        if first:
+            first_exited.set()
+
+        return correlation_id, Logger.get_flow()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(executor.map(enter, [True, False]))
+
+    assert results[0][0] != results[1][0]
+    assert [flow for _, flow in results] == ["thread", "thread"]
+
+    async def handle_task(delay: float) -> tuple:
+        with scope:
+            await asyncio.sleep(delay)
+            flow = Logger.get_flow()
+
+        return flow, Logger.get_flow()
+
+    async def handle_tasks() -> list:
+        Logger.set_flow("task")
+        return await asyncio.gather(handle_task(0.02), handle_task(0))
+
+    assert asyncio.run(handle_tasks()) == [("shared", "task")] * 2
+
+
+class CountingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, text: str) -> int:
+        self.writes += 1
+        return super().write(text)
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record: logging.LogRecord):
+        self.records.append(record)
+
+
+def _add_handlers() -> tuple:
+    logger = logging.getLogger(SETTINGS.get("APP_NAME"))
+    stream = CountingStream()
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(logger.handlers[0].formatter)
+    recording_handler = RecordingHandler()
+    recording_handler.setLevel(WARN)
+    logger.addHandler(stream_handler)
+    logger.addHandler(recording_handler)
+
+    return stream, stream_handler, recording_handler
+
+
+def _remove_handlers(*handlers: logging.Handler):
+    logger = logging.getLogger(SETTINGS.get("APP_NAME"))
+
+    for handler in handlers:
+        logger.removeHandler(handler)
+
+
+def test_batch():
+    from trafalgar_log.core.logger import Logger
+
+    stream, stream_handler, recording_handler = _add_handlers()
+    scope = Logger.scope(flow=NOT_SET, instance_id=NOT_SET)
+
+    try:
+        with scope, Logger.batch() as batch:
+            for i in range(10):
+                batch.info(
+                    LOG_CODE_TEST, f"Batch log event {i}", {"mask": i}
+                )
+
+            batch.warn(LOG_CODE_TEST, "Batch warn log event", i)
+
+            assert stream.writes == 0
+    finally:
+        _remove_handlers(stream_handler, recording_handler)
+
+    logs = stream.getvalue().splitlines()
+
+    assert stream.writes == 1
+    assert len(logs) == 11
+    assert len(recording_handler.records) == 1
+
+    for i, log in enumerate(logs[:10]):
+        _run_asserts(
+            log, INFO, LOG_CODE_TEST, f"Batch log event {i}", {"mask": "*"}
+        )
+
+    assert len({json.loads(log)[CODE_LINE] for log in logs[:10]}) == 1
+    assert " - test_batch:" in json.loads(logs[0])[CODE_LINE]
+    assert len({json.loads(log)[CORRELATION_ID] for log in logs}) == 1
+    _run_asserts(logs[10], WARN, LOG_CODE_TEST, "Batch warn log event", 9)
+
+
+def test_batch_size():
+    from trafalgar_log.core.logger import Logger
+
+    stream, stream_handler, recording_handler = _add_handlers()
+
+    try:
+        with Logger.batch(size=4) as batch:
+            for i in range(10):
+                batch.debug(LOG_CODE_TEST, f"Batch log event {i}", i)
+    finally:
+        _remove_handlers(stream_handler, recording_handler)
+
+    assert stream.writes == 3
+    assert len(stream.getvalue().splitlines()) == 10
+
+
+def test_batch_exception():
+    from trafalgar_log.core.logger import Logger
+
+    stream, stream_handler, recording_handler = _add_handlers()
+    scope = Logger.scope(flow=NOT_SET, instance_id=NOT_SET)
+
+    try:
+        with scope, Logger.batch() as batch:
+            try:
+                {}["invalid_key"]
+            except KeyError:
+                batch.error(LOG_CODE_TEST, "Batch error log event", "")
+
+                captured_stacktrace = traceback.format_exc()
+    finally:
+        _remove_handlers(stream_handler, recording_handler)
+
+    log = stream.getvalue()
+
+    _run_asserts(log, ERROR, LOG_CODE_TEST, "Batch error log event", "")
+    assert "\n".join(json.loads(log).get(STACKTRACE)) == (
+        captured_stacktrace.strip()
+    )
+    assert len(recording_handler.records) == 1
+
+
+def test_info_many():
+    from trafalgar_log.core.logger import Logger
+
+    stream, stream_handler, recording_handler = _add_handlers()
+
+    try:
+        with Logger.scope(flow=NOT_SET, instance_id=NOT_SET):
+            Logger.info_many(
+                (LOG_CODE_TEST, f"Log event {i}", [i]) for i in range(5)
+            )
+    finally:
+        _remove_handlers(stream_handler, recording_handler)
+
+    logs = stream.getvalue().splitlines()
+
+    assert stream.writes == 1
+    assert recording_handler.records == []
+
+    for i, log in enumerate(logs):
+        _run_asserts(log, INFO, LOG_CODE_TEST, f"Log event {i}", [i])
+
+
+def test_reload_settings(monkeypatch):
+    from trafalgar_log.core import logger as logger_module, utils
+    from trafalgar_log.core.logger import Logger
+
+    monkeypatch.setenv("TRA_LOG_DOMAIN", "reloaded")
+    monkeypatch.setenv("TRA_LOG_SHAMBLES", "secret")
+    Logger.reload_settings()
+
+    try:
+        assert isinstance(logger_module._logger, logger_module._Uninitialized)
+
+        stream, stream_handler, recording_handler = _add_handlers()
+
+        try:
+            Logger.info(LOG_CODE_TEST, "Reloaded", {"secret": 1, "mask": 2})
+        finally:
+            _remove_handlers(stream_handler, recording_handler)
+
+        log_json = json.loads(stream.getvalue())
+
+        assert log_json.get(APP) == "unit-tests"
+        assert log_json.get(DOMAIN) == "reloaded"
+        assert log_json.get(PAYLOAD) == {"secret": "*", "mask": 2}
+    finally:
+        monkeypatch.undo()
+        Logger.reload_settings()
+
+    assert utils._get_domain() == "tests"
+    assert utils.FIELDS_TO_SHAMBLE[-1] == "mask"
+
+
+def test_level_cache():
+    from trafalgar_log.core import logger as logger_module
+    from trafalgar_log.core.logger import Logger
+
+    stream, stream_handler, recording_handler = _add_handlers()
+
+    try:
+        Logger.set_level("info")
+        Logger.debug(LOG_CODE_TEST, "Disabled", None)
+
+        assert logger_module._level == INFO
+        assert stream.getvalue() == ""
+
+        Logger.set_level(DEBUG)
+        Logger.debug(LOG_CODE_TEST, "Enabled", None)
+
+        assert logger_module._level == DEBUG
+        assert json.loads(stream.getvalue()).get(LOG_MESSAGE) == "Enabled"
+    finally:
+        Logger.set_level(DEBUG)
+        _remove_handlers(stream_handler, recording_handler)
+
+    assert logger_module._level == DEBUG
+
+
+def test_level_changed_outside_set_level():
+    import logging.config
+    from trafalgar_log.core import logger as logger_module
+    from trafalgar_log.core.logger import Logger
+
+    stream, stream_handler, recording_handler = _add_handlers()
+    name = logger_module._logger.name
+
+    try:
+        Logger.set_level(INFO)
+        logging.getLogger(name).setLevel(DEBUG)
+        Logger.debug(LOG_CODE_TEST, "Enabled by setLevel", None)
+
+        Logger.set_level(INFO)
+        logging.config.dictConfig(
+            {
+                "version": 1,
+                "incremental": True,
+                "loggers": {name: {"level": "DEBUG"}},
+            }
+        )
+
+        with Logger.batch() as batch:
+            batch.debug(LOG_CODE_TEST, "Enabled by dictConfig", None)
+
+        logging.getLogger(name).setLevel(WARN)
+        Logger.info(LOG_CODE_TEST, "Disabled by setLevel", None)
+    finally:
+        Logger.set_level(DEBUG)
+        _remove_handlers(stream_handler, recording_handler)
+
+    assert [
+        json.loads(line).get(LOG_MESSAGE)
+        for line in stream.getvalue().splitlines()
+    ] == ["Enabled by setLevel", "Enabled by dictConfig"]
+
+
+def test_level_cache_does_not_patch_logging():
+    from trafalgar_log.core import logger as logger_module
+    from trafalgar_log.core.logger import Logger
+
+    clear_cache = logging.Logger.manager._clear_cache
+
+    assert clear_cache.__func__ is logging.Manager._clear_cache
+
+    stream, stream_handler, recording_handler = _add_handlers()
+
+    try:
+        Logger.set_level(DEBUG)
+        logging.disable(WARN)
+        Logger.info(LOG_CODE_TEST, "Disabled", None)
+
+        assert logger_module._level == DEBUG
+        assert stream.getvalue() == ""
+
+        logging.disable(logging.NOTSET)
+        Logger.info(LOG_CODE_TEST, "Enabled", None)
+
+        assert json.loads(stream.getvalue()).get(LOG_MESSAGE) == "Enabled"
+    finally:
+        logging.disable(logging.NOTSET)
+        Logger.set_level(DEBUG)
+        _remove_handlers(stream_handler, recording_handler)
+
+
+def test_code_line_is_the_caller():
+    from trafalgar_log.core.logger import Logger
+
+    stream, stream_handler, recording_handler = _add_handlers()
+    lines = []
+
+    try:
+        lines.append(sys._getframe().f_lineno + 1)
+        Logger.info(LOG_CODE_TEST, "Info", None)
+
+        try:
+            {}["invalid_key"]
+        except KeyError:
+            lines.append(sys._getframe().f_lineno + 1)
+            Logger.error(LOG_CODE_TEST, "Error", None)
+
+        lines.append(sys._getframe().f_lineno + 1)
+        Logger.critical(LOG_CODE_TEST, "Critical", None)
+    finally:
+        _remove_handlers(stream_handler, recording_handler)
+
+    logs = stream.getvalue().splitlines()
+    code_lines = [json.loads(log).get(CODE_LINE) for log in logs]
+
+    assert [record.levelno for record in recording_handler.records] == [
+        ERROR,
+        CRITICAL,
+    ]
+    assert len(code_lines) == 3
+
+    for code_line, line in zip(code_lines, lines):
+        assert code_line.endswith(
+            f"test_logger.py - test_code_line_is_the_caller:{line}"
+        )
+
+
+def test_code_line_disabled(monkeypatch):
+    from trafalgar_log.core import utils
+    from trafalgar_log.core.logger import Logger
+
+    monkeypatch.setattr(utils, "_CODE_LINE", False)
+    stream, stream_handler, recording_handler = _add_handlers()
+
+    try:
+        Logger.info(LOG_CODE_TEST, "Info", None)
+
+        with Logger.batch() as batch:
+            batch.info(LOG_CODE_TEST, "Batch info", None)
+    finally:
+        _remove_handlers(stream_handler, recording_handler)
+
+    logs = [json.loads(log) for log in stream.getvalue().splitlines()]
+
+    assert [log[CODE_LINE] for log in logs] == [None, None]
+    assert [log[LOG_MESSAGE] for log in logs] == ["Info", "Batch info"]
@@ -0,0 +1,181 @@
+import io
+import json
+import logging
+from logging import StreamHandler
+from typing import NoReturn
+
+import pytest
+
+from trafalgar_log.app import SETTINGS
+from trafalgar_log.core import logger as logger_module
+from trafalgar_log.core import stats as stats_module
+from trafalgar_log.core.handlers import TrafalgarQueueHandler
+from trafalgar_log.core.limiter import LogLimiter, get_limits
+from trafalgar_log.core.logger import Logger
+from trafalgar_log.core.stats import (
+    DEDUPLICATED,
+    QUEUE,
+    STATS,
+    SUPPRESSED,
+    TrafalgarStats,
+    _Histogram,
+)
+from trafalgar_log.core.utils import LOG_CODE, PAYLOAD, _get_formatter
+
+LOG_CODE_TEST: str = "Trafalgar Log Stats Test"
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def stats(monkeypatch) -> TrafalgarStats:
+    monkeypatch.setattr(STATS, "enabled", True)
+    STATS.snapshot(reset=True)
+    yield STATS
+    STATS.snapshot(reset=True)
+
+
+@pytest.fixture
+def stream(monkeypatch) -> io.StringIO:
+    stream = io.StringIO()
+    handler = StreamHandler(stream)
+    handler.setFormatter(_get_formatter())
+    logger = logging.Logger(logger_module._logger.name, logging.DEBUG)
+    logger.propagate = False
+    logger.addHandler(handler)
+    monkeypatch.setattr(logger_module, "_logger", logger)
+
+    return stream
+
+
+def test_histogram() -> NoReturn:
+    histogram = _Histogram()
+
+    for duration in [100] * 90 + [10000] * 9 + [1000000]:
+        histogram.add(duration)
+
+    snapshot = histogram.snapshot()
+
+    assert snapshot["count"] == 100
+    assert snapshot["max_us"] == 1000.0
+    assert snapshot["mean_us"] == pytest.approx(10.99)
+    assert 0.1 <= snapshot["p50_us"] < 0.2
+    assert snapshot["p50_us"] == snapshot["p90_us"]
+    assert 10 <= snapshot["p99_us"] < 20
+    assert _Histogram().snapshot()["p99_us"] == 0
+
+
+def test_stats_are_disabled_by_default(stream) -> NoReturn:
+    before = Logger.stats()
+    Logger.info(LOG_CODE_TEST, "Not recorded", {"a": 1})
+    after = Logger.stats()
+
+    assert not SETTINGS.get("STATS")
+    assert after["enabled"] is False
+    assert after["stages"] == before["stages"]
+    assert after["bytes"] == before["bytes"] == 0
+
+
+def test_stats(stats, stream) -> NoReturn:
+    Logger.info(LOG_CODE_TEST, "Recorded ção", {"password": "secret"})
+    Logger.warn(LOG_CODE_TEST, "Recorded", None)
+    Logger.debug("Other", "Recorded", [1, 2])
+
+    with Logger.batch() as batch:
+        batch.info("Other", "Recorded", None)
+
+    snapshot = Logger.stats()
+    stages = snapshot["stages"]
+
+    assert snapshot["enabled"] is True
+    assert stages["log"]["count"] == 3
+    assert stages["payload"]["count"] == 4
+    assert stages["format"]["count"] == 4
+    assert stages["write"]["count"] == 1
+    assert stages["log"]["max_us"] >= stages["log"]["p50_us"] > 0
+    assert snapshot["levels"] == {"INFO": 2, "WARNING": 1, "DEBUG": 1}
+    assert snapshot["log_codes"] == {LOG_CODE_TEST: 2, "Other": 2}
+    assert snapshot["bytes"] == len(stream.getvalue().encode("utf-8")) - 4
+
+
+def test_stats_reset(stats, stream) -> NoReturn:
+    Logger.info(LOG_CODE_TEST, "Recorded", None)
+
+    assert Logger.stats(reset=True)["levels"] == {"INFO": 1}
+    assert Logger.stats()["levels"] == {}
+    assert Logger.stats()["stages"]["log"]["count"] == 0
+
+
+def test_stats_dropped(stats, stream, monkeypatch) -> NoReturn:
+    limiter = LogLimiter(
+        logger_module._logger, get_limits(f"{LOG_CODE_TEST}=0", ""), 60.0
+    )
+    monkeypatch.setattr(logger_module, "_limiter", limiter)
+    queue_handler = TrafalgarQueueHandler(
+        logging.NullHandler(), 1, "DROP_NEWEST"
+    )
+    queue_handler.listener.stop()
+    queue_handler.listener = None
+
+    for _ in range(3):
+        Logger.info(LOG_CODE_TEST, "Suppressed", None)
+        queue_handler.handle(logging.makeLogRecord({"msg": "Queued"}))
+
+    queue_handler.close()
+
+    assert Logger.stats()["dropped"] == {
+        QUEUE: 2,
+        SUPPRESSED: 3,
+        DEDUPLICATED: 0,
+    }
+
+
+def test_stats_report(stats, stream, monkeypatch) -> NoReturn:
+    clock = Clock()
+    monkeypatch.setattr(stats_module.time, "monotonic", clock)
+    monkeypatch.setattr(STATS, "interval", 60)
+    STATS.snapshot(reset=True)
+
+    Logger.info(LOG_CODE_TEST, "First", None)
+    clock.now += 60
+    Logger.info(LOG_CODE_TEST, "Second", None)
+    Logger.info(LOG_CODE_TEST, "Third", None)
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    assert len(lines) == 4
+    assert lines[2]["log_message"] == (
+        "Trafalgar Log stats of the last 60.0 seconds."
+    )
+    assert lines[2]["payload"]["levels"] == {"INFO": 2}
+    assert Logger.stats()["levels"] == {"INFO": 1}
+
+
+def test_stats_log_codes_are_bounded(monkeypatch) -> NoReturn:
+    monkeypatch.setattr(stats_module, "_MAX_LOG_CODES", 2)
+    stats = TrafalgarStats(True)
+
+    for log_code in ["a", "b", "c", "d", "a"]:
+        stats.count_event("INFO", log_code)
+
+    assert stats.snapshot()["log_codes"] == {
+        "a": 2,
+        "b": 1,
+        stats_module.OTHER_LOG_CODES: 2,
+    }
+
+
+def test_get_report_record() -> NoReturn:
+    record = stats_module._get_report_record(
+        logger_module._logger, {"seconds": 1.5}
+    )
+
+    assert record.levelno == logging.INFO
+    assert getattr(record, LOG_CODE) == "Trafalgar Log"
+    assert getattr(record, PAYLOAD) == {"seconds": 1.5}
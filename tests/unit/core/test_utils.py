@@ -1,15 +1,37 @@
+import json
 import logging
+import os
+import sys
+from contextvars import Context
 from dataclasses import dataclass
-from typing import NoReturn, Optional
+from datetime import datetime
+from typing import Callable, NoReturn, Optional
+from uuid import UUID
+
+import pytest
 
 from trafalgar_log.app import SETTINGS
+from trafalgar_log.core import utils
+from trafalgar_log.core.encoders import JSON_BACKENDS, get_json_backend
+from trafalgar_log.core.shambles import compile_shambles
 from trafalgar_log.core.utils import (
     initialize_logger,
     get_payload,
+    warm_up_code_lines,
+    TrafalgarLogFastFormatter,
     TrafalgarLogFormatter,
 )
 
 
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record: logging.LogRecord) -> NoReturn:
+        self.records.append(record)
+
+
 def test_initialize_logger() -> NoReturn:
     logger = initialize_logger()
 
@@ -18,6 +40,109 @@ def test_initialize_logger() -> NoReturn:
     assert isinstance(logger.handlers[0].formatter, TrafalgarLogFormatter)
 
 
+def test_fast_formatter() -> NoReturn:
+    from trafalgar_log.core.logger import Logger
+
+    logger = initialize_logger()
+    handler = RecordingHandler()
+    logger.addHandler(handler)
+
+    try:
+        Logger.info("Formatter", "Info log event", {"a": 1, "mask": "b"})
+        Logger.warn("Formatter", "Warn log event", "ação")
+
+        try:
+            {}["invalid_key"]
+        except KeyError:
+            Logger.error("Formatter", "Error log event", [1, 2])
+    finally:
+        logger.removeHandler(handler)
+
+    formatter = TrafalgarLogFormatter(utils._get_format())
+    fast_formatter = TrafalgarLogFastFormatter()
+
+    assert len(handler.records) == 3
+
+    for record in handler.records:
+        assert fast_formatter.format(record) == formatter.format(record)
+
+
+@pytest.mark.parametrize("backend", JSON_BACKENDS)
+@pytest.mark.parametrize(
+    "app, domain", [("unit-tests", "tests"), ('a "quoted" app', "domínio")]
+)
+def test_static_fields_are_spliced(
+    monkeypatch, backend: str, app: str, domain: str
+) -> NoReturn:
+    static_fields = {utils.APP: app, utils.DOMAIN: domain}
+    monkeypatch.setattr(utils, "_STATIC_FIELDS", static_fields)
+    json_backend = get_json_backend(backend)
+    record = logging.makeLogRecord(
+        {"msg": 'A "log_message"', utils.FLOW: ',"instance_id":'}
+    )
+    record.message = record.getMessage()
+    log_fields = utils._get_log_fields(record)
+    expected = json_backend.dumps(log_fields)
+
+    assert utils._dumps_log_fields(dict(log_fields), json_backend) == expected
+    assert utils._FRAGMENTS[json_backend.name].fields is utils._STATIC_FIELDS
+    assert json.loads(expected)[utils.DOMAIN] == domain
+
+    record.__dict__[utils.APP] = "other app"
+    log_fields = utils._get_log_fields(record)
+
+    assert utils._dumps_log_fields(dict(log_fields), json_backend) == (
+        json_backend.dumps(log_fields)
+    )
+
+
+@pytest.mark.parametrize("backend", JSON_BACKENDS)
+@pytest.mark.parametrize(
+    "flow, fields",
+    [
+        ({"a": 1, "instance_id": 2}, {}),
+        (["instance_id", {"instance_id": 2}], {}),
+        ("flow", {"correlation_id": {"instance_id": 2}}),
+        ("flow", {"instance_id": {"instance_id": 2}}),
+    ],
+)
+def test_static_fields_are_not_spliced_into_other_fields(
+    monkeypatch, backend: str, flow: object, fields: dict
+) -> NoReturn:
+    from trafalgar_log.core.logger import Logger
+
+    static_fields = {utils.APP: "unit-tests", utils.DOMAIN: "dom"}
+    monkeypatch.setattr(utils, "_STATIC_FIELDS", static_fields)
+    json_backend = get_json_backend(backend)
+
+    def get_log_fields() -> dict:
+        Logger.set_flow(flow)
+        record = logging.makeLogRecord({"msg": "A log message", **fields})
+        record.message = record.getMessage()
+
+        return utils._get_log_fields(record)
+
+    log_fields = Context().run(get_log_fields)
+    log_event = json.loads(
+        utils._dumps_log_fields(dict(log_fields), json_backend)
+    )
+
+    assert log_event == json.loads(json_backend.dumps(log_fields))
+    assert list(log_event) == list(log_fields)
+    assert log_event[utils.DOMAIN] == "dom"
+    assert log_event[utils.FLOW] == flow
+
+
+def test_get_formatter(monkeypatch) -> NoReturn:
+    monkeypatch.setitem(SETTINGS, "FORMATTER", "fast")
+
+    assert isinstance(utils._get_formatter(), TrafalgarLogFastFormatter)
+
+    monkeypatch.setitem(SETTINGS, "FORMATTER", "JSON")
+
+    assert isinstance(utils._get_formatter(), TrafalgarLogFormatter)
+
+
 def test_get_payload() -> NoReturn:
     int_payload = 1
     float_payload = 1.1
@@ -70,6 +195,325 @@ def test_get_shambled_payload() -> NoReturn:
     }
 
 
+def test_get_payload_json_conversion() -> NoReturn:
+    payload = {
+        2: "int key",
+        1.5: "float key",
+        True: "bool key",
+        None: "none key",
+        ("a",): "skipped key",
+        "tuple": ("a", 1),
+        "set": {1},
+        "object": TestComplexObjectWithoutDataClass(1, (2,), None),
+    }
+
+    assert get_payload(payload) == {
+        "2": "int key",
+        "1.5": "float key",
+        "true": "bool key",
+        "null": "none key",
+        "tuple": ["a", 1],
+        "set": "{1}",
+        "object": {"a": 1, "b": [2], "c": None},
+    }
+    assert get_payload([{"mask": 1}, ("a", {"b": 2})]) == [
+        {"mask": "*"},
+        ["a", {"b": 2}],
+    ]
+
+
+def test_get_shambled_lists() -> NoReturn:
+    payload = {
+        "mask": [1, "a", [2, None], {"b": 3, "mask": 4}],
+        "items": [{"mask": 5}, [{"mask": 6}], 7],
+    }
+
+    assert get_payload(payload) == {
+        "mask": ["*", "*", ["*", "*"], {"b": 3, "mask": "*"}],
+        "items": [{"mask": "*"}, [{"mask": "*"}], 7],
+    }
+
+
+def test_get_shambled_payload_rules(monkeypatch) -> NoReturn:
+    monkeypatch.setattr(
+        utils,
+        "SHAMBLES",
+        compile_shambles(
+            ["Senha", "*_token", "re:^card_\\d+$", "card.number", "a.*.b"]
+        ),
+    )
+    payload = {
+        "SENHA": 1,
+        "access_token": "a",
+        "tokens": "b",
+        "card_1": "c",
+        "Card_1": "d",
+        "card": {"number": 1, "cvv": 2},
+        "cards": [{"number": 3}],
+        "order": {"card": [{"number": 4, "holder": "e"}]},
+        "number": 5,
+        "a": {"x": {"b": 6, "c": 7}, "b": 8},
+    }
+
+    assert get_payload(payload) == {
+        "SENHA": "*",
+        "access_token": "*",
+        "tokens": "b",
+        "card_1": "*",
+        "Card_1": "d",
+        "card": {"number": "*", "cvv": 2},
+        "cards": [{"number": 3}],
+        "order": {"card": [{"number": "*", "holder": "e"}]},
+        "number": 5,
+        "a": {"x": {"b": "*", "c": 7}, "b": 8},
+    }
+
+
+def test_get_payload_structural_sharing() -> NoReturn:
+    payload = {
+        "a": {"b": [1, 2], "c": {"d": "e"}},
+        "f": {"g": [{"h": 1}], "mask": 1},
+        "i": [{"j": 1}, {"mask": 2}],
+    }
+    result = get_payload(payload)
+
+    assert result == {
+        "a": {"b": [1, 2], "c": {"d": "e"}},
+        "f": {"g": [{"h": 1}], "mask": "*"},
+        "i": [{"j": 1}, {"mask": "*"}],
+    }
+    assert payload["f"]["mask"] == 1
+    assert result["a"] is payload["a"]
+    assert result["f"] is not payload["f"]
+    assert result["f"]["g"] is payload["f"]["g"]
+    assert result["i"][0] is payload["i"][0]
+    assert get_payload(payload["a"]) is payload["a"]
+    assert get_payload(("a", 1)) == ["a", 1]
+
+
+def test_get_payload_circular_reference() -> NoReturn:
+    payload = TestComplexObjectWithoutDataClass(1, 2, None)
+    payload.c = payload
+    items = [1]
+    items.append({"items": items})
+    shared = {"a": 1}
+
+    assert get_payload(payload) == {
+        "a": 1,
+        "b": 2,
+        "c": "[circular reference]",
+    }
+    assert get_payload(items) == [1, {"items": "[circular reference]"}]
+    assert get_payload([shared, shared]) == [{"a": 1}, {"a": 1}]
+
+
+@pytest.fixture
+def payload_limits() -> Callable:
+    yield utils._set_payload_limits
+    utils._set_payload_limits()
+
+
+def test_get_payload_limits(payload_limits) -> NoReturn:
+    payload_limits(2, 3, 5, 100)
+    payload = {
+        "text": "abcdefgh",
+        "items": list(range(10)),
+        "nested": {"a": {"b": 1}, "mask": ["abcdefgh"] * 5},
+        "d": "e",
+        "f": "g",
+    }
+
+    assert get_payload(payload) == {
+        "text": "abcde...[3 more characters]",
+        "items": [0, 1, 2, "[7 more items]"],
+        "nested": {
+            "a": "[max depth reached]",
+            "mask": "[max depth reached]",
+        },
+        "...": "[2 more items]",
+    }
+    assert get_payload(tuple(range(5))) == [0, 1, 2, "[2 more items]"]
+    assert get_payload(TestComplexObjectWithoutDataClass(1, 2, {})) == {
+        "a": 1,
+        "b": 2,
+        "c": {},
+    }
+
+    payload_limits(32, 1000, 10000, 20)
+
+    assert get_payload([["abcdefghij"] * 3, "k", [1], 2]) == [
+        [
+            "abcdefghij",
+            "abc...[7 more characters]",
+            "...[10 more characters]",
+        ],
+        "...[1 more characters]",
+        "[max payload size reached]",
+        2,
+    ]
+
+
+def test_get_payload_limits_are_not_copied(payload_limits) -> NoReturn:
+    payload_limits(32, 3, 5, 100)
+    payload = {"a": [1, 2, 3], "b": "abcde"}
+
+    assert get_payload(payload) is payload
+
+
+def test_get_payload_slots() -> NoReturn:
+    uuid = UUID("5a0c5e0e-3c3c-4b3e-9d7b-0c8f7b0f6f1e")
+
+    assert get_payload(TestMaskSlotsDataClass("1", "2")) == {
+        "a": "1",
+        "mask": "*",
+    }
+    assert get_payload(TestSlotsObject(1, uuid)) == {
+        "a": 1,
+        "_TestSlotsObject__b": str(uuid),
+    }
+    assert get_payload({"mask": TestSlotsObject(1, 2)}) == {
+        "mask": {"a": 1, "_TestSlotsObject__b": 2}
+    }
+
+
+def test_serialization_plans_are_bounded(monkeypatch) -> NoReturn:
+    monkeypatch.setattr(utils, "_MAX_PLANS", 4)
+    utils._clear_plans()
+
+    for i in range(10):
+        dynamic_class = type(f"Dynamic{i}", (object,), {})
+        payload = dynamic_class()
+        payload.mask = i
+
+        assert get_payload(payload) == {"mask": "*"}
+        assert len(utils._PLANS) <= 4
+
+    assert dynamic_class in utils._PLANS
+    utils._clear_plans()
+
+
+def test_get_code_line() -> NoReturn:
+    record = logging.makeLogRecord(
+        {
+            "pathname": utils.__file__,
+            "filename": "utils.py",
+            "funcName": "test_get_code_line",
+            "lineno": 10,
+        }
+    )
+
+    assert utils._get_code_line(record) == (
+        "trafalgar_log/core/utils.py - test_get_code_line:10"
+    )
+    assert utils._get_code_line(record) is utils._get_code_line(record)
+
+
+@pytest.fixture
+def stacktrace_policy() -> Callable:
+    yield utils._set_stacktrace_policy
+    utils._set_stacktrace_policy()
+
+
+def _raise(depth: int, message: str) -> NoReturn:
+    if depth:
+        _raise(depth - 1, message)
+
+    raise ValueError(message)
+
+
+def _get_exc_info(depth: int, message: str) -> tuple:
+    try:
+        _raise(depth, message)
+    except ValueError:
+        return sys.exc_info()
+
+
+def test_format_exception(stacktrace_policy) -> NoReturn:
+    formatter = logging.Formatter()
+    exc_info = [_get_exc_info(3, f"message {i}") for i in range(2)]
+
+    for policy in [(0, False, True), (0, False, False)]:
+        stacktrace_policy(*policy)
+
+        for ei in [*exc_info, (None, None, None)]:
+            assert utils._format_exception(ei) == formatter.formatException(
+                ei
+            )
+
+    stacktrace_policy(0, False, True)
+    utils._format_exception(exc_info[0])
+
+    assert len(utils._STACKTRACES) == 1
+    assert utils._format_exception(exc_info[1]).endswith(
+        "ValueError: message 1"
+    )
+    assert len(utils._STACKTRACES) == 1
+
+    stacktrace_policy(2, True, True)
+    lines = utils._format_exception(exc_info[0]).split("\n")
+
+    assert lines[0] == "Traceback (most recent call last):"
+    assert len([line for line in lines if line.startswith("  File")]) == 2
+    assert lines[-1] == "ValueError: message 0"
+    assert utils._format_exception((None, None, None)) == ""
+
+
+@pytest.mark.parametrize("formatter", ["JSON", "FAST"])
+def test_skip_empty_stacktrace(
+    stacktrace_policy, monkeypatch, formatter
+) -> NoReturn:
+    monkeypatch.setitem(SETTINGS, "FORMATTER", formatter)
+    json_formatter = utils._get_formatter()
+    record = logging.makeLogRecord(
+        {"msg": "Error", "exc_info": (None, None, None)}
+    )
+
+    assert json.loads(json_formatter.format(record))[utils.STACKTRACE] == [
+        "NoneType: None"
+    ]
+
+    stacktrace_policy(0, True, True)
+    log_event = json.loads(json_formatter.format(record))
+
+    assert utils.STACKTRACE not in log_event
+    assert "exc_info" not in log_event
+
+
+def test_get_date_time() -> NoReturn:
+    def get_date_time(created: float) -> str:
+        record = logging.makeLogRecord({"created": created})
+
+        return utils._get_date_time(record)
+
+    for created in [
+        1700000000.0,
+        1700000000.0005,
+        1700000000.0015,
+        1700000000.9994999,
+        1700000000.9995,
+        1700000000.9999994,
+        1700000000.9999995,
+        1700000001.1234567,
+        1699999999.5,
+    ]:
+        assert get_date_time(created) == datetime.fromtimestamp(
+            created
+        ).isoformat(sep=" ", timespec="milliseconds")
+
+    assert utils._DATE_TIME_PREFIX[0] == 1699999999
+
+
+def test_warm_up_code_lines() -> NoReturn:
+    utils._get_relative_path.cache_clear()
+
+    assert warm_up_code_lines([utils, logging]) == 2
+    assert utils._get_relative_path.cache_info().currsize == 2
+
+    warm_up_code_lines([utils])
+
+    assert utils._get_relative_path.cache_info().hits == 1
+
+
 class TestComplexObjectWithoutDataClass(object):
     a: object
     b: object
@@ -106,3 +550,42 @@ class TestMaskComplexObjectWithDataClass(object):
     b: object
     c: object
     d: Optional[TestMaskComplexObjectWithoutDataClass] = None
+
+
+@dataclass(frozen=True)
+class TestMaskSlotsDataClass(object):
+    __slots__ = ("a", "mask")
+    a: object
+    mask: object
+
+
+class TestSlotsObject(object):
+    __slots__ = ("a", "__b")
+
+    def __init__(self, a: object, b: object):
+        self.a = a
+        self.__b = b
+
+
+def test_get_caller(monkeypatch) -> NoReturn:
+    def log() -> tuple:
+        return utils._get_caller(1)
+
+    monkeypatch.setattr(utils, "_MAX_CALLERS", 1)
+    utils._CALLERS.clear()
+    line = sys._getframe().f_lineno + 1
+    pathname, lineno, func_name = log()
+
+    assert pathname == log.__code__.co_filename
+    assert (lineno, func_name) == (line, "test_get_caller")
+    assert list(utils._CALLERS.values()) == [(pathname, func_name)]
+
+    utils._get_caller(0, sys._getframe().f_back)
+
+    assert len(utils._CALLERS) == 1
+    assert (pathname, func_name) not in utils._CALLERS.values()
+
+    monkeypatch.setattr(utils, "_CODE_LINE", False)
+
+    assert log() == utils._UNKNOWN_CALLER
+    assert utils._get_code_line(logging.makeLogRecord({})) is None
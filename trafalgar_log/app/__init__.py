@@ -1,7 +1,13 @@
 """
-This is the Dynaconf configuration.
+This is the configuration of Trafalgar Log.
 
-Trafalgar Log accept four environment variables:
+The settings are loaded on their first use. When there is no .env file and
+Dynaconf is not configured by its own environment variables, they are read
+straight from the TRA_LOG_ environment variables, without importing
+Dynaconf, which is slow to import; otherwise, Dynaconf loads them. Both
+follow the same RULES.
+
+Trafalgar Log accept these environment variables:
 - TRA_LOG_APP_NAME (mandatory): This is the environment variable that
   will be used as the "app" field in the log event.
 - TRA_LOG_DOMAIN (mandatory): This is the environment variable that
@@ -10,37 +16,519 @@ Trafalgar Log accept four environment variables:
   will be used to set the logging level for the application.
 - TRA_LOG_SHAMBLES (mandatory): This is the environment variable with the
   fields that should be shambled on the log event.
+- TRA_LOG_ASYNC (optional): When true, log events are put on a bounded
+  queue and formatted and written on a background thread.
+- TRA_LOG_QUEUE_SIZE (optional): The maximum number of log events on the
+  queue of the asynchronous mode.
+- TRA_LOG_QUEUE_OVERFLOW (optional): What to do when the queue of the
+  asynchronous mode is full: BLOCK, DROP_NEWEST or DROP_OLDEST.
+- TRA_LOG_BUFFERED (optional): When true, log events are kept on a memory
+  buffer and written together instead of one write per log event.
+- TRA_LOG_BUFFER_SIZE (optional): The number of characters on the buffer
+  that makes it be written.
+- TRA_LOG_FLUSH_INTERVAL (optional): The maximum number of seconds between
+  two writes of the buffer.
+- TRA_LOG_COLLECTOR (optional): When true, log events are sent to a single
+  collector process, which writes them, so the log events of the
+  processes of pre-fork servers are never interleaved. POSIX only, since
+  the collector process is forked.
+- TRA_LOG_COLLECTOR_ADDRESS (optional): The path of the socket of the
+  collector process.
+- TRA_LOG_FILE (optional): The path of the file the log events are
+  written to, instead of stderr.
+- TRA_LOG_FILE_MAX_BYTES (optional): The size of the file that makes it be
+  rotated; 0 means it is not rotated by size.
+- TRA_LOG_FILE_ROTATION (optional): When the file is rotated by time:
+  NONE, MINUTE, HOUR or DAY.
+- TRA_LOG_FILE_BACKUP_COUNT (optional): The number of rotated segments of
+  the file that are kept; 0 means all of them.
+- TRA_LOG_FILE_COMPRESSION (optional): How the rotated segments of the
+  file are compressed, on a background thread: NONE, GZIP or ZSTD.
+- TRA_LOG_FORMATTER (optional): The formatter of the log events: JSON,
+  based on python-json-logger, or FAST, which builds the log event
+  directly from its fields.
+- TRA_LOG_JSON_BACKEND (optional): The library that encodes the log events
+  to JSON: AUTO, ORJSON, UJSON or STDLIB.
+- TRA_LOG_SAMPLING (optional): The ratio of the log events of each
+  log_code that are logged, e.g.: "Row loaded=0.1,Cache hit=0.01".
+- TRA_LOG_RATE_LIMITS (optional): The maximum number of log events of each
+  log_code per period of seconds, e.g.: "Row loaded=100/60"; the period
+  must be positive.
+- TRA_LOG_LIMITS_SUMMARY_INTERVAL (optional): The minimum number of
+  seconds between two log events reporting the suppressed log events.
+- TRA_LOG_LIMIT_ERRORS (optional): When true, sampling and rate limits are
+  also applied to ERROR and CRITICAL log events.
+- TRA_LOG_DEDUPLICATION_WINDOW (optional): The number of seconds during
+  which the repetitions of a log event are suppressed and counted; 0
+  disables the deduplication.
+- TRA_LOG_STACKTRACE_FRAMES (optional): The number of innermost frames of
+  the stacktraces of the log events; 0 means all of them.
+- TRA_LOG_SKIP_EMPTY_STACKTRACE (optional): When true, ERROR and CRITICAL
+  log events logged without an exception being handled have no
+  stacktrace.
+- TRA_LOG_CACHE_STACKTRACES (optional): When true, the formatted frames of
+  the stacktraces are cached by the exception type and code location.
+- TRA_LOG_CODE_LINE (optional): When false, the caller of the log events
+  is not captured and their code_line is null.
+- TRA_LOG_STATS (optional): When true, Trafalgar Log records the latency
+  of the stages of its log events and counts them by level and log_code,
+  with the bytes written and the dropped log events (see Logger.stats).
+- TRA_LOG_STATS_INTERVAL (optional): The number of seconds between two log
+  events reporting the stats; 0 means they are never reported.
+- TRA_LOG_MAX_DEPTH (optional): The maximum number of nested containers
+  of the payload; 0 means no limit.
+- TRA_LOG_MAX_ITEMS (optional): The maximum number of items of each list
+  or dictionary of the payload; 0 means no limit.
+- TRA_LOG_MAX_STRING_LENGTH (optional): The maximum number of characters
+  of each string of the payload; 0 means no limit.
+- TRA_LOG_MAX_PAYLOAD_SIZE (optional): The approximate maximum number of
+  characters of the payload; 0 means no limit.
 """
 
 import logging
+import os
+import re
+import sys
 from logging import INFO, DEBUG, WARN, ERROR, CRITICAL
-
-from dynaconf import Dynaconf, Validator, ValidationError
+from threading import Lock
+from typing import Callable, NoReturn, Optional
 
 HAKI_LEVELS = [
     logging.getLevelName(level)
     for level in [INFO, DEBUG, WARN, ERROR, CRITICAL]
 ]
 DEFAULT_FIELDS_TO_SHAMBLE: list = ["password", "senha", "contraseña"]
-SETTINGS = Dynaconf(
-    envvar_prefix="TRA_LOG",
-    load_dotenv=True,
-    validators=[
-        Validator(
-            "APP_NAME",
-            "DOMAIN",
-            must_exist=True,
-        ),
-        Validator(
-            "HAKI",
-            default="INFO",
-            condition=lambda x: x.upper() in HAKI_LEVELS,
-        ),
-        Validator("SHAMBLES", default=""),
-    ],
+QUEUE_OVERFLOW_POLICIES = ["BLOCK", "DROP_NEWEST", "DROP_OLDEST"]
+FORMATTERS = ["JSON", "FAST"]
+JSON_BACKENDS = ["AUTO", "ORJSON", "UJSON", "STDLIB"]
+FILE_ROTATIONS = ["NONE", "MINUTE", "HOUR", "DAY"]
+FILE_COMPRESSIONS = ["NONE", "GZIP", "ZSTD"]
+SAMPLING_RULE = re.compile(r"[^=]+=\s*(0(\.\d*)?|1(\.0*)?|\.\d+)\s*")
+RATE_LIMIT_RULE = re.compile(
+    r"[^=]+=\s*\d+(\.\d*)?(/(?=[\d.]*[1-9])\d*\.?\d+)?\s*"
+)
+ENVVAR_PREFIX: str = "TRA_LOG"
+DOTENV: str = ".env"
+_MISSING: object = object()
+_INTEGER = re.compile(
+    r"[+-]?(0|[1-9](_?\d)*)|0x[\da-fA-F](_?[\da-fA-F])*"
+    r"|0o[0-7](_?[0-7])*|0b[01](_?[01])*"
 )
+_FLOAT = re.compile(
+    r"[+-]?((0|[1-9](_?\d)*)(\.\d(_?\d)*)?([eE][+-]?\d(_?\d)*)?|inf|nan)"
+)
+_QUOTED = re.compile(r"\"[^\"\\\\]*\"|'[^']*'")
+_DYNACONF_SYNTAX = re.compile(r"[@\[{]|\d{4}-\d{2}-\d{2}")
+
+
+class Rule(object):
+    """
+    This is the class of the rules of the settings. It takes the same
+    arguments of the Validator of Dynaconf, which it is converted to when
+    Dynaconf loads the settings; otherwise, it validates the settings read
+    from the environment variables itself, setting the default of the
+    missing ones.
+
+    :ivar names: The names of the settings of the rule.
+    :ivar kwargs: The conditions of the rule: must_exist, default,
+        is_type_of, gt, gte and condition.
+    """
+
+    def __init__(self, *names: str, **kwargs):
+        self.names = names
+        self.kwargs = kwargs
+
+    def validate(self, settings: dict) -> list:
+        """
+        The validate function checks the settings of the rule, in the same
+        order and with the same messages of Dynaconf.
+
+        :param settings: dict: The settings, which get the default of the
+                missing settings of the rule.
+        :returns: A list with the errors found.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        errors = []
+
+        for name in self.names:
+            if name not in settings and "default" in self.kwargs:
+                settings[name] = self.kwargs["default"]
+            if name not in settings:
+                if self.kwargs.get("must_exist"):
+                    errors.append(f"{name} is required in env main")
+                continue
+
+            value = settings[name]
+
+            for operation, check in _CHECKS.items():
+                if operation in self.kwargs and not _passes(
+                    check, value, self.kwargs[operation]
+                ):
+                    errors.append(
+                        f"{name} must {operation} {self.kwargs[operation]} "
+                        f"but it is {value} in env main"
+                    )
+                    break
+
+        return errors
+
+    def to_validator(self) -> "Validator":  # noqa: F821
+        """
+        The to_validator function converts the rule to a Dynaconf Validator.
+
+        :returns: The Validator.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        from dynaconf import Validator
+
+        return Validator(*self.names, **self.kwargs)
+
+
+class EnvSettings(dict):
+    """
+    This is the class of the settings read straight from the TRA_LOG_
+    environment variables. As on Dynaconf, the names of the settings are
+    case insensitive and the values are parsed as TOML scalars, e.g.:
+    "true" is a bool and "10" is an int.
+    """
+
+    def get(self, key: str, default: object = None) -> object:
+        return super(EnvSettings, self).get(key.upper(), default)
+
+    def __getitem__(self, key: str) -> object:
+        return super(EnvSettings, self).__getitem__(key.upper())
+
+    def __setitem__(self, key: str, value: object) -> NoReturn:
+        super(EnvSettings, self).__setitem__(key.upper(), value)
+
+    def __delitem__(self, key: str) -> NoReturn:
+        super(EnvSettings, self).__delitem__(key.upper())
+
+    def __contains__(self, key: object) -> bool:
+        return super(EnvSettings, self).__contains__(str(key).upper())
+
+
+class TrafalgarSettings(object):
+    """
+    This is the class of SETTINGS. The settings are only loaded, by
+    load_settings, on their first use; after that, each call is forwarded
+    to the loaded settings, which are an EnvSettings or a Dynaconf object.
+    The peek function reads a single setting without loading them, e.g.:
+    on import.
+    The reload function makes the next use load them again.
+    """
+
+    def __init__(self):
+        self._settings = None
+        self._lock = Lock()
+
+    def get(self, key: str, default: object = None) -> object:
+        return self._load().get(key, default)
+
+    def peek(self, key: str, default: object = None) -> object:
+        """
+        The peek function returns a setting without loading the settings,
+        if they were not loaded yet and can be read straight from the
+        TRA_LOG_ environment variables; neither are the settings validated
+        nor their defaults applied. Otherwise, it is the same as get.
+
+        :param key: str: The name of the setting.
+        :param default: object: The value returned if it is not set.
+        :returns: The value of the setting.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if self._settings is None and not _has_dotenv():
+            settings = _read_environment()
+
+            if settings is not None:
+                return settings.get(key, default)
+
+        return self.get(key, default)
+
+    def reload(self) -> NoReturn:
+        """
+        The reload function discards the loaded settings, so they are
+        loaded again, from the environment variables, on their next use.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        self._settings = None
+
+    def __getitem__(self, key: str) -> object:
+        return self._load()[key]
+
+    def __setitem__(self, key: str, value: object) -> NoReturn:
+        self._load()[key] = value
+
+    def __delitem__(self, key: str) -> NoReturn:
+        del self._load()[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._load()
+
+    def __getattr__(self, name: str) -> object:
+        return getattr(self._load(), name)
+
+    def _load(self) -> dict:
+        settings = self._settings
+
+        if settings is None:
+            with self._lock:
+                if self._settings is None:
+                    self._settings = load_settings()
+
+                settings = self._settings
+
+        return settings
+
+
+def _passes(check: Callable, value: object, expected: object) -> bool:
+    try:
+        return bool(check(value, expected))
+    except Exception:
+        return False
+
+
+_CHECKS: dict = {
+    "is_type_of": isinstance,
+    "gt": lambda value, expected: value > expected,
+    "gte": lambda value, expected: value >= expected,
+    "condition": lambda value, condition: condition(value),
+}
+RULES: list = [
+    Rule(
+        "APP_NAME",
+        "DOMAIN",
+        must_exist=True,
+    ),
+    Rule(
+        "HAKI",
+        default="INFO",
+        condition=lambda x: x.upper() in HAKI_LEVELS,
+    ),
+    Rule("SHAMBLES", default=""),
+    Rule("ASYNC", default=False, is_type_of=bool),
+    Rule("QUEUE_SIZE", default=10000, is_type_of=int, gt=0),
+    Rule(
+        "QUEUE_OVERFLOW",
+        default="BLOCK",
+        condition=lambda x: x.upper() in QUEUE_OVERFLOW_POLICIES,
+    ),
+    Rule("BUFFERED", default=False, is_type_of=bool),
+    Rule("BUFFER_SIZE", default=65536, is_type_of=int, gt=0),
+    Rule("FLUSH_INTERVAL", default=1.0, is_type_of=(int, float), gt=0),
+    Rule("COLLECTOR", default=False, is_type_of=bool),
+    Rule("COLLECTOR_ADDRESS", default="", is_type_of=str),
+    Rule("FILE", default="", is_type_of=str),
+    Rule("FILE_MAX_BYTES", default=0, is_type_of=int, gte=0),
+    Rule(
+        "FILE_ROTATION",
+        default="NONE",
+        condition=lambda x: x.upper() in FILE_ROTATIONS,
+    ),
+    Rule("FILE_BACKUP_COUNT", default=7, is_type_of=int, gte=0),
+    Rule(
+        "FILE_COMPRESSION",
+        default="GZIP",
+        condition=lambda x: x.upper() in FILE_COMPRESSIONS,
+    ),
+    Rule(
+        "FORMATTER",
+        default="JSON",
+        condition=lambda x: x.upper() in FORMATTERS,
+    ),
+    Rule(
+        "JSON_BACKEND",
+        default="AUTO",
+        condition=lambda x: x.upper() in JSON_BACKENDS,
+    ),
+    Rule(
+        "SAMPLING",
+        default="",
+        condition=lambda x: _are_valid_rules(x, SAMPLING_RULE),
+    ),
+    Rule(
+        "RATE_LIMITS",
+        default="",
+        condition=lambda x: _are_valid_rules(x, RATE_LIMIT_RULE),
+    ),
+    Rule(
+        "LIMITS_SUMMARY_INTERVAL",
+        default=60.0,
+        is_type_of=(int, float),
+        gt=0,
+    ),
+    Rule("LIMIT_ERRORS", default=False, is_type_of=bool),
+    Rule(
+        "DEDUPLICATION_WINDOW",
+        default=0,
+        is_type_of=(int, float),
+        gte=0,
+    ),
+    Rule("STACKTRACE_FRAMES", default=0, is_type_of=int, gte=0),
+    Rule("SKIP_EMPTY_STACKTRACE", default=False, is_type_of=bool),
+    Rule("CACHE_STACKTRACES", default=True, is_type_of=bool),
+    Rule("CODE_LINE", default=True, is_type_of=bool),
+    Rule("STATS", default=False, is_type_of=bool),
+    Rule("STATS_INTERVAL", default=0, is_type_of=(int, float), gte=0),
+    Rule("MAX_DEPTH", default=32, is_type_of=int, gte=0),
+    Rule("MAX_ITEMS", default=1000, is_type_of=int, gte=0),
+    Rule("MAX_STRING_LENGTH", default=10000, is_type_of=int, gte=0),
+    Rule("MAX_PAYLOAD_SIZE", default=1000000, is_type_of=int, gte=0),
+]
+
+
+def _are_valid_rules(rules: str, rule_pattern: re.Pattern) -> bool:
+    """
+    The _are_valid_rules function checks if every comma separated rule of a
+    setting, e.g.: TRA_LOG_SAMPLING, matches the pattern of its rules.
+
+    :param rules: str: The comma separated rules.
+    :param rule_pattern: re.Pattern: The pattern of a rule.
+    :returns: True if every rule is valid.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    return isinstance(rules, str) and all(
+        rule_pattern.fullmatch(rule)
+        for rule in rules.split(",")
+        if rule.strip()
+    )
+
+
+def _has_dotenv() -> bool:
+    """
+    The _has_dotenv function checks if Dynaconf would find a .env file: on
+    the directory of the main script, on the current working directory or
+    on any of their parents, or on the config directory of any of them.
+
+    :returns: True if there is a .env file.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    main = getattr(sys.modules.get("__main__"), "__file__", None)
+    starts = [os.getcwd()]
+
+    if main:
+        starts.append(os.path.dirname(os.path.abspath(main)))
+
+    for directory in starts:
+        while True:
+            if os.path.isfile(
+                os.path.join(directory, DOTENV)
+            ) or os.path.isfile(os.path.join(directory, "config", DOTENV)):
+                return True
+
+            parent = os.path.dirname(directory)
+
+            if parent == directory:
+                break
+
+            directory = parent
+
+    return False
+
+
+def _parse_value(value: str) -> object:
+    """
+    The _parse_value function parses the value of an environment variable
+    as Dynaconf does for the scalars: booleans, integers, floats and quoted
+    strings; anything else is a string.
+
+    :param value: str: The value of the environment variable.
+    :returns: The parsed value, or _MISSING if only Dynaconf can parse it
+            (e.g.: lists, tables, dates or @ tokens).
+    :doc-author: Trelent and this project contributors.
+    """
+
+    stripped = value.strip()
+
+    if stripped in ("true", "false"):
+        return stripped == "true"
+    if _INTEGER.fullmatch(stripped):
+        return int(stripped.replace("_", ""), 0)
+    if _FLOAT.fullmatch(stripped):
+        return float(stripped.replace("_", ""))
+    if _QUOTED.fullmatch(stripped):
+        return stripped[1:-1]
+    if _DYNACONF_SYNTAX.match(stripped) or (
+        stripped and stripped[0] in "\"'"
+    ):
+        return _MISSING
+
+    return value
+
+
+def _read_environment() -> Optional[EnvSettings]:
+    """
+    The _read_environment function reads the settings from the TRA_LOG_
+    environment variables.
+
+    :returns: The settings, or None if Dynaconf is needed to read them,
+            i.e.: it is configured by its own environment variables or a
+            value has a syntax that only it parses.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    prefix = f"{ENVVAR_PREFIX}_"
+    settings = EnvSettings()
+
+    for variable, value in os.environ.items():
+        if variable.startswith("DYNACONF_") or variable.endswith(
+            "_FOR_DYNACONF"
+        ):
+            return None
+        if not variable.startswith(prefix):
+            continue
+
+        parsed = _parse_value(value)
+
+        if parsed is _MISSING:
+            return None
+
+        settings[variable[len(prefix):]] = parsed
+
+    return settings
+
+
+def load_settings() -> dict:
+    """
+    The load_settings function loads and validates the settings with the
+    RULES, from the environment variables or, if there is a .env file or
+    anything else that only Dynaconf handles, with Dynaconf. Invalid
+    settings are reported, not raised.
+
+    :returns: An EnvSettings or a Dynaconf object.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    settings = None if _has_dotenv() else _read_environment()
+
+    if settings is None:
+        from dynaconf import Dynaconf, ValidationError
+
+        settings = Dynaconf(
+            envvar_prefix=ENVVAR_PREFIX,
+            load_dotenv=True,
+            validators=[rule.to_validator() for rule in RULES],
+        )
+
+        try:
+            settings.validators.validate_all()
+        except ValidationError as e:
+            print(f"Exception initializing Trafalgar Log: {str(e)}")
+    else:
+        errors = [error for rule in RULES for error in rule.validate(settings)]
+
+        if errors:
+            print(f"Exception initializing Trafalgar Log: {'; '.join(errors)}")
+
+    return settings
+
 
-try:
-    SETTINGS.validators.validate_all()
-except ValidationError as e:
-    print(f"Exception initializing Trafalgar Log: {str(e)}")
+SETTINGS: TrafalgarSettings = TrafalgarSettings()
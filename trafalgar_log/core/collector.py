@@ -0,0 +1,497 @@
+import atexit
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import time
+import warnings
+from logging import Handler, LogRecord
+from multiprocessing.connection import Client, Connection, Listener, wait
+from queue import Empty, SimpleQueue
+from threading import Thread
+from typing import NoReturn, Optional
+
+from trafalgar_log.core.stats import STATS, WRITE_STAGE
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_STOP: bytes = b""
+_STOP_TIMEOUT: float = 5.0
+_IDLE_TIMEOUT: float = 0.1
+_COLLECTOR: Optional["TrafalgarCollector"] = None
+
+
+class TrafalgarCollector(object):
+    """
+    This is the class of the collector process used when TRA_LOG_COLLECTOR
+    is set. Pre-fork servers (e.g.: gunicorn) and multiprocessing pools
+    have many processes writing to the same stderr, so large log events of
+    different processes may be interleaved. With the collector, the
+    processes send their log events to a single process over a local
+    socket, and only this process writes them, each one as a whole line.
+    The log events of each process are written in the order they were
+    sent.
+    The collector must be started before the processes are forked (e.g.:
+    on the gunicorn master with preload_app) or on a fixed address
+    (TRA_LOG_COLLECTOR_ADDRESS), so every process finds it. When a
+    collector is already listening on the address, no other one is
+    started.
+    The collector process is created with the fork start method, whatever
+    the start method of the application is, so it only works on POSIX
+    systems. Where fork is not available (e.g.: Windows) and on child
+    processes of multiprocessing (e.g.: started with spawn, which import
+    Trafalgar Log again), no collector is started: a warning is issued and
+    the log events are sent to a collector already listening on the
+    address or, if there is none, written to stderr.
+
+    :ivar address: The path of the socket of the collector.
+    :ivar filename: The file the log events are appended to, or None for
+        stderr.
+    :ivar process: The collector process, or None if the collector was
+        started by another process.
+    """
+
+    def __init__(self, address: str = "", filename: Optional[str] = None):
+        self.address = address or _get_default_address()
+        self.filename = filename
+        self.process = None
+        self._pid = os.getpid()
+
+    def start(self) -> "TrafalgarCollector":
+        """
+        The start function starts the collector process, unless there is a
+        collector listening on the address already, and waits until it
+        accepts connections.
+
+        :returns: The collector itself.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        reason = _get_unsupported_reason()
+
+        if reason:
+            if not _is_listening(self.address):
+                warnings.warn(
+                    f"The Trafalgar Log collector was not started, {reason}; "
+                    f"the log events are written to stderr.",
+                    RuntimeWarning,
+                )
+            return self
+
+        with _AddressLock(self.address):
+            if _is_listening(self.address):
+                return self
+
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+
+            context = multiprocessing.get_context("fork")
+            ready = context.Event()
+            self.process = context.Process(
+                target=_collect,
+                args=(self.address, self.filename, ready),
+                name="TrafalgarCollector",
+                daemon=True,
+            )
+            self.process.start()
+            ready.wait(_STOP_TIMEOUT)
+
+        atexit.register(self.stop)
+
+        return self
+
+    def stop(self) -> NoReturn:
+        """
+        The stop function asks the collector process to write the log
+        events it has already received and to exit, and removes the lock
+        file of its address; the collector process removes its socket. It
+        does nothing on processes other than the one that started the
+        collector, such as forked workers.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if self.process is None or self._pid != os.getpid():
+            return
+
+        if self.process.is_alive():
+            try:
+                with Client(self.address) as connection:
+                    connection.send_bytes(_STOP)
+            except OSError:
+                pass
+
+            self.process.join(_STOP_TIMEOUT)
+
+        self.process = None
+
+        try:
+            os.unlink(_get_lock_path(self.address))
+        except OSError:
+            pass
+
+
+class TrafalgarCollectorHandler(Handler):
+    """
+    This is the handler used when TRA_LOG_COLLECTOR is set. It formats the
+    log records on the process that logged them, so the payloads are still
+    converted and shambled by each process, and sends each log event as a
+    single message to the collector, which writes it as a whole line.
+    The connection is opened on the first log event and is not shared with
+    forked processes: after_fork drops it, so a forked process opens its
+    own. When the collector cannot be reached, the log event is written to
+    stderr, so it is never lost.
+    """
+
+    def __init__(self, address: str):
+        super(TrafalgarCollectorHandler, self).__init__()
+        self.address = address
+        self.connection = None
+
+    def emit(self, record: LogRecord) -> NoReturn:
+        """
+        The emit function formats the log record and sends it to the
+        collector.
+
+        :param record: LogRecord: The log record of the log event.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        try:
+            message = self.format(record) + "\n"
+        except Exception:
+            self.handleError(record)
+            return
+
+        start = time.perf_counter_ns() if STATS.enabled else 0
+
+        try:
+            if self.connection is None:
+                self.connection = Client(self.address)
+
+            self.connection.send_bytes(message.encode("utf-8"))
+
+            if start:
+                STATS.add_time(WRITE_STAGE, start)
+        except (OSError, EOFError):
+            self._disconnect()
+
+            try:
+                sys.stderr.write(message)
+                sys.stderr.flush()
+            except Exception:
+                self.handleError(record)
+
+    def after_fork(self) -> NoReturn:
+        """
+        The after_fork function drops the connection inherited from the
+        parent process, so a forked process never writes to the same
+        socket of its parent.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        self._disconnect()
+
+    def close(self) -> NoReturn:
+        """
+        The close function closes the connection to the collector.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        self._disconnect()
+        super(TrafalgarCollectorHandler, self).close()
+
+    def _disconnect(self) -> NoReturn:
+        """
+        The _disconnect function closes the connection to the collector, if
+        there is one.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        connection, self.connection = self.connection, None
+
+        if connection is not None:
+            try:
+                connection.close()
+            except OSError:
+                pass
+
+
+class _AddressLock(object):
+    """
+    This is the context manager that locks the address of a collector
+    (with a lock file next to its socket), so processes started together
+    do not start more than one collector.
+    """
+
+    def __init__(self, address: str):
+        self.path = _get_lock_path(address)
+        self.file = None
+
+    def __enter__(self) -> "_AddressLock":
+        if fcntl:
+            self.file = open(self.path, "w")
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+
+        return self
+
+    def __exit__(self, *_) -> NoReturn:
+        if self.file:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+
+
+def _get_lock_path(address: str) -> str:
+    """
+    The _get_lock_path function returns the path of the lock file of the
+    address of a collector, which is removed when the collector stops.
+
+    :param address: str: The path of the socket.
+    :returns: The path of the lock file.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    return f"{address}.lock"
+
+
+def _get_default_address() -> str:
+    """
+    The _get_default_address function returns the path of the socket of a
+    collector started without an address: a file on the temporary
+    directory named after the process that starts it.
+
+    :returns: The path of the socket.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    return os.path.join(
+        tempfile.gettempdir(), f"trafalgar-log-{os.getpid()}.sock"
+    )
+
+
+def _get_unsupported_reason() -> Optional[str]:
+    """
+    The _get_unsupported_reason function checks if this process can start
+    the collector: the fork start method must be available and it must not
+    be a child process of multiprocessing, whose parent is the one that
+    starts the collector.
+
+    :returns: Why the collector cannot be started, or None if it can.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return "since it needs the fork start method, only found on POSIX"
+
+    # while a spawned child imports the main module, it has no parent yet
+    if multiprocessing.parent_process() is not None or getattr(
+        multiprocessing.current_process(), "_inheriting", False
+    ):
+        return (
+            "since this is a child process of multiprocessing (set "
+            "TRA_LOG_COLLECTOR_ADDRESS to use the collector of its parent)"
+        )
+
+    return None
+
+
+def _is_listening(address: str) -> bool:
+    """
+    The _is_listening function checks if there is a collector accepting
+    connections on the address.
+
+    :param address: str: The path of the socket.
+    :returns: True if a connection could be opened.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    try:
+        Client(address).close()
+    except OSError:
+        return False
+
+    return True
+
+
+def _collect(
+    address: str, filename: Optional[str], ready: multiprocessing.Event
+) -> NoReturn:
+    """
+    The _collect function is the loop of the collector process. A thread
+    accepts the connections of the processes, while the loop waits for any
+    of them to have log events and writes all the log events received at
+    once with a single write, so the lines are never interleaved.
+    It stops when it receives the stop message, after every pending log
+    event is written.
+
+    :param address: str: The path of the socket.
+    :param filename: str: The file the log events are appended to, or None
+            for stderr.
+    :param ready: multiprocessing.Event: The event set once the collector
+            accepts connections.
+    :returns: Nothing.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    listener = Listener(address)
+    file_descriptor = (
+        os.open(filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        if filename
+        else sys.stderr.fileno()
+    )
+    accepted = SimpleQueue()
+    wake_reader, wake_writer = multiprocessing.Pipe(duplex=False)
+    connections = []
+    stopping = False
+
+    Thread(
+        target=_accept,
+        args=(listener, accepted, wake_writer),
+        name="TrafalgarCollectorAccept",
+        daemon=True,
+    ).start()
+    ready.set()
+
+    while True:
+        messages = []
+
+        for connection in wait(
+            [wake_reader, *connections], _IDLE_TIMEOUT if stopping else None
+        ):
+            if connection is wake_reader:
+                wake_reader.recv_bytes()
+                connections.extend(_drain(accepted))
+                continue
+
+            try:
+                message = connection.recv_bytes()
+            except (EOFError, OSError):
+                connections.remove(connection)
+                connection.close()
+                continue
+
+            if message == _STOP:
+                stopping = True
+            else:
+                messages.append(message)
+
+        if messages:
+            _write(file_descriptor, b"".join(messages))
+        elif stopping:
+            break
+
+    listener.close()
+
+
+def _accept(
+    listener: Listener, accepted: SimpleQueue, wake_writer: Connection
+) -> NoReturn:
+    """
+    The _accept function is the loop of the thread of the collector that
+    accepts the connections, waking the collector loop up for each one.
+
+    :param listener: Listener: The listener of the socket.
+    :param accepted: SimpleQueue: The queue of the accepted connections.
+    :param wake_writer: Connection: The pipe that wakes the loop up.
+    :returns: Nothing.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    while True:
+        try:
+            connection = listener.accept()
+        except OSError:
+            return
+
+        accepted.put(connection)
+        wake_writer.send_bytes(b"\x00")
+
+
+def _drain(accepted: SimpleQueue) -> list:
+    """
+    The _drain function takes every connection accepted since its last
+    call.
+
+    :param accepted: SimpleQueue: The queue of the accepted connections.
+    :returns: A list of connections.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    connections = []
+
+    while True:
+        try:
+            connections.append(accepted.get_nowait())
+        except Empty:
+            return connections
+
+
+def _write(file_descriptor: int, data: bytes) -> NoReturn:
+    """
+    The _write function writes the data to the file descriptor, writing
+    again whatever a partial write left.
+
+    :param file_descriptor: int: The file descriptor of stderr or of the
+            file.
+    :param data: bytes: The lines of the log events.
+    :returns: Nothing.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    view = memoryview(data)
+
+    while view:
+        view = view[os.write(file_descriptor, view):]
+
+
+def start_collector(
+    address: str = "", filename: Optional[str] = None
+) -> TrafalgarCollector:
+    """
+    The start_collector function starts the collector of the log events of
+    this process and of the processes forked from it, unless this process
+    has started one already.
+
+    :param address: str: The path of the socket, or an empty string for a
+            path on the temporary directory.
+    :param filename: str: The file the log events are appended to, or None
+            for stderr.
+    :returns: The collector.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    global _COLLECTOR
+
+    if _COLLECTOR is None or (address and _COLLECTOR.address != address):
+        _COLLECTOR = TrafalgarCollector(address, filename).start()
+
+    return _COLLECTOR
+
+
+def get_collector_handler(address: str = "") -> TrafalgarCollectorHandler:
+    """
+    The get_collector_handler function starts the collector, if needed, and
+    creates a TrafalgarCollectorHandler that sends the log events to it.
+
+    :param address: str: The path of the socket, or an empty string for a
+            path on the temporary directory.
+    :returns: The collector handler.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    return TrafalgarCollectorHandler(start_collector(address).address)
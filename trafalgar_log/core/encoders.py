@@ -0,0 +1,168 @@
+import json
+import math
+from typing import Callable
+
+from pythonjsonlogger.jsonlogger import JsonEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+AUTO: str = "AUTO"
+ORJSON: str = "ORJSON"
+UJSON: str = "UJSON"
+STDLIB: str = "STDLIB"
+JSON_BACKENDS: list = [AUTO, ORJSON, UJSON, STDLIB]
+_DEFAULT: Callable = JsonEncoder().default
+_ORJSON_OPTIONS: int = (
+    orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_DATETIME
+    if orjson
+    else 0
+)
+_OUT_OF_RANGE_FLOAT: str = "Out of range float values"
+
+
+class JsonBackend(object):
+    """
+    This is the class that represents the library used to encode the log
+    events to JSON. Every backend writes the same JSON: compact, without
+    spaces between the separators, with non-ASCII characters written as
+    they are (e.g.: "contraseña") and with NaN and infinite numbers written
+    as null. Objects that JSON does not support are encoded the same way
+    python-json-logger encodes them.
+    Whenever the library of the backend fails to encode an object, e.g.: an
+    integer bigger than 64 bits on orjson, the object is encoded by the
+    standard library instead.
+
+    :ivar name: The name of the backend (ORJSON, UJSON or STDLIB).
+    :ivar dumps: The function that encodes an object to a JSON string.
+    """
+
+    __slots__ = ("name", "dumps")
+
+    def __init__(self, name: str, dumps: Callable[[object], str]):
+        self.name = name
+        self.dumps = dumps
+
+    def __repr__(self) -> str:
+        return f"JsonBackend({self.name})"
+
+
+def _finite(value: object) -> object:
+    """
+    The _finite function replaces NaN and infinite numbers with None inside
+    of dictionaries and lists, so they are encoded as null.
+
+    :param value: object: The object to have its numbers replaced.
+    :returns: The object without NaN nor infinite numbers.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+
+    return value
+
+
+def _stdlib_dumps(value: object) -> str:
+    """
+    The _stdlib_dumps function encodes an object to JSON with the json
+    package of the standard library.
+
+    :param value: object: The object to be encoded.
+    :returns: The JSON string.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    try:
+        return json.dumps(
+            value,
+            default=_DEFAULT,
+            ensure_ascii=False,
+            separators=(",", ":"),
+            allow_nan=False,
+        )
+    except ValueError as error:
+        if not str(error).startswith(_OUT_OF_RANGE_FLOAT):
+            raise
+
+    return json.dumps(
+        _finite(value),
+        default=_DEFAULT,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+
+
+def _orjson_dumps(value: object) -> str:
+    """
+    The _orjson_dumps function encodes an object to JSON with orjson.
+
+    :param value: object: The object to be encoded.
+    :returns: The JSON string.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    try:
+        return orjson.dumps(
+            value, default=_DEFAULT, option=_ORJSON_OPTIONS
+        ).decode("utf-8")
+    except TypeError:
+        return _stdlib_dumps(value)
+
+
+def _ujson_dumps(value: object) -> str:
+    """
+    The _ujson_dumps function encodes an object to JSON with ujson.
+
+    :param value: object: The object to be encoded.
+    :returns: The JSON string.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    try:
+        return ujson.dumps(
+            value,
+            default=_DEFAULT,
+            ensure_ascii=False,
+            escape_forward_slashes=False,
+        )
+    except (TypeError, ValueError, OverflowError):
+        return _stdlib_dumps(value)
+
+
+def get_json_backend(name: str = AUTO) -> JsonBackend:
+    """
+    The get_json_backend function returns the backend used to encode the
+    log events to JSON.
+    With AUTO, the fastest installed library is chosen: orjson, then ujson
+    and then the standard library. When the requested library is not
+    installed, the standard library is used.
+
+    :param name: str: The name of the backend (AUTO, ORJSON, UJSON or
+            STDLIB).
+    :returns: The JSON backend.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    name = name.upper()
+
+    if name in [AUTO, ORJSON] and orjson:
+        return JsonBackend(ORJSON, _orjson_dumps)
+
+    if name in [AUTO, UJSON] and ujson:
+        return JsonBackend(UJSON, _ujson_dumps)
+
+    return JsonBackend(STDLIB, _stdlib_dumps)
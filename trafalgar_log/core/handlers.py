@@ -0,0 +1,1015 @@
+import gzip
+import logging
+import math
+import os
+import re
+import shutil
+import time
+import traceback
+from datetime import datetime, timedelta
+from logging import ERROR, FileHandler, Handler, LogRecord, StreamHandler
+from logging import WARNING
+from logging.handlers import QueueHandler, QueueListener
+from queue import Empty, Full, Queue
+from threading import Event, Lock, Thread
+from typing import IO, Iterable, NoReturn, Optional
+
+from trafalgar_log.core.enums import LogFields
+from trafalgar_log.core.stats import QUEUE, STATS, WRITE_STAGE
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BLOCK: str = "BLOCK"
+DROP_NEWEST: str = "DROP_NEWEST"
+DROP_OLDEST: str = "DROP_OLDEST"
+OVERFLOW_POLICIES: list = [BLOCK, DROP_NEWEST, DROP_OLDEST]
+TRAFALGAR_LOG_CODE: str = "Trafalgar Log"
+NONE: str = "NONE"
+MINUTE: str = "MINUTE"
+HOUR: str = "HOUR"
+DAY: str = "DAY"
+ROTATIONS: list = [NONE, MINUTE, HOUR, DAY]
+GZIP: str = "GZIP"
+ZSTD: str = "ZSTD"
+COMPRESSIONS: list = [NONE, GZIP, ZSTD]
+_EXTENSIONS: dict = {NONE: "", GZIP: ".gz", ZSTD: ".zst"}
+_PERIODS: dict = {MINUTE: 60, HOUR: 3600}
+_SEGMENT_TIME_FORMAT: str = "%Y%m%d-%H%M%S"
+_GZIP_LEVEL: int = 6
+_COPY_SIZE: int = 1024 * 1024
+
+
+class TrafalgarQueueHandler(QueueHandler):
+    """
+    This is the handler used when Trafalgar Log runs asynchronously
+    (TRA_LOG_ASYNC). It only puts the log records on a bounded queue, so the
+    caller thread never formats nor writes a log event; a
+    TrafalgarQueueListener does both on a background thread.
+    When the queue is full, the overflow policy decides what happens:
+    - BLOCK: the caller waits until there is room on the queue;
+    - DROP_NEWEST: the new log record is discarded;
+    - DROP_OLDEST: the oldest log record on the queue is discarded to make
+      room for the new one.
+    Discarded log records are counted and reported by the listener.
+    The queue is drained when the handler is closed, which the logging
+    package does at interpreter exit.
+    """
+
+    def __init__(self, handler: Handler, queue_size: int, overflow: str):
+        super(TrafalgarQueueHandler, self).__init__(Queue(maxsize=queue_size))
+        self.overflow = overflow.upper()
+        self.dropped = 0
+        self._dropped_lock = Lock()
+        self.listener = TrafalgarQueueListener(self, handler)
+        self.listener.start()
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        """
+        The prepare function returns the log record untouched, since the
+        formatting of the log event happens on the listener thread.
+
+        :param record: LogRecord: The log record of the log event.
+        :returns: The same log record.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        return record
+
+    def enqueue(self, record: LogRecord) -> NoReturn:
+        """
+        The enqueue function puts the log record on the queue, following the
+        overflow policy of the handler when the queue is full.
+
+        :param record: LogRecord: The log record of the log event.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if self.overflow == BLOCK:
+            self.queue.put(record)
+            return
+
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except Full:
+                if self.overflow == DROP_NEWEST:
+                    self._count_dropped()
+                    return
+
+            try:
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self._count_dropped()
+            except Empty:
+                pass
+
+    def pop_dropped(self) -> int:
+        """
+        The pop_dropped function returns how many log records were dropped
+        since its last call and resets the counter.
+
+        :returns: The number of dropped log records.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if not self.dropped:
+            return 0
+
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+
+        return dropped
+
+    def after_fork(self) -> NoReturn:
+        """
+        The after_fork function is called on a forked process. The thread of
+        the listener does not exist on it and the queue may hold log records
+        of the parent process, which the parent writes, so a new queue and a
+        new listener are created, after the handler of the listener is
+        reinitialized too.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if not self.listener:
+            return
+
+        handler = self.listener.handlers[0]
+
+        if hasattr(handler, "after_fork"):
+            handler.after_fork()
+
+        self.queue = Queue(maxsize=self.queue.maxsize)
+        self.dropped = 0
+        self._dropped_lock = Lock()
+        self.listener = TrafalgarQueueListener(self, handler)
+        self.listener.start()
+
+    def close(self) -> NoReturn:
+        """
+        The close function stops the listener, which writes every log record
+        still on the queue before the handler is closed.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if self.listener:
+            self.listener.stop()
+            self.listener.close_handlers()
+            self.listener = None
+
+        super(TrafalgarQueueHandler, self).close()
+
+    def _count_dropped(self) -> NoReturn:
+        """
+        The _count_dropped function increments the dropped log records
+        counter.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        with self._dropped_lock:
+            self.dropped += 1
+
+        if STATS.enabled:
+            STATS.count_dropped(QUEUE)
+
+
+class TrafalgarQueueListener(QueueListener):
+    """
+    This is the listener that consumes the queue of a TrafalgarQueueHandler
+    on a background thread, formatting and writing each log record through
+    the handler it was created with.
+    After each log record, it writes a warning log event if the queue
+    handler dropped any log record in the meantime.
+    """
+
+    def __init__(self, queue_handler: TrafalgarQueueHandler, handler: Handler):
+        super(TrafalgarQueueListener, self).__init__(
+            queue_handler.queue, handler, respect_handler_level=True
+        )
+        self.queue_handler = queue_handler
+
+    def handle(self, record: LogRecord) -> NoReturn:
+        """
+        The handle function writes the log record and, if any log record was
+        dropped, a log event reporting how many.
+
+        :param record: LogRecord: The log record of the log event.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        super(TrafalgarQueueListener, self).handle(record)
+
+        dropped = self.queue_handler.pop_dropped()
+
+        if dropped:
+            super(TrafalgarQueueListener, self).handle(
+                _get_dropped_record(record.name, dropped, self.queue_handler)
+            )
+
+    def enqueue_sentinel(self) -> NoReturn:
+        """
+        The enqueue_sentinel function puts the stop signal on the queue,
+        waiting for room if the queue is full.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        self.queue.put(self._sentinel)
+
+    def close_handlers(self) -> NoReturn:
+        """
+        The close_handlers function flushes and closes the handlers of the
+        listener.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        for handler in self.handlers:
+            handler.flush()
+            handler.close()
+
+
+def _get_dropped_record(
+    name: str, dropped: int, queue_handler: TrafalgarQueueHandler
+) -> LogRecord:
+    """
+    The _get_dropped_record function creates the warning log record that
+    reports how many log records were dropped by the queue handler.
+
+    :param name: str: The name of the logger.
+    :param dropped: int: The number of dropped log records.
+    :param queue_handler: TrafalgarQueueHandler: The handler that dropped
+            the log records.
+    :returns: The log record.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    record = logging.makeLogRecord(
+        {
+            "name": name,
+            "msg": f"{dropped} log events were dropped because the log queue "
+            f"was full.",
+            "levelno": WARNING,
+            "levelname": logging.getLevelName(WARNING),
+            "pathname": __file__,
+            "filename": "handlers.py",
+            "module": "handlers",
+            "funcName": "handle",
+        }
+    )
+    record.__dict__.update(
+        {
+            LogFields.LOG_CODE.value: TRAFALGAR_LOG_CODE,
+            LogFields.PAYLOAD.value: {
+                "dropped": dropped,
+                "overflow": queue_handler.overflow,
+                "queue_size": queue_handler.queue.maxsize,
+            },
+            LogFields.SEVERITY.value: logging.getLevelName(WARNING),
+        }
+    )
+
+    return record
+
+
+class TrafalgarBufferedHandler(StreamHandler):
+    """
+    This is the handler used when TRA_LOG_BUFFERED is set. Instead of
+    writing and flushing each log event, as the StreamHandler does, it keeps
+    the formatted log events in memory and writes them to the stream with a
+    single write when:
+    - the buffer holds buffer_size characters or more;
+    - flush_interval seconds have passed since the last write, checked on
+      each log event and by a background thread, so log events are never
+      held for long on idle applications;
+    - a log event of flush_level (ERROR by default) or above is handled,
+      so errors are never delayed.
+    The buffer is also written when the handler is flushed or closed, which
+    the logging package does at interpreter exit.
+    """
+
+    def __init__(
+        self,
+        stream: Optional[IO] = None,
+        buffer_size: int = 65536,
+        flush_interval: float = 1.0,
+        flush_level: int = ERROR,
+    ):
+        super(TrafalgarBufferedHandler, self).__init__(stream)
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.flush_level = flush_level
+        self.buffer = []
+        self.buffered = 0
+        self.last_flush = time.monotonic()
+        self._closed = Event()
+        self._flusher = None
+        self._last_record = None
+
+    def emit(self, record: LogRecord) -> NoReturn:
+        """
+        The emit function formats the log record and keeps it on the buffer,
+        writing the buffer if any of the flush conditions is met.
+
+        :param record: LogRecord: The log record of the log event.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        try:
+            message = self.format(record) + self.terminator
+        except Exception:
+            self.handleError(record)
+            return
+
+        self.buffer.append(message)
+        self.buffered += len(message)
+        self._last_record = record
+
+        if self._flusher is None or not self._flusher.is_alive():
+            self._start_flusher()
+
+        if (
+            record.levelno >= self.flush_level
+            or self.buffered >= self.buffer_size
+            or time.monotonic() - self.last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> NoReturn:
+        """
+        The flush function writes every log event on the buffer to the
+        stream with a single write and flushes the stream.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        with self.lock:
+            self.last_flush = time.monotonic()
+
+            if not self.buffer:
+                return
+
+            text = "".join(self.buffer)
+            self.buffer.clear()
+            self.buffered = 0
+
+            start = time.perf_counter_ns() if STATS.enabled else 0
+
+            try:
+                if self.stream and hasattr(self.stream, "write"):
+                    self.stream.write(text)
+                    super(TrafalgarBufferedHandler, self).flush()
+            except Exception:
+                self.handleError(self._last_record)
+
+            if start:
+                STATS.add_time(WRITE_STAGE, start)
+
+    def after_fork(self) -> NoReturn:
+        """
+        The after_fork function is called on a forked process. It drops the
+        log events inherited from the buffer of the parent process, which
+        the parent writes, and the background thread, which does not exist
+        on the forked process and is started again on its first log event.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        self.buffer = []
+        self.buffered = 0
+        self.last_flush = time.monotonic()
+        self._flusher = None
+
+    def close(self) -> NoReturn:
+        """
+        The close function stops the background thread and writes the log
+        events left on the buffer before the handler is closed.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        self._closed.set()
+        self.flush()
+        super(TrafalgarBufferedHandler, self).close()
+
+    def _start_flusher(self) -> NoReturn:
+        """
+        The _start_flusher function starts the background thread that
+        writes the buffer every flush_interval seconds. It is started on the
+        first log event, so an application that never logs never starts it,
+        and started again if it is not running anymore, e.g.: on a forked
+        process.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if self._closed.is_set():
+            return
+
+        self._flusher = Thread(
+            target=self._flush_periodically,
+            name="TrafalgarBufferedHandler",
+            daemon=True,
+        )
+        self._flusher.start()
+
+    def _flush_periodically(self) -> NoReturn:
+        """
+        The _flush_periodically function is the loop of the background
+        thread, which writes the buffer whenever it has not been written for
+        flush_interval seconds.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        while not self._closed.wait(self.flush_interval):
+            if time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+
+
+def get_buffered_handler(
+    buffer_size: int, flush_interval: float
+) -> TrafalgarBufferedHandler:
+    """
+    The get_buffered_handler function creates a TrafalgarBufferedHandler
+    that writes the log events to stderr.
+
+    :param buffer_size: int: The number of characters on the buffer that
+            makes it be written.
+    :param flush_interval: float: The maximum number of seconds between two
+            writes of the buffer.
+    :returns: The buffered handler.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    return TrafalgarBufferedHandler(
+        buffer_size=buffer_size, flush_interval=flush_interval
+    )
+
+
+class TrafalgarRotatingFileHandler(FileHandler):
+    """
+    This is the handler used when TRA_LOG_FILE is set. It appends the log
+    events to the file, encoded as UTF-8, and rotates it:
+    - when writing a log event would make the file bigger than max_bytes
+      bytes (an empty file is never rotated, so a log event bigger than
+      max_bytes is still written);
+    - at the start of each minute, hour or day of the local time, following
+      the rotation (MINUTE, HOUR or DAY).
+    On rotation, the file is renamed after the local time it was started
+    (e.g.: app.log.20240131-000000) and a new file is opened, which is all
+    the logging thread does: a background thread compresses the renamed
+    segments (gzip or zstd) and removes the oldest ones, keeping
+    backup_count of them. The thread is started on the first rotation and
+    waited for when the handler is closed, which the logging package does
+    at interpreter exit.
+    Rotation is not coordinated between processes, so the file must be
+    written by a single process.
+
+    :ivar max_bytes: The maximum size of the file, or 0 for no limit.
+    :ivar rotation: NONE, MINUTE, HOUR or DAY.
+    :ivar backup_count: The number of segments kept, or 0 to keep all.
+    :ivar compression: NONE, GZIP or ZSTD; ZSTD is replaced by GZIP when
+        the zstandard package is not installed.
+    :ivar size: The number of bytes of the file.
+    :ivar started_at: The time the file was started.
+    :ivar rollover_at: The time of the next rotation by time.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        max_bytes: int = 0,
+        rotation: str = NONE,
+        backup_count: int = 7,
+        compression: str = GZIP,
+    ):
+        super(TrafalgarRotatingFileHandler, self).__init__(
+            filename, encoding="utf-8", delay=True
+        )
+        self.max_bytes = max_bytes
+        self.rotation = rotation.upper()
+        self.backup_count = backup_count
+        self.compression = _get_compression(compression)
+        self.size = 0
+        self.started_at = 0.0
+        self.rollover_at = math.inf
+        self._segments = Queue()
+        self._compressor = None
+        self._stopped = False
+
+    def emit(self, record: LogRecord) -> NoReturn:
+        """
+        The emit function formats the log record and writes it to the file,
+        rotating the file before, if needed.
+
+        :param record: LogRecord: The log record of the log event.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        try:
+            message = self.format(record) + self.terminator
+        except Exception:
+            self.handleError(record)
+            return
+
+        size = (
+            len(message) if message.isascii() else len(message.encode("utf-8"))
+        )
+        start = time.perf_counter_ns() if STATS.enabled else 0
+
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+
+            if (
+                self.max_bytes
+                and self.size
+                and self.size + size > self.max_bytes
+            ) or time.time() >= self.rollover_at:
+                self.rollover()
+
+            self.stream.write(message)
+            self.stream.flush()
+            self.size += size
+        except Exception:
+            self.handleError(record)
+
+        if start:
+            STATS.add_time(WRITE_STAGE, start)
+
+    def rollover(self) -> NoReturn:
+        """
+        The rollover function closes the file, renames it as a segment and
+        opens a new file, leaving the compression of the segment and the
+        removal of the oldest segments to the background thread (or doing
+        them right away, if the handler is closed). An empty file is not
+        renamed, only its next rotation by time is scheduled.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        with self.lock:
+            if not self.size:
+                self.rollover_at = _get_rollover_at(self.rotation, time.time())
+                return
+
+            if self.stream:
+                self.stream.close()
+                self.stream = None
+
+            segment = _get_segment_name(self.baseFilename, self.started_at)
+            os.rename(self.baseFilename, segment)
+            self.stream = self._open()
+
+            if self._stopped:
+                self._archive(segment)
+                return
+
+            self._segments.put(segment)
+
+            if self._compressor is None or not self._compressor.is_alive():
+                self._start_compressor()
+
+    def after_fork(self) -> NoReturn:
+        """
+        The after_fork function is called on a forked process. The segments
+        waiting to be compressed are left to the parent process and the
+        background thread, which does not exist on the forked process, is
+        started again on its first rotation.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        self._segments = Queue()
+        self._compressor = None
+
+    def close(self) -> NoReturn:
+        """
+        The close function closes the file and waits for the background
+        thread to compress the segments left.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        super(TrafalgarRotatingFileHandler, self).close()
+        self._stopped = True
+
+        if self._compressor is not None and self._compressor.is_alive():
+            self._segments.put(None)
+            self._compressor.join()
+
+    def _open(self) -> IO:
+        """
+        The _open function opens the file, as the FileHandler does, and
+        takes its size and the time it was started: now or, when the file
+        already has log events, the last time it was written, so a file left
+        by a previous run is still rotated on time.
+
+        :returns: The stream of the file.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        stream = super(TrafalgarRotatingFileHandler, self)._open()
+        status = os.fstat(stream.fileno())
+        now = time.time()
+        self.size = status.st_size
+        self.started_at = min(status.st_mtime, now) if self.size else now
+        self.rollover_at = _get_rollover_at(self.rotation, self.started_at)
+
+        return stream
+
+    def _start_compressor(self) -> NoReturn:
+        """
+        The _start_compressor function starts the background thread that
+        compresses the segments.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        self._compressor = Thread(
+            target=self._compress_segments,
+            name="TrafalgarRotatingFileHandler",
+            daemon=True,
+        )
+        self._compressor.start()
+
+    def _compress_segments(self) -> NoReturn:
+        """
+        The _compress_segments function is the loop of the background
+        thread, which archives each segment put on the queue until it gets
+        None.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        while True:
+            segment = self._segments.get()
+
+            if segment is None:
+                return
+
+            self._archive(segment)
+
+    def _archive(self, segment: str) -> NoReturn:
+        """
+        The _archive function compresses a segment and removes the oldest
+        segments. Its errors are printed to stderr, as the logging package
+        does with the errors of the handlers.
+
+        :param segment: str: The path of the segment.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        try:
+            _compress(segment, self.compression)
+            _remove_old_segments(self.baseFilename, self.backup_count)
+        except Exception:
+            if logging.raiseExceptions:
+                traceback.print_exc()
+
+
+def _get_compression(compression: str) -> str:
+    """
+    The _get_compression function returns the compression of the segments,
+    replacing ZSTD by GZIP when the zstandard package is not installed.
+
+    :param compression: str: NONE, GZIP or ZSTD.
+    :returns: The compression that is used.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    compression = compression.upper()
+
+    if compression == ZSTD and zstandard is None:
+        return GZIP
+
+    return compression
+
+
+def _get_rollover_at(rotation: str, start: float) -> float:
+    """
+    The _get_rollover_at function calculates when a file started at the
+    given time is rotated: at the start of the next minute, hour or day of
+    the local time.
+
+    :param rotation: str: NONE, MINUTE, HOUR or DAY.
+    :param start: float: The time the file was started.
+    :returns: The time of the rotation, or infinity when the file is not
+            rotated by time.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    if rotation == DAY:
+        day = datetime.fromtimestamp(start).date() + timedelta(days=1)
+        return datetime(day.year, day.month, day.day).timestamp()
+
+    if rotation in _PERIODS:
+        period = _PERIODS[rotation]
+        offset = time.localtime(start).tm_gmtoff
+        return ((start + offset) // period + 1) * period - offset
+
+    return math.inf
+
+
+def _get_segment_name(filename: str, started_at: float) -> str:
+    """
+    The _get_segment_name function names the segment of a file after the
+    local time it was started, adding a counter when a segment (compressed
+    or not) already has the name, e.g.: when the file is rotated by size
+    more than once a second.
+
+    :param filename: str: The path of the file.
+    :param started_at: float: The time the file was started.
+    :returns: The path of the segment.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    name = (
+        f"{filename}."
+        f"{time.strftime(_SEGMENT_TIME_FORMAT, time.localtime(started_at))}"
+    )
+    segment = name
+    counter = 0
+
+    while any(
+        os.path.exists(segment + extension)
+        for extension in _EXTENSIONS.values()
+    ):
+        counter += 1
+        segment = f"{name}_{counter}"
+
+    return segment
+
+
+def _get_segments(filename: str) -> list:
+    """
+    The _get_segments function lists the segments of a file, compressed or
+    not, from the oldest to the newest.
+
+    :param filename: str: The absolute path of the file.
+    :returns: A list with the paths of the segments.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    directory, name = os.path.split(filename)
+    pattern = re.compile(
+        rf"{re.escape(name)}\.(\d{{8}}-\d{{6}})(?:_(\d+))?(?:\.gz|\.zst)?"
+    )
+    segments = []
+
+    for entry in os.listdir(directory):
+        match = pattern.fullmatch(entry)
+
+        if match:
+            segments.append((match.group(1), int(match.group(2) or 0), entry))
+
+    return [os.path.join(directory, entry) for _, _, entry in sorted(segments)]
+
+
+def _compress(segment: str, compression: str) -> NoReturn:
+    """
+    The _compress function compresses a segment to a temporary file, which
+    is renamed once it is complete, and removes the segment, so a segment is
+    never lost nor left half compressed. A segment removed in the meantime
+    is ignored.
+
+    :param segment: str: The path of the segment.
+    :param compression: str: NONE, GZIP or ZSTD.
+    :returns: Nothing.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    if compression == NONE or not os.path.exists(segment):
+        return
+
+    target = segment + _EXTENSIONS[compression]
+    temporary = target + ".tmp"
+
+    with open(segment, "rb") as source, open(temporary, "wb") as destination:
+        if compression == ZSTD:
+            zstandard.ZstdCompressor().copy_stream(source, destination)
+        else:
+            with gzip.GzipFile(
+                os.path.basename(segment), "wb", _GZIP_LEVEL, destination
+            ) as archive:
+                shutil.copyfileobj(source, archive, _COPY_SIZE)
+
+    os.replace(temporary, target)
+    os.remove(segment)
+
+
+def _remove_old_segments(filename: str, backup_count: int) -> NoReturn:
+    """
+    The _remove_old_segments function removes the oldest segments of a
+    file, keeping backup_count of them.
+
+    :param filename: str: The absolute path of the file.
+    :param backup_count: int: The number of segments kept, or 0 to keep all.
+    :returns: Nothing.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    if not backup_count:
+        return
+
+    for segment in _get_segments(filename)[:-backup_count]:
+        try:
+            os.remove(segment)
+        except FileNotFoundError:
+            pass
+
+
+def get_file_handler(
+    filename: str,
+    max_bytes: int,
+    rotation: str,
+    backup_count: int,
+    compression: str,
+) -> TrafalgarRotatingFileHandler:
+    """
+    The get_file_handler function creates a TrafalgarRotatingFileHandler
+    that writes the log events to the file.
+
+    :param filename: str: The path of the file.
+    :param max_bytes: int: The maximum size of the file, or 0 for no limit.
+    :param rotation: str: NONE, MINUTE, HOUR or DAY.
+    :param backup_count: int: The number of segments kept, or 0 to keep
+            all.
+    :param compression: str: NONE, GZIP or ZSTD.
+    :returns: The file handler.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    return TrafalgarRotatingFileHandler(
+        filename, max_bytes, rotation, backup_count, compression
+    )
+
+
+def get_queue_handler(
+    handler: Handler, queue_size: int, overflow: str
+) -> TrafalgarQueueHandler:
+    """
+    The get_queue_handler function wraps a handler with a
+    TrafalgarQueueHandler, so the given handler only formats and writes log
+    events on the background thread of the listener.
+
+    :param handler: Handler: The handler that writes the log events.
+    :param queue_size: int: The maximum number of log records on the queue.
+    :param overflow: str: The overflow policy (BLOCK, DROP_NEWEST or
+            DROP_OLDEST).
+    :returns: The queue handler.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    return TrafalgarQueueHandler(handler, queue_size, overflow)
+
+
+def handle_batch(
+    logger: logging.Logger, records: Iterable[LogRecord]
+) -> NoReturn:
+    """
+    The handle_batch function passes a batch of log records to the handlers
+    of the logger and of its parents, as the logging package does for each
+    log record, respecting the filters, the levels and the propagation.
+    Stream handlers (and file handlers) write the whole batch with a single
+    write and a single flush, holding their lock only once; any other
+    handler handles each log record as usual.
+
+    :param logger: logging.Logger: The logger of the log records.
+    :param records: Iterable[LogRecord]: The log records of the batch.
+    :returns: Nothing.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    if logger.disabled:
+        return
+
+    records = [record for record in records if logger.filter(record)]
+
+    if not records:
+        return
+
+    handlers = _get_logger_handlers(logger)
+
+    if not handlers:
+        handlers = [logging.lastResort] if logging.lastResort else []
+
+    for handler in handlers:
+        handler_records = [
+            record for record in records if record.levelno >= handler.level
+        ]
+
+        if _writes_to_stream(handler):
+            _write_batch(handler, handler_records)
+        else:
+            for record in handler_records:
+                handler.handle(record)
+
+
+def _get_logger_handlers(logger: logging.Logger) -> list:
+    """
+    The _get_logger_handlers function lists the handlers that receive the
+    log records of the logger: its own handlers and, while it propagates,
+    the handlers of its parents.
+
+    :param logger: logging.Logger: The logger of the log records.
+    :returns: A list of handlers.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    handlers = []
+    current = logger
+
+    while current:
+        handlers.extend(current.handlers)
+
+        if not current.propagate:
+            break
+
+        current = current.parent
+
+    return handlers
+
+
+def _writes_to_stream(handler: Handler) -> bool:
+    """
+    The _writes_to_stream function checks if the handler only writes the
+    formatted log records to its stream, i.e.: it is a StreamHandler or a
+    FileHandler whose emit method was not overridden.
+
+    :param handler: Handler: The handler to be checked.
+    :returns: True if the batch can be written directly to its stream.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    return type(handler).emit in [StreamHandler.emit, FileHandler.emit]
+
+
+def _write_batch(handler: StreamHandler, records: list) -> NoReturn:
+    """
+    The _write_batch function formats the log records that pass the filters
+    of the handler and writes all of them to its stream at once.
+
+    :param handler: StreamHandler: The handler of the log records.
+    :param records: list: The log records of the batch.
+    :returns: Nothing.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    lines = []
+
+    for record in records:
+        if not handler.filter(record):
+            continue
+
+        try:
+            lines.append(handler.format(record) + handler.terminator)
+        except Exception:
+            handler.handleError(record)
+
+    if not lines:
+        return
+
+    start = time.perf_counter_ns() if STATS.enabled else 0
+    handler.acquire()
+
+    try:
+        if handler.stream is None and isinstance(handler, FileHandler):
+            handler.stream = handler._open()
+
+        handler.stream.write("".join(lines))
+        handler.flush()
+    except Exception:
+        handler.handleError(records[-1])
+    finally:
+        handler.release()
+
+    if start:
+        STATS.add_time(WRITE_STAGE, start)
@@ -0,0 +1,577 @@
+import atexit
+import logging
+import time
+from logging import Filter, WARNING, LogRecord
+from threading import Event, Lock, Thread
+from typing import NoReturn, Optional
+
+from trafalgar_log.app import SETTINGS
+from trafalgar_log.core.enums import LogFields
+from trafalgar_log.core.handlers import TRAFALGAR_LOG_CODE
+from trafalgar_log.core.stats import DEDUPLICATED, STATS, SUPPRESSED
+
+RULE_SEPARATOR: str = ","
+VALUE_SEPARATOR: str = "="
+PERIOD_SEPARATOR: str = "/"
+REPEATED: str = "repeated"
+_EPSILON: float = 1e-9
+_MAX_REPEATED_KEYS: int = 4096
+_REPEATED_FIELDS: tuple = tuple(
+    field.value
+    for field in [
+        LogFields.APP,
+        LogFields.CODE_LINE,
+        LogFields.CORRELATION_ID,
+        LogFields.DOMAIN,
+        LogFields.FLOW,
+        LogFields.INSTANCE_ID,
+        LogFields.LOG_CODE,
+        LogFields.SEVERITY,
+    ]
+)
+_RECORD_FIELDS: tuple = (
+    "name",
+    "levelno",
+    "levelname",
+    "pathname",
+    "filename",
+    "module",
+    "funcName",
+    "lineno",
+)
+
+
+class _LogCodeLimit(object):
+    """
+    This is the class of the sampling ratio and of the token bucket of a
+    log_code.
+    Sampling is deterministic: each log event adds the ratio to a credit,
+    and a log event is kept whenever the credit reaches one, so a ratio of
+    0.1 keeps exactly one of every ten log events, starting with the first
+    one.
+    The token bucket holds up to rate tokens and is refilled with rate
+    tokens every period seconds; each kept log event takes a token, and
+    log events are suppressed while the bucket is empty; the period must be
+    positive, or a ValueError is raised.
+
+    :ivar ratio: The ratio of the log events kept by sampling.
+    :ivar credit: The sampling credit.
+    :ivar capacity: The maximum number of tokens, or None without a rate
+        limit.
+    :ivar refill: The number of tokens added per second.
+    :ivar tokens: The tokens on the bucket.
+    :ivar updated: The monotonic time of the last refill.
+    :ivar suppressed: The log events suppressed since the last summary.
+    """
+
+    __slots__ = (
+        "ratio",
+        "credit",
+        "capacity",
+        "refill",
+        "tokens",
+        "updated",
+        "suppressed",
+    )
+
+    def __init__(
+        self,
+        ratio: float = 1.0,
+        rate: Optional[float] = None,
+        period: float = 1.0,
+    ):
+        if not period > 0:
+            raise ValueError(
+                f"The period of a rate limit must be positive, not {period}."
+            )
+
+        self.ratio = ratio
+        self.credit = 1.0 - ratio if ratio else 0.0
+        self.capacity = rate
+        self.refill = rate / period if rate is not None else 0.0
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.suppressed = 0
+
+    def allow(self, now: float) -> bool:
+        """
+        The allow function decides if a log event of the log_code is kept,
+        counting it as suppressed otherwise.
+
+        :param now: float: The monotonic time of the log event.
+        :returns: True if the log event should be logged.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if self.ratio < 1.0:
+            self.credit += self.ratio
+
+            if self.credit < 1.0 - _EPSILON:
+                self.suppressed += 1
+                return False
+
+            self.credit -= 1.0
+
+        if self.capacity is not None:
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self.updated) * self.refill,
+            )
+            self.updated = now
+
+            if self.tokens < 1.0:
+                self.suppressed += 1
+                return False
+
+            self.tokens -= 1.0
+
+        return True
+
+
+class LogLimiter(object):
+    """
+    This is the class that applies the sampling ratios (TRA_LOG_SAMPLING)
+    and the rate limits (TRA_LOG_RATE_LIMITS) of the log_codes. The Logger
+    checks it right after isEnabledFor and before the log record is
+    created, so a suppressed log event costs a dict lookup and a few
+    arithmetic operations, and its payload is never converted. Log_codes
+    without rules cost a single dict lookup.
+    ERROR and CRITICAL log events are not limited, unless
+    TRA_LOG_LIMIT_ERRORS is set.
+    Every summary_interval seconds, on the next limited log event, the
+    limiter logs a warning log event with how many log events of each
+    log_code were suppressed since the previous one; the last summary is
+    logged when the limiter is flushed, at interpreter exit.
+
+    :ivar limits: The _LogCodeLimit of each limited log_code.
+    :ivar summary_interval: The minimum number of seconds between two
+        summaries.
+    :ivar limit_errors: True if ERROR and CRITICAL log events are limited.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        limits: dict,
+        summary_interval: float = 60.0,
+        limit_errors: bool = False,
+    ):
+        self.logger = logger
+        self.limits = limits
+        self.summary_interval = summary_interval
+        self.limit_errors = limit_errors
+        self._next_summary = time.monotonic() + summary_interval
+        self._lock = Lock()
+
+    def allow(self, log_code: str) -> bool:
+        """
+        The allow function decides if a log event of the log_code is kept.
+
+        :param log_code: str: The log_code of the log event.
+        :returns: True if the log event should be logged.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        limit = self.limits.get(log_code)
+
+        if limit is None:
+            return True
+
+        now = time.monotonic()
+
+        with self._lock:
+            allowed = limit.allow(now)
+            summary = now >= self._next_summary
+
+        if summary:
+            self.flush(now)
+        if not allowed and STATS.enabled:
+            STATS.count_dropped(SUPPRESSED)
+
+        return allowed
+
+    def flush(self, now: Optional[float] = None) -> NoReturn:
+        """
+        The flush function logs the summary of the suppressed log events, if
+        any was suppressed since the last summary.
+
+        :param now: float: The monotonic time of the summary.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        now = now or time.monotonic()
+
+        with self._lock:
+            self._next_summary = now + self.summary_interval
+            suppressed = {}
+
+            for log_code, limit in self.limits.items():
+                if limit.suppressed:
+                    suppressed[log_code] = limit.suppressed
+                    limit.suppressed = 0
+
+        if suppressed:
+            self.logger.handle(_get_summary_record(self.logger, suppressed))
+
+
+class _RepeatedEvent(object):
+    """
+    This is the class of a log event being deduplicated: the fields of its
+    first log record that the log record reporting the repetitions needs,
+    and how many times it was repeated since then. The first log record is
+    not kept, so neither its arguments nor its exception, with the frames
+    and the locals of its traceback, outlive it.
+
+    :ivar fields: The attributes of the first log record that are copied,
+        with its formatted log_message.
+    :ivar expires: The monotonic time when the window ends.
+    :ivar repeated: The number of suppressed repetitions.
+    """
+
+    __slots__ = ("fields", "expires", "repeated")
+
+    def __init__(self, record: LogRecord, expires: float):
+        try:
+            message = record.getMessage()
+        except (TypeError, ValueError):
+            message = str(record.msg)
+
+        self.fields = {
+            field: record.__dict__[field]
+            for field in _RECORD_FIELDS + _REPEATED_FIELDS
+            if field in record.__dict__
+        }
+        self.fields["msg"] = message
+        self.expires = expires
+        self.repeated = 0
+
+
+class TrafalgarDeduplicationFilter(Filter):
+    """
+    This is the filter of the logger used when
+    TRA_LOG_DEDUPLICATION_WINDOW is set. When a dependency fails, the same
+    log event (usually an error with its whole stacktrace) may be logged
+    thousands of times per second; the filter logs the first occurrence in
+    full and suppresses its repetitions until the window ends, when a
+    single log event reports how many times it was repeated.
+    Two log records are repetitions when they have the same log_code, the
+    same log_message, the same code_line and the same exception type.
+    Since it is a filter of the logger, the suppressed log records are
+    never formatted, so their payloads are not converted and their
+    stacktraces are not split. Windows that ended are reported by the next
+    log record that passes the filter or by a background thread that sweeps
+    them every window seconds, so a burst followed by silence is still
+    reported soon after its window ends; the thread is started with the
+    first window and stopped when the filter is closed, which is done at
+    interpreter exit or when the filter is replaced.
+
+    :ivar logger: The logger of the filter.
+    :ivar window: The number of seconds of each window.
+    """
+
+    def __init__(self, logger: logging.Logger, window: float):
+        super(TrafalgarDeduplicationFilter, self).__init__()
+        self.logger = logger
+        self.window = window
+        self._events = {}
+        self._next_sweep = time.monotonic() + window
+        self._lock = Lock()
+        self._closed = Event()
+        self._sweeper = None
+
+    def filter(self, record: LogRecord) -> bool:
+        """
+        The filter function decides if the log record is logged: the first
+        occurrence of a log event on a window is, its repetitions are not.
+
+        :param record: LogRecord: The log record of the log event.
+        :returns: True if the log record should be logged.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        key = (
+            record.__dict__.get(LogFields.LOG_CODE.value),
+            record.msg,
+            record.pathname,
+            record.lineno,
+            record.exc_info[0] if record.exc_info else None,
+        )
+        now = time.monotonic()
+        expired = []
+
+        with self._lock:
+            event = self._events.get(key)
+
+            if event is not None and now < event.expires:
+                event.repeated += 1
+
+                if STATS.enabled:
+                    STATS.count_dropped(DEDUPLICATED)
+
+                return False
+
+            if event is not None:
+                expired.append(self._events.pop(key))
+            if now >= self._next_sweep:
+                expired.extend(self._sweep(now))
+            if len(self._events) < _MAX_REPEATED_KEYS:
+                self._events[key] = _RepeatedEvent(record, now + self.window)
+
+        if self._sweeper is None or not self._sweeper.is_alive():
+            self._start_sweeper()
+
+        self._report(expired)
+
+        return True
+
+    def flush(self) -> NoReturn:
+        """
+        The flush function reports the repetitions of every log event being
+        deduplicated and starts new windows for all of them.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        with self._lock:
+            expired = list(self._events.values())
+            self._events.clear()
+
+        self._report(expired)
+
+    def close(self) -> NoReturn:
+        """
+        The close function stops the background thread and reports the
+        repetitions of every log event being deduplicated.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        self._closed.set()
+        self.flush()
+
+    def _start_sweeper(self) -> NoReturn:
+        """
+        The _start_sweeper function starts the background thread that
+        reports the windows that ended. It is started on the first log
+        record, and started again if it is not running anymore, e.g.: on a
+        forked process.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        with self._lock:
+            if self._closed.is_set() or (
+                self._sweeper is not None and self._sweeper.is_alive()
+            ):
+                return
+
+            self._sweeper = Thread(
+                target=self._sweep_periodically,
+                name="TrafalgarDeduplicationFilter",
+                daemon=True,
+            )
+            self._sweeper.start()
+
+    def _sweep_periodically(self) -> NoReturn:
+        """
+        The _sweep_periodically function is the loop of the background
+        thread, which reports the windows that ended every window seconds.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        while not self._closed.wait(self.window):
+            with self._lock:
+                expired = self._sweep(time.monotonic())
+
+            self._report(expired)
+
+    def _sweep(self, now: float) -> list:
+        """
+        The _sweep function removes the log events whose windows ended. It
+        must be called holding the lock.
+
+        :param now: float: The current monotonic time.
+        :returns: A list of the removed _RepeatedEvent.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        self._next_sweep = now + self.window
+        expired = [
+            key for key, event in self._events.items() if now >= event.expires
+        ]
+
+        return [self._events.pop(key) for key in expired]
+
+    def _report(self, events: list) -> NoReturn:
+        """
+        The _report function logs a log event for each repeated log event,
+        passing it straight to the handlers, so it is not filtered again.
+
+        :param events: list: The _RepeatedEvent of the ended windows.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        for event in events:
+            if event.repeated:
+                self.logger.callHandlers(_get_repeated_record(event))
+
+
+def _get_repeated_record(event: _RepeatedEvent) -> LogRecord:
+    """
+    The _get_repeated_record function creates the log record that reports
+    how many times a log event was repeated. It has the level, the log_code,
+    the log_message and the code_line of the first occurrence, but neither
+    its payload nor its stacktrace.
+
+    :param event: _RepeatedEvent: The repeated log event.
+    :returns: The log record.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    record = logging.makeLogRecord(event.fields)
+    record.msg = f"{record.msg} (repeated {event.repeated} times)"
+    record.__dict__[LogFields.PAYLOAD.value] = {REPEATED: event.repeated}
+
+    return record
+
+
+def _get_summary_record(logger: logging.Logger, suppressed: dict) -> LogRecord:
+    """
+    The _get_summary_record function creates the warning log record that
+    reports how many log events of each log_code were suppressed.
+
+    :param logger: logging.Logger: The logger of the log record.
+    :param suppressed: dict: The number of suppressed log events of each
+            log_code.
+    :returns: The log record.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    record = logging.makeLogRecord(
+        {
+            "name": logger.name,
+            "msg": f"{sum(suppressed.values())} log events were suppressed "
+            f"by sampling and rate limits.",
+            "levelno": WARNING,
+            "levelname": logging.getLevelName(WARNING),
+            "pathname": __file__,
+            "filename": "limiter.py",
+            "module": "limiter",
+            "funcName": "flush",
+        }
+    )
+    record.__dict__.update(
+        {
+            LogFields.LOG_CODE.value: TRAFALGAR_LOG_CODE,
+            LogFields.PAYLOAD.value: {"suppressed": suppressed},
+            LogFields.SEVERITY.value: logging.getLevelName(WARNING),
+        }
+    )
+
+    return record
+
+
+def _parse_rules(rules: str) -> dict:
+    """
+    The _parse_rules function splits a setting of rules, e.g.:
+    "Row loaded=0.1,Cache hit=0.01", into a dict of log_codes and values.
+
+    :param rules: str: The comma separated rules.
+    :returns: A dict with the value of each log_code, as a string.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    parsed = {}
+
+    for rule in rules.split(RULE_SEPARATOR):
+        if rule.strip():
+            log_code, value = rule.rsplit(VALUE_SEPARATOR, 1)
+            parsed[log_code.strip()] = value.strip()
+
+    return parsed
+
+
+def get_limits(sampling: str, rate_limits: str) -> dict:
+    """
+    The get_limits function creates the _LogCodeLimit of each log_code of
+    the sampling and rate limits settings. A sampling rule is a log_code and
+    the ratio of its log events that are kept, e.g.: "Row loaded=0.1"; a
+    rate limit rule is a log_code and the maximum number of its log events
+    per period, in seconds, e.g.: "Row loaded=100/60" (the period is one
+    second when omitted).
+
+    :param sampling: str: The comma separated sampling rules.
+    :param rate_limits: str: The comma separated rate limit rules.
+    :returns: A dict with the _LogCodeLimit of each log_code.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    ratios = _parse_rules(sampling)
+    rates = _parse_rules(rate_limits)
+    limits = {}
+
+    for log_code in {*ratios, *rates}:
+        rate, period = None, 1.0
+
+        if log_code in rates:
+            rate, _, period = rates[log_code].partition(PERIOD_SEPARATOR)
+            rate, period = float(rate), float(period or 1.0)
+
+        limits[log_code] = _LogCodeLimit(
+            float(ratios.get(log_code, 1.0)), rate, period
+        )
+
+    return limits
+
+
+def get_limiter(logger: logging.Logger) -> LogLimiter:
+    """
+    The get_limiter function creates the LogLimiter of the logger from the
+    TRA_LOG_SAMPLING, TRA_LOG_RATE_LIMITS, TRA_LOG_LIMITS_SUMMARY_INTERVAL
+    and TRA_LOG_LIMIT_ERRORS settings.
+
+    :param logger: logging.Logger: The logger of the summaries.
+    :returns: The limiter.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    return LogLimiter(
+        logger,
+        get_limits(SETTINGS.get("SAMPLING"), SETTINGS.get("RATE_LIMITS")),
+        SETTINGS.get("LIMITS_SUMMARY_INTERVAL"),
+        SETTINGS.get("LIMIT_ERRORS"),
+    )
+
+
+def set_deduplication_filter(logger: logging.Logger) -> NoReturn:
+    """
+    The set_deduplication_filter function replaces the
+    TrafalgarDeduplicationFilter of the logger, reporting the repetitions of
+    the previous one, by a new one with the TRA_LOG_DEDUPLICATION_WINDOW
+    setting, unless it is 0. Only the current filter is closed at
+    interpreter exit, so the replaced ones are not kept alive by atexit.
+
+    :param logger: logging.Logger: The logger of the filter.
+    :returns: Nothing.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    for log_filter in list(logger.filters):
+        if isinstance(log_filter, TrafalgarDeduplicationFilter):
+            logger.removeFilter(log_filter)
+            atexit.unregister(log_filter.close)
+            log_filter.close()
+
+    window = SETTINGS.get("DEDUPLICATION_WINDOW")
+
+    if window:
+        log_filter = TrafalgarDeduplicationFilter(logger, window)
+        logger.addFilter(log_filter)
+        atexit.register(log_filter.close)
@@ -1,18 +1,130 @@
+import atexit
+import inspect
 import logging
-from logging import INFO, DEBUG, WARN, ERROR, CRITICAL
-from typing import NoReturn
+import sys
+import time
+from contextvars import ContextVar
+from functools import wraps
+from logging import INFO, DEBUG, WARN, ERROR, CRITICAL, NOTSET
+from threading import Lock
+from types import FrameType
+from typing import Callable, Iterable, NoReturn, Optional, Union
 from uuid import uuid4, UUID
 
+from trafalgar_log.app import SETTINGS
+from trafalgar_log.core.handlers import handle_batch
+from trafalgar_log.core.limiter import get_limiter
+from trafalgar_log.core.stats import LOG_STAGE, STATS
 from trafalgar_log.core.utils import (
+    APP,
+    CORRELATION_ID,
+    DOMAIN,
+    FLOW,
+    INSTANCE_ID,
     LOG_CODE,
     PAYLOAD,
     SEVERITY,
+    apply_settings,
     initialize_logger,
-    get_payload,
+    LazyPayload,
     NOT_SET,
+    _ensure_settings,
+    _get_app_name,
+    _get_caller,
+    _get_domain,
 )
 
-_logger = initialize_logger()
+
+class _Uninitialized(object):
+    """
+    This is the placeholder of _logger and _limiter until the first log
+    call, so importing Trafalgar Log doesn't create the logger and its
+    handlers. Getting or setting any attribute of the placeholder
+    initializes them and is done on the initialized object, which also
+    replaces the placeholder on the module.
+
+    :ivar name: The name of the placeholder on the module.
+    """
+
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        object.__setattr__(self, "name", name)
+
+    def __getattr__(self, attribute: str) -> object:
+        return getattr(_initialize()[self.name], attribute)
+
+    def __setattr__(self, attribute: str, value: object) -> NoReturn:
+        setattr(_initialize()[self.name], attribute, value)
+
+
+def _initialize() -> dict:
+    """
+    The _initialize function creates the logger of Trafalgar Log and its
+    LogLimiter, only once, and sets them on the module. Neither is set
+    until both are created, so a failure is raised again by the next call
+    instead of leaving the module half initialized.
+
+    :returns: A dict with the logger and the LogLimiter by their names.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    global _logger, _limiter
+
+    with _initialize_lock:
+        if not _initialized:
+            logger = initialize_logger()
+            limiter = get_limiter(logger)
+            atexit.register(limiter.flush)
+            _initialized.update(_logger=logger, _limiter=limiter)
+            _refresh_level()
+
+    if isinstance(_logger, _Uninitialized):
+        _logger = _initialized["_logger"]
+    if isinstance(_limiter, _Uninitialized):
+        _limiter = _initialized["_limiter"]
+
+    return _initialized
+
+
+def _refresh_level() -> NoReturn:
+    """
+    The _refresh_level function caches the level of the logger of Trafalgar
+    Log, so the log methods skip the disabled levels with an integer
+    comparison, before even calling isEnabledFor. The cache is only trusted
+    to reject a level while the level of the logger is still the cached
+    one; when it is changed by anything but Logger.set_level (its setLevel,
+    logging.config, etc.), isEnabledFor decides until the next refresh. A
+    logger without a level of its own inherits it, so its cache is NOTSET
+    and never rejects. The logging.disable level is not cached, since it
+    may be lowered again at any time; isEnabledFor checks it. Until the
+    logger is created, every level passes, so the first log call creates
+    it.
+
+    :returns: Nothing.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    global _level
+
+    logger = _initialized.get("_logger")
+    _level = NOTSET if logger is None else logger.level
+
+
+_initialized: dict = {}
+_initialize_lock: Lock = Lock()
+_logger = _Uninitialized("_logger")
+_limiter = _Uninitialized("_limiter")
+_level: int = NOTSET
+_correlation_id: ContextVar = ContextVar(CORRELATION_ID)
+_flow: ContextVar = ContextVar(FLOW)
+_instance_id: ContextVar = ContextVar(INSTANCE_ID)
+_scope_tokens: ContextVar = ContextVar("scope_tokens", default=())
+BATCH_SIZE: int = 1000
+
+if SETTINGS.peek("COLLECTOR"):
+    # the collector must be started before the application forks
+    _initialize()
 
 
 class Logger(object):
@@ -22,7 +134,29 @@ class Logger(object):
     There are five log methods, each one representing a log level of the
     logging package: INFO, DEBUG, WARN, ERROR and CRITICAL.
     There are other six methods that should be used to set or retrieve the
-    optional fields correlation_id, flow and instance_id.
+    optional fields correlation_id, flow and instance_id, which are stored
+    on context variables, so each thread and each asyncio task has its own
+    values; the scope method returns a context manager (that can also be
+    used as a decorator) that sets them only while a request or a task is
+    being executed.
+    For loops that log many similar events, the batch method returns a
+    LogBatch that collects log events and writes them together, and the
+    info_many method logs many INFO log events at once.
+    The log events of the log_codes with sampling ratios (TRA_LOG_SAMPLING)
+    or rate limits (TRA_LOG_RATE_LIMITS) are checked by a LogLimiter right
+    after the level, before the log record is created, so the suppressed
+    ones cost almost nothing.
+    With TRA_LOG_STATS set, the stats method returns the latency of each
+    stage of the log events and their counters (see TrafalgarStats).
+    The level of the logger is cached on the module, so a log method of a
+    disabled level returns after two integer comparisons; the cache is
+    refreshed by set_level, and it is ignored while the level of the logger
+    differs from it, so the level can also be changed by the setLevel of
+    the logger or by logging.config, and logging.disable is honoured, since
+    isEnabledFor is called for the levels that are not rejected.
+    The logger of Trafalgar Log and its LogLimiter are created on the first
+    log call, not on import, except with TRA_LOG_COLLECTOR set, since the
+    collector must be started before the application forks.
     The _do_log function should never be called directly, that is why its
     name starts with an underscore, emulating a "private" behaviour.
     Here are the list of the available functions:
@@ -34,6 +168,8 @@ class Logger(object):
     :func error(log_code: str, log_message: str, payload: object) -> NoReturn
     :func critical(log_code: str, log_message: str, payload: object) ->
     NoReturn
+    :func info_many(events: Iterable[tuple]) -> NoReturn
+    :func batch(size: int) -> LogBatch
 
     Optional log fields functions:
     :func set_correlation_id(correlation_id: str) -> NoReturn
@@ -42,11 +178,15 @@ class Logger(object):
     :func get_flow() -> str:
     :func set_instance_id(instance_id: str) -> NoReturn
     :func get_instance_id() -> str
-    """
+    :func scope(correlation_id: str, flow: str, instance_id: str) -> LogScope
 
-    correlation_id: str
-    flow: str
-    instance_id: str
+    Stats functions:
+    :func stats(reset: bool) -> dict
+
+    Settings functions:
+    :func reload_settings() -> NoReturn
+    :func set_level(level: Union[int, str]) -> NoReturn
+    """
 
     @staticmethod
     def info(log_code: str, log_message: str, payload: object) -> NoReturn:
@@ -64,7 +204,11 @@ class Logger(object):
         :doc-author: Trelent and this project contributors.
         """
 
-        if _logger.isEnabledFor(INFO):
+        if (
+            (INFO >= _level or _logger.level != _level)
+            and _logger.isEnabledFor(INFO)
+            and _limiter.allow(log_code)
+        ):
             Logger._do_log(INFO, log_code, log_message, payload)
 
     @staticmethod
@@ -83,7 +227,11 @@ class Logger(object):
         :doc-author: Trelent and this project contributors.
         """
 
-        if _logger.isEnabledFor(DEBUG):
+        if (
+            (DEBUG >= _level or _logger.level != _level)
+            and _logger.isEnabledFor(DEBUG)
+            and _limiter.allow(log_code)
+        ):
             Logger._do_log(DEBUG, log_code, log_message, payload)
 
     @staticmethod
@@ -102,7 +250,11 @@ class Logger(object):
         :doc-author: Trelent and this project contributors.
         """
 
-        if _logger.isEnabledFor(WARN):
+        if (
+            (WARN >= _level or _logger.level != _level)
+            and _logger.isEnabledFor(WARN)
+            and _limiter.allow(log_code)
+        ):
             Logger._do_log(WARN, log_code, log_message, payload)
 
     @staticmethod
@@ -121,7 +273,11 @@ class Logger(object):
         :doc-author: Trelent and this project contributors.
         """
 
-        if _logger.isEnabledFor(ERROR):
+        if (
+            (ERROR >= _level or _logger.level != _level)
+            and _logger.isEnabledFor(ERROR)
+            and (not _limiter.limit_errors or _limiter.allow(log_code))
+        ):
             Logger._do_log(ERROR, log_code, log_message, payload)
 
     @staticmethod
@@ -140,9 +296,64 @@ class Logger(object):
         :doc-author: Trelent and this project contributors.
         """
 
-        if _logger.isEnabledFor(CRITICAL):
+        if (
+            (CRITICAL >= _level or _logger.level != _level)
+            and _logger.isEnabledFor(CRITICAL)
+            and (not _limiter.limit_errors or _limiter.allow(log_code))
+        ):
             Logger._do_log(CRITICAL, log_code, log_message, payload)
 
+    @staticmethod
+    def info_many(events: Iterable[tuple]) -> NoReturn:
+        """
+        The info_many function logs many log events with the INFO level at
+        once, e.g.: one for each row processed by an ETL job. All of them
+        share the same optional fields and code_line and are written
+        together by a LogBatch.
+
+            Logger.info_many(
+                ("Database", f"Row {row.id} loaded.", row) for row in rows
+            )
+
+        :param events: Iterable[tuple]: The log events, each one as a tuple
+                of log_code, log_message and payload.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if (
+            (INFO >= _level or _logger.level != _level)
+            and _logger.isEnabledFor(INFO)
+        ):
+            with LogBatch() as batch:
+                caller = sys._getframe(1)
+
+                for log_code, log_message, payload in events:
+                    if _limiter.allow(log_code):
+                        batch._add(
+                            INFO, log_code, log_message, payload, caller
+                        )
+
+    @staticmethod
+    def batch(size: int = BATCH_SIZE) -> "LogBatch":
+        """
+        The batch function returns a LogBatch, a context manager with the
+        same log methods of the Logger class that collects the log events
+        and writes them together when it exits, or whenever it holds size
+        log events:
+
+            with Logger.batch() as batch:
+                for row in rows:
+                    batch.info("Database", f"Row {row.id} loaded.", row)
+
+        :param size: int: The maximum number of log events held by the
+                batch before they are written.
+        :returns: A LogBatch object.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        return LogBatch(size)
+
     @staticmethod
     def set_correlation_id(correlation_id: str) -> NoReturn:
         """
@@ -153,6 +364,8 @@ class Logger(object):
         It can be retrieved from the context object using get_correlation_id().
         If no correlation id has been set, it will generate a new one on each
         call.
+        The correlation_id is set on the current context, so it does not
+        affect other threads nor other asyncio tasks.
 
         :param correlation_id: str: Set the correlation_id for the current
                 log event.
@@ -160,18 +373,7 @@ class Logger(object):
         :doc-author: Trelent and this project contributors.
         """
 
-        try:
-            UUID(correlation_id, version=4)
-        except (ValueError, AttributeError):
-            old_correlation_id = correlation_id
-            correlation_id = str(uuid4())
-            Logger.warn(
-                log_code="Trafalgar Log",
-                log_message=f"Invalid correlation_id ({old_correlation_id}). "
-                f"It should be a valid uuid4.",
-                payload=f"New correlation_id: {correlation_id}",
-            )
-        Logger.correlation_id = correlation_id
+        _correlation_id.set(_validate_correlation_id(correlation_id))
 
     @staticmethod
     def get_correlation_id() -> str:
@@ -185,8 +387,8 @@ class Logger(object):
         """
 
         try:
-            return Logger.correlation_id
-        except AttributeError:
+            return _correlation_id.get()
+        except LookupError:
             correlation_id = str(uuid4())
             Logger.set_correlation_id(correlation_id)
 
@@ -195,15 +397,15 @@ class Logger(object):
     @staticmethod
     def set_flow(flow: str) -> NoReturn:
         """
-        The set_flow function sets the global variable Logger.flow to the
-        value of flow.
+        The set_flow function sets the flow of the current context (thread
+        or asyncio task) to the value of flow.
 
         :param flow: str: Set the flow for the current log event.
         :returns: Nothing.
         :doc-author: Trelent and this project contributors.
         """
 
-        Logger.flow = flow
+        _flow.set(flow)
 
     @staticmethod
     def get_flow() -> str:
@@ -216,22 +418,22 @@ class Logger(object):
         """
 
         try:
-            return Logger.flow
-        except AttributeError:
+            return _flow.get()
+        except LookupError:
             return NOT_SET
 
     @staticmethod
     def set_instance_id(instance_id: str) -> NoReturn:
         """
-        The set_instance_id function sets the global variable
-        Logger.instance_id to the value of instance_id.
+        The set_instance_id function sets the instance_id of the current
+        context (thread or asyncio task) to the value of instance_id.
 
         :param instance_id: str: Set the instance_id for the current log event.
         :returns: Nothing.
         :doc-author: Trelent and this project contributors.
         """
 
-        Logger.instance_id = instance_id
+        _instance_id.set(instance_id)
 
     @staticmethod
     def get_instance_id() -> str:
@@ -245,10 +447,109 @@ class Logger(object):
         """
 
         try:
-            return Logger.instance_id
-        except AttributeError:
+            return _instance_id.get()
+        except LookupError:
             return NOT_SET
 
+    @staticmethod
+    def scope(
+        correlation_id: Optional[str] = None,
+        flow: Optional[str] = None,
+        instance_id: Optional[str] = None,
+    ) -> "LogScope":
+        """
+        The scope function returns a context manager that sets the optional
+        fields only while a request or a task is being executed, restoring
+        the previous values at its end. It can also decorate a function or a
+        coroutine function, so each call runs in its own scope:
+
+            with Logger.scope(correlation_id=request_correlation_id):
+                ...
+
+            @Logger.scope(flow="orders")
+            async def handle_order(order): ...
+
+        :param correlation_id: str: The correlation_id of the scope; if it
+                is not set, a new one is generated each time the scope is
+                entered.
+        :param flow: str: The flow of the scope; if it is not set, the
+                current flow is kept.
+        :param instance_id: str: The instance_id of the scope; if it is not
+                set, the current instance_id is kept.
+        :returns: A LogScope object.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        return LogScope(correlation_id, flow, instance_id)
+
+    @staticmethod
+    def stats(reset: bool = False) -> dict:
+        """
+        The stats function returns a snapshot of the self-instrumentation of
+        Trafalgar Log (TRA_LOG_STATS): the latency histograms of the log,
+        payload, format and write stages, in microseconds, and the number
+        of log events by level and log_code, of bytes formatted and of log
+        events dropped, suppressed or deduplicated. When TRA_LOG_STATS is
+        not set, nothing is recorded and the snapshot is empty.
+
+        :param reset: bool: True to reset the stats after the snapshot.
+        :returns: A dict with the stats.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        return STATS.snapshot(reset)
+
+    @staticmethod
+    def reload_settings() -> NoReturn:
+        """
+        The reload_settings function reads the settings again, for the rare
+        cases where they change while the application runs (e.g.: the
+        TRA_LOG_ environment variables are set after Trafalgar Log is
+        imported), and applies them: the app and domain fields, the fields
+        to shamble, the limits of the payloads, the stacktrace policy and
+        the stats. The logger and its LogLimiter are created again on the
+        next log call, after the log events suppressed by the previous
+        LogLimiter are reported.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        global _logger, _limiter
+
+        SETTINGS.reload()
+        apply_settings()
+
+        with _initialize_lock:
+            limiter = _initialized.get("_limiter")
+            _initialized.clear()
+            _logger = _Uninitialized("_logger")
+            _limiter = _Uninitialized("_limiter")
+            _refresh_level()
+
+        if limiter is not None:
+            limiter.flush()
+        if SETTINGS.get("COLLECTOR"):
+            _initialize()
+
+    @staticmethod
+    def set_level(level: Union[int, str]) -> NoReturn:
+        """
+        The set_level function changes the level of the logger of Trafalgar
+        Log, which is set by TRA_LOG_HAKI, while the application runs.
+
+        :param level: Union[int, str]: The level, e.g.: logging.DEBUG or
+                "DEBUG".
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if isinstance(level, str):
+            level = level.upper()
+
+        _initialize()["_logger"].setLevel(level)
+        _refresh_level()
+
     @staticmethod
     def _do_log(
         level: int,
@@ -262,14 +563,19 @@ class Logger(object):
         logging details and provide a single location for managing logging
         settings.
         The function adds extra fields (log_code, payload and severity) to
-        the log record.
-        If the logging level is ERROR or CRITICAL, the log event uses the
-        method "exception" so the logging mechanism can capture the
-        exception stacktrace automatically and set the stack level to 4,
-        so it can get the real caller of the log event.
-        If the logging level is not ERROR or CRITICAL, the log event uses
-        the method "log" and set the stack level to 3, so it can get the real
-        caller of the log event.
+        the log record, along with the current flow, correlation_id and
+        instance_id, so the log event keeps them even if it is formatted
+        later on another thread. The payload is wrapped by a LazyPayload, so
+        it is only converted to JSON if a handler formats the log event.
+        The log record is created and handled directly, as the logging
+        package does, but its caller, which is always two frames above, is
+        taken by _get_caller instead of findCaller walking the frames (or
+        not taken at all if TRA_LOG_CODE_LINE is false).
+        If the logging level is ERROR or CRITICAL, the log record also gets
+        the exception being handled, as the method "exception" of the
+        logging package does, so its stacktrace is written.
+        When TRA_LOG_STATS is set, it also records the log stage and counts
+        the log event.
 
         :param level: int: Determine the level of the log message
         :param log_code: str: A string code that identifies the type of log
@@ -278,24 +584,354 @@ class Logger(object):
         :param log_message: str: The message to be logged.
         :param payload: object: An object containing additional information
                 about this specific occurrence of an event. If the payload
-                is an exception, it converts it to string to avoid infinity
-                recursive conversion.
+                is an exception, it converts it to string right away to
+                avoid infinity recursive conversion.
         :returns: Nothing.
         :doc-author: Trelent and this project contributors.
         """
 
+        start = time.perf_counter_ns() if STATS.enabled else 0
+
         if isinstance(payload, BaseException):
             payload = str(payload)
 
-        extra_fields = {
-            "extra": {
-                LOG_CODE: log_code,
-                PAYLOAD: get_payload(payload),
-                SEVERITY: logging.getLevelName(level),
-            }
+        pathname, lineno, func_name = _get_caller(2)
+        extra = {
+            LOG_CODE: log_code,
+            PAYLOAD: LazyPayload(payload),
+            SEVERITY: logging.getLevelName(level),
+            FLOW: Logger.get_flow(),
+            CORRELATION_ID: Logger.get_correlation_id(),
+            INSTANCE_ID: Logger.get_instance_id(),
         }
 
-        if level in [ERROR, CRITICAL]:
-            _logger.exception(log_message, **extra_fields, stacklevel=4)
+        _logger.handle(
+            _logger.makeRecord(
+                _logger.name,
+                level,
+                pathname,
+                lineno,
+                log_message,
+                None,
+                sys.exc_info() if level in [ERROR, CRITICAL] else None,
+                func_name,
+                extra,
+            )
+        )
+
+        if start:
+            STATS.add_time(LOG_STAGE, start)
+            STATS.count_event(logging.getLevelName(level), log_code)
+            STATS.report(_logger)
+
+
+class LogScope(object):
+    """
+    This is the class returned by Logger.scope. While a LogScope is entered,
+    the optional fields given to it are set on the current context; when it
+    exits, the previous values are restored. Used as a decorator, it enters
+    a new LogScope on each call of the decorated function or coroutine
+    function.
+    The tokens that restore the previous values are pushed on a stack kept
+    on a ContextVar of the module, so the same LogScope can be entered by
+    many threads and tasks at once, each one restoring its own values, and
+    no ContextVar is created per LogScope or per call.
+    """
+
+    def __init__(
+        self,
+        correlation_id: Optional[str] = None,
+        flow: Optional[str] = None,
+        instance_id: Optional[str] = None,
+    ):
+        self.correlation_id = correlation_id
+        self.flow = flow
+        self.instance_id = instance_id
+
+    def __enter__(self) -> "LogScope":
+        tokens = [
+            _correlation_id.set(
+                _validate_correlation_id(self.correlation_id)
+                if self.correlation_id is not None
+                else str(uuid4())
+            )
+        ]
+
+        if self.flow is not None:
+            tokens.append(_flow.set(self.flow))
+        if self.instance_id is not None:
+            tokens.append(_instance_id.set(self.instance_id))
+
+        tokens.append(_scope_tokens.set(_scope_tokens.get() + (tokens,)))
+
+        return self
+
+    def __exit__(self, *_) -> NoReturn:
+        for token in reversed(_scope_tokens.get()[-1]):
+            token.var.reset(token)
+
+    def __call__(self, function: Callable) -> Callable:
+        if inspect.iscoroutinefunction(function):
+
+            @wraps(function)
+            async def wrapper(*args, **kwargs):
+                with self:
+                    return await function(*args, **kwargs)
+
         else:
-            _logger.log(level, log_message, **extra_fields, stacklevel=3)
+
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self:
+                    return function(*args, **kwargs)
+
+        return wrapper
+
+
+class LogBatch(object):
+    """
+    This is the class returned by Logger.batch. It has the same log methods
+    of the Logger class, but, instead of writing each log event right away,
+    it collects them and passes them together to the handlers when it exits
+    or when it holds size log events; stream handlers write all of them with
+    a single write.
+    The shared fields (app, domain, flow, correlation_id and instance_id)
+    are computed only once, when the LogBatch is created, while log_code,
+    log_message, payload (and its shambling) and code_line are still set
+    for each log event.
+    """
+
+    def __init__(self, size: int = BATCH_SIZE):
+        self.size = size
+        self._records = []
+        _ensure_settings()
+        self._context = {
+            APP: _get_app_name(),
+            DOMAIN: _get_domain(),
+            FLOW: Logger.get_flow(),
+            CORRELATION_ID: Logger.get_correlation_id(),
+            INSTANCE_ID: Logger.get_instance_id(),
+        }
+
+    def __enter__(self) -> "LogBatch":
+        return self
+
+    def __exit__(self, *_) -> NoReturn:
+        self.flush()
+
+    def info(
+        self, log_code: str, log_message: str, payload: object
+    ) -> NoReturn:
+        """
+        The info function adds a log event with the INFO level to the
+        batch, if the level is enabled and the log event is not suppressed
+        by sampling or rate limits.
+
+        :param log_code: str: A string code that identifies the type of log
+                being performed.
+        :param log_message: str: The message to be logged.
+        :param payload: object: An object containing additional information
+                about this specific occurrence of an event.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if (
+            (INFO >= _level or _logger.level != _level)
+            and _logger.isEnabledFor(INFO)
+            and _limiter.allow(log_code)
+        ):
+            self._add(INFO, log_code, log_message, payload)
+
+    def debug(
+        self, log_code: str, log_message: str, payload: object
+    ) -> NoReturn:
+        """
+        The debug function adds a log event with the DEBUG level to the
+        batch, if the level is enabled and the log event is not suppressed
+        by sampling or rate limits.
+
+        :param log_code: str: A string code that identifies the type of log
+                being performed.
+        :param log_message: str: The message to be logged.
+        :param payload: object: An object containing additional information
+                about this specific occurrence of an event.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if (
+            (DEBUG >= _level or _logger.level != _level)
+            and _logger.isEnabledFor(DEBUG)
+            and _limiter.allow(log_code)
+        ):
+            self._add(DEBUG, log_code, log_message, payload)
+
+    def warn(
+        self, log_code: str, log_message: str, payload: object
+    ) -> NoReturn:
+        """
+        The warn function adds a log event with the WARNING level to the
+        batch, if the level is enabled and the log event is not suppressed
+        by sampling or rate limits.
+
+        :param log_code: str: A string code that identifies the type of log
+                being performed.
+        :param log_message: str: The message to be logged.
+        :param payload: object: An object containing additional information
+                about this specific occurrence of an event.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if (
+            (WARN >= _level or _logger.level != _level)
+            and _logger.isEnabledFor(WARN)
+            and _limiter.allow(log_code)
+        ):
+            self._add(WARN, log_code, log_message, payload)
+
+    def error(
+        self, log_code: str, log_message: str, payload: object
+    ) -> NoReturn:
+        """
+        The error function adds a log event with the ERROR level to the
+        batch, if the level is enabled and the log event is not suppressed
+        by sampling or rate limits.
+        Sampling and rate limits only apply to it when TRA_LOG_LIMIT_ERRORS
+        is set.
+
+        :param log_code: str: A string code that identifies the type of log
+                being performed.
+        :param log_message: str: The message to be logged.
+        :param payload: object: An object containing additional information
+                about this specific occurrence of an event.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if (
+            (ERROR >= _level or _logger.level != _level)
+            and _logger.isEnabledFor(ERROR)
+            and (not _limiter.limit_errors or _limiter.allow(log_code))
+        ):
+            self._add(ERROR, log_code, log_message, payload)
+
+    def critical(
+        self, log_code: str, log_message: str, payload: object
+    ) -> NoReturn:
+        """
+        The critical function adds a log event with the CRITICAL level to the
+        batch, if the level is enabled and the log event is not suppressed
+        by sampling or rate limits.
+        Sampling and rate limits only apply to it when TRA_LOG_LIMIT_ERRORS
+        is set.
+
+        :param log_code: str: A string code that identifies the type of log
+                being performed.
+        :param log_message: str: The message to be logged.
+        :param payload: object: An object containing additional information
+                about this specific occurrence of an event.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if (
+            (CRITICAL >= _level or _logger.level != _level)
+            and _logger.isEnabledFor(CRITICAL)
+            and (not _limiter.limit_errors or _limiter.allow(log_code))
+        ):
+            self._add(CRITICAL, log_code, log_message, payload)
+
+    def flush(self) -> NoReturn:
+        """
+        The flush function passes the log events collected so far to the
+        handlers.
+
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        records, self._records = self._records, []
+
+        if records:
+            handle_batch(_logger, records)
+
+    def _add(
+        self,
+        level: int,
+        log_code: str,
+        log_message: str,
+        payload: object,
+        caller: Optional[FrameType] = None,
+    ) -> NoReturn:
+        """
+        The _add function creates the log record of a log event of the batch,
+        as Logger._do_log does, but with the shared fields of the batch.
+        ERROR and CRITICAL log events capture the exception being handled.
+
+        :param level: int: The level of the log event.
+        :param log_code: str: The log_code of the log event.
+        :param log_message: str: The message of the log event.
+        :param payload: object: The payload of the log event.
+        :param caller: FrameType: The frame of the caller of the log event;
+                by default, the caller of the log method of the batch.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if isinstance(payload, BaseException):
+            payload = str(payload)
+
+        pathname, lineno, func_name = _get_caller(2, caller)
+        extra = {
+            LOG_CODE: log_code,
+            PAYLOAD: LazyPayload(payload),
+            SEVERITY: logging.getLevelName(level),
+            **self._context,
+        }
+
+        self._records.append(
+            _logger.makeRecord(
+                _logger.name,
+                level,
+                pathname,
+                lineno,
+                log_message,
+                None,
+                sys.exc_info() if level in [ERROR, CRITICAL] else None,
+                func_name,
+                extra,
+            )
+        )
+
+        if STATS.enabled:
+            STATS.count_event(extra[SEVERITY], log_code)
+        if len(self._records) >= self.size:
+            self.flush()
+
+
+def _validate_correlation_id(correlation_id: str) -> str:
+    """
+    The _validate_correlation_id function checks if the correlation_id is a
+    valid uuid4. If it is not, a new correlation_id is generated and a
+    warning is logged.
+
+    :param correlation_id: str: The correlation_id to be validated.
+    :returns: The correlation_id or a new one if it is invalid.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    try:
+        UUID(correlation_id, version=4)
+    except (ValueError, AttributeError, TypeError):
+        old_correlation_id = correlation_id
+        correlation_id = str(uuid4())
+        Logger.warn(
+            log_code="Trafalgar Log",
+            log_message=f"Invalid correlation_id ({old_correlation_id}). "
+            f"It should be a valid uuid4.",
+            payload=f"New correlation_id: {correlation_id}",
+        )
+
+    return correlation_id
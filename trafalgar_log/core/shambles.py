@@ -0,0 +1,218 @@
+import fnmatch
+import re
+from typing import Iterable, NoReturn
+
+REGEX_PREFIX: str = "re:"
+_GLOB_CHARACTERS: str = "*?["
+_MAX_MEMO: int = 4096
+
+
+class _PathNode(object):
+    """
+    This is the class of the nodes of the trie of the dotted paths of a
+    ShambleMatcher. Each node is a key of a path; the children are the next
+    keys, exact (lower case) or glob patterns.
+
+    :ivar children: The children of exact keys, by their lower case names.
+    :ivar patterns: The children of glob keys, as (regex, node) tuples.
+    :ivar terminal: True if the node is the last key of a path.
+    """
+
+    __slots__ = ("children", "patterns", "terminal")
+
+    def __init__(self):
+        self.children = {}
+        self.patterns = []
+        self.terminal = False
+
+    def add(self, key: str) -> "_PathNode":
+        """
+        The add function returns the child of the node for the key, creating
+        it if it does not exist.
+
+        :param key: str: The key of the path, in lower case.
+        :returns: The child node.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if not _is_glob(key):
+            return self.children.setdefault(key, _PathNode())
+
+        for regex, node in self.patterns:
+            if regex.pattern == fnmatch.translate(key):
+                return node
+
+        node = _PathNode()
+        self.patterns.append((_compile_glob(key), node))
+
+        return node
+
+
+class ShambleMatcher(object):
+    """
+    This is the class that decides which fields of a payload are shambled.
+    The fields of TRA_LOG_SHAMBLES (and the default ones) are compiled only
+    once into:
+    - a frozenset of exact keys, e.g.: "password";
+    - a single regex for the glob patterns, e.g.: "*_token", and for the
+      regular expressions prefixed with "re:", e.g.: "re:^card_\\d+$";
+    - a trie of dotted paths, e.g.: "card.number", which shambles the
+      "number" key only when it is nested on a "card" key, wherever the
+      "card" key is on the payload.
+    Keys and globs are case-insensitive; regular expressions are used as
+    they are. Whether a key is shambled by an exact key, a glob or a
+    regular expression is memoized, so each key costs a single dict lookup
+    after the first time it is seen.
+
+    :ivar keys: The exact keys, in lower case.
+    :ivar pattern: The regex of the globs and regular expressions, if any.
+    :ivar root: The root of the trie of dotted paths.
+    :ivar has_paths: True if there is any dotted path.
+    :ivar memo: The memo of the keys already checked.
+    """
+
+    __slots__ = ("keys", "pattern", "root", "has_paths", "memo")
+
+    def __init__(self, fields: Iterable[str]):
+        keys = set()
+        patterns = []
+        self.root = _PathNode()
+        self.has_paths = False
+        self.memo = {}
+
+        for field in fields:
+            field = field.strip()
+
+            if not field:
+                continue
+            if field.startswith(REGEX_PREFIX):
+                patterns.append(field[len(REGEX_PREFIX):])
+                continue
+
+            field = field.lower()
+
+            if "." in field:
+                keys.add(field)
+                self._add_path(field.split("."))
+            elif _is_glob(field):
+                patterns.append(f"\\A(?i:{fnmatch.translate(field)})")
+            else:
+                keys.add(field)
+
+        self.keys = frozenset(keys)
+        self.pattern = (
+            re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+            if patterns
+            else None
+        )
+
+    def is_shambled(self, key: str) -> bool:
+        """
+        The is_shambled function checks if the values of a key should be
+        shambled by an exact key, a glob or a regular expression, wherever
+        the key is.
+
+        :param key: str: The key to be checked.
+        :returns: True if the values of the key should be shambled.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        shambled = self.memo.get(key)
+
+        if shambled is None:
+            shambled = key.lower() in self.keys or bool(
+                self.pattern and self.pattern.search(key)
+            )
+
+            if len(self.memo) < _MAX_MEMO:
+                self.memo[key] = shambled
+
+        return shambled
+
+    def descend(self, nodes: tuple, key: str) -> tuple:
+        """
+        The descend function follows the trie of dotted paths from the
+        nodes of a dictionary to its key, since a path can start on any
+        dictionary.
+
+        :param nodes: tuple: The nodes of the paths that reached the
+                dictionary.
+        :param key: str: The key of the dictionary.
+        :returns: A tuple with True if a path ends on the key and the nodes
+                of the paths that reached the value of the key.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        lower_key = key.lower()
+        shambled = False
+        children = []
+
+        for node in (self.root, *nodes):
+            child = node.children.get(lower_key)
+
+            if child is not None:
+                shambled = shambled or child.terminal
+                children.append(child)
+
+            for regex, child in node.patterns:
+                if regex.match(key):
+                    shambled = shambled or child.terminal
+                    children.append(child)
+
+        return shambled, tuple(children)
+
+    def _add_path(self, keys: list) -> NoReturn:
+        """
+        The _add_path function adds a dotted path to the trie.
+
+        :param keys: list: The keys of the path, in lower case.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        node = self.root
+
+        for key in keys:
+            node = node.add(key)
+
+        node.terminal = True
+        self.has_paths = True
+
+
+def _is_glob(field: str) -> bool:
+    """
+    The _is_glob function checks if a field is a glob pattern.
+
+    :param field: str: The field of TRA_LOG_SHAMBLES.
+    :returns: True if the field has any of the glob characters: *, ? or [.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    return any(character in field for character in _GLOB_CHARACTERS)
+
+
+def _compile_glob(field: str) -> re.Pattern:
+    """
+    The _compile_glob function compiles a glob pattern to a case-insensitive
+    regex.
+
+    :param field: str: The glob pattern.
+    :returns: The compiled regex.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    return re.compile(fnmatch.translate(field), re.IGNORECASE)
+
+
+def compile_shambles(fields: Iterable[str]) -> ShambleMatcher:
+    """
+    The compile_shambles function compiles the fields that should be
+    shambled into a ShambleMatcher.
+
+    :param fields: Iterable[str]: The fields, e.g.: the default ones and the
+            ones of TRA_LOG_SHAMBLES.
+    :returns: The ShambleMatcher.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    return ShambleMatcher(fields)
@@ -0,0 +1,328 @@
+import logging
+import time
+from logging import INFO, LogRecord
+from threading import Lock
+from typing import NoReturn, Optional
+
+from trafalgar_log.core.enums import LogFields
+
+LOG_STAGE: str = "log"
+PAYLOAD_STAGE: str = "payload"
+FORMAT_STAGE: str = "format"
+WRITE_STAGE: str = "write"
+STAGES: tuple = (LOG_STAGE, PAYLOAD_STAGE, FORMAT_STAGE, WRITE_STAGE)
+QUEUE: str = "queue"
+SUPPRESSED: str = "suppressed"
+DEDUPLICATED: str = "deduplicated"
+OTHER_LOG_CODES: str = "[other log_codes]"
+PERCENTILES: tuple = (50, 90, 99)
+STATS_LOG_CODE: str = "Trafalgar Log"
+_BUCKETS: int = 48
+_MAX_LOG_CODES: int = 1024
+
+
+class _Histogram(object):
+    """
+    This is the latency histogram of a stage. The durations, in
+    nanoseconds, are counted on power of two buckets (bucket i holds the
+    durations of i bits), so recording one is a few integer operations and
+    the histogram has a fixed size; the percentiles are estimated as the
+    upper bound of their buckets.
+
+    :ivar count: The number of recorded durations.
+    :ivar total: The sum of the recorded durations.
+    :ivar maximum: The longest recorded duration.
+    :ivar buckets: The number of durations of each bucket.
+    """
+
+    __slots__ = ("count", "total", "maximum", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.maximum = 0
+        self.buckets = [0] * _BUCKETS
+
+    def add(self, duration: int) -> NoReturn:
+        """
+        The add function records a duration.
+
+        :param duration: int: The duration, in nanoseconds.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        self.count += 1
+        self.total += duration
+
+        if duration > self.maximum:
+            self.maximum = duration
+
+        self.buckets[min(duration.bit_length(), _BUCKETS - 1)] += 1
+
+    def snapshot(self) -> dict:
+        """
+        The snapshot function summarizes the histogram, with the durations
+        in microseconds.
+
+        :returns: A dict with the count, the mean, the maximum and the
+                percentiles of the durations.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        snapshot = {
+            "count": self.count,
+            "mean_us": _to_microseconds(self.total / self.count)
+            if self.count
+            else 0.0,
+            "max_us": _to_microseconds(self.maximum),
+        }
+
+        for percentile in PERCENTILES:
+            snapshot[f"p{percentile}_us"] = _to_microseconds(
+                self._get_percentile(percentile)
+            )
+
+        return snapshot
+
+    def _get_percentile(self, percentile: int) -> int:
+        """
+        The _get_percentile function estimates a percentile of the
+        durations as the upper bound of the bucket that holds it, which is
+        never more than the longest duration.
+
+        :param percentile: int: The percentile, from 0 to 100.
+        :returns: The estimated duration, in nanoseconds.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if not self.count:
+            return 0
+
+        rank = self.count * percentile / 100
+        seen = 0
+
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+
+            if count and seen >= rank:
+                return min((1 << bucket) - 1, self.maximum)
+
+        return self.maximum
+
+
+class TrafalgarStats(object):
+    """
+    This is the class of the self-instrumentation of Trafalgar Log
+    (TRA_LOG_STATS). When enabled, it records the latency histograms of
+    the stages of a log event:
+    - log: the whole call of a log method on the caller thread, from the
+      creation of the log record to the end of the synchronous handlers;
+    - payload: the conversion and the shambling of the payload;
+    - format: the formatting of the log event, including its payload;
+    - write: the writes of the handlers of Trafalgar Log (buffered,
+      collector, file and batches); with the default handler, the write is
+      the log stage minus the format stage.
+    It also counts the log events by level and by log_code, the bytes
+    formatted and the log events dropped by the queue of the asynchronous
+    mode, suppressed by sampling and rate limits or deduplicated.
+    When disabled, which is the default, each instrumented function only
+    checks the enabled attribute. The enabled and interval attributes are
+    set from the settings by apply_settings, on their first use.
+    Every interval seconds (TRA_LOG_STATS_INTERVAL), on the next log event,
+    a snapshot is logged as an INFO log event.
+
+    :ivar enabled: True if the stages and the counters are recorded.
+    :ivar interval: The number of seconds between two reports, or 0 to
+        never report.
+    """
+
+    def __init__(self, enabled: bool = False, interval: float = 0):
+        self.enabled = enabled
+        self.interval = interval
+        self._lock = Lock()
+        self._reset(time.monotonic())
+
+    def add_time(self, stage: str, start: int) -> NoReturn:
+        """
+        The add_time function records the duration of a stage, from its
+        start until now.
+
+        :param stage: str: The stage, one of STAGES.
+        :param start: int: The time.perf_counter_ns when the stage started.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        duration = time.perf_counter_ns() - start
+
+        with self._lock:
+            self._histograms[stage].add(duration)
+
+    def count_event(self, level: str, log_code: str) -> NoReturn:
+        """
+        The count_event function counts a log event by its level and its
+        log_code. Once there are _MAX_LOG_CODES log_codes, the new ones are
+        counted together on OTHER_LOG_CODES.
+
+        :param level: str: The name of the level of the log event.
+        :param log_code: str: The log_code of the log event.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        with self._lock:
+            self._levels[level] = self._levels.get(level, 0) + 1
+
+            if (
+                log_code not in self._log_codes
+                and len(self._log_codes) >= _MAX_LOG_CODES
+            ):
+                log_code = OTHER_LOG_CODES
+
+            self._log_codes[log_code] = self._log_codes.get(log_code, 0) + 1
+
+    def count_bytes(self, text: str) -> NoReturn:
+        """
+        The count_bytes function counts the bytes of a formatted log event,
+        encoded as UTF-8.
+
+        :param text: str: The formatted log event.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        size = len(text) if text.isascii() else len(text.encode("utf-8"))
+
+        with self._lock:
+            self._bytes += size
+
+    def count_dropped(self, reason: str, dropped: int = 1) -> NoReturn:
+        """
+        The count_dropped function counts log events that were not written.
+
+        :param reason: str: QUEUE, SUPPRESSED or DEDUPLICATED.
+        :param dropped: int: The number of log events.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        with self._lock:
+            self._dropped[reason] += dropped
+
+    def snapshot(self, reset: bool = False) -> dict:
+        """
+        The snapshot function returns the stages and the counters recorded
+        since the stats were created or last reset.
+
+        :param reset: bool: True to reset the stats after the snapshot.
+        :returns: A dict with the stats.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        now = time.monotonic()
+
+        with self._lock:
+            snapshot = {
+                "enabled": self.enabled,
+                "seconds": round(now - self._since, 3),
+                "stages": {
+                    stage: histogram.snapshot()
+                    for stage, histogram in self._histograms.items()
+                },
+                "levels": dict(self._levels),
+                "log_codes": dict(self._log_codes),
+                "bytes": self._bytes,
+                "dropped": dict(self._dropped),
+            }
+
+            if reset:
+                self._reset(now)
+
+        return snapshot
+
+    def report(
+        self, logger: logging.Logger, now: Optional[float] = None
+    ) -> NoReturn:
+        """
+        The report function logs a snapshot of the stats, resetting them,
+        if interval seconds have passed since the last report.
+
+        :param logger: logging.Logger: The logger of the report.
+        :param now: float: The monotonic time of the report.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        now = now or time.monotonic()
+
+        with self._lock:
+            if not self.interval or now < self._next_report:
+                return
+
+            self._next_report = now + self.interval
+
+        if logger.isEnabledFor(INFO):
+            logger.handle(
+                _get_report_record(logger, self.snapshot(reset=True))
+            )
+
+    def _reset(self, now: float) -> NoReturn:
+        """
+        The _reset function clears the stages and the counters. It must be
+        called holding the lock, except by __init__.
+
+        :param now: float: The current monotonic time.
+        :returns: Nothing.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        self._since = now
+        self._next_report = now + self.interval
+        self._histograms = {stage: _Histogram() for stage in STAGES}
+        self._levels = {}
+        self._log_codes = {}
+        self._bytes = 0
+        self._dropped = {QUEUE: 0, SUPPRESSED: 0, DEDUPLICATED: 0}
+
+
+def _to_microseconds(nanoseconds: float) -> float:
+    return round(nanoseconds / 1000, 3)
+
+
+def _get_report_record(logger: logging.Logger, snapshot: dict) -> LogRecord:
+    """
+    The _get_report_record function creates the INFO log record that
+    reports a snapshot of the stats.
+
+    :param logger: logging.Logger: The logger of the log record.
+    :param snapshot: dict: The snapshot of the stats.
+    :returns: The log record.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    record = logging.makeLogRecord(
+        {
+            "name": logger.name,
+            "msg": f"Trafalgar Log stats of the last {snapshot['seconds']} "
+            f"seconds.",
+            "levelno": INFO,
+            "levelname": logging.getLevelName(INFO),
+            "pathname": __file__,
+            "filename": "stats.py",
+            "module": "stats",
+            "funcName": "report",
+        }
+    )
+    record.__dict__.update(
+        {
+            LogFields.LOG_CODE.value: STATS_LOG_CODE,
+            LogFields.PAYLOAD.value: snapshot,
+            LogFields.SEVERITY.value: logging.getLevelName(INFO),
+        }
+    )
+
+    return record
+
+
+STATS: TrafalgarStats = TrafalgarStats()
@@ -1,15 +1,33 @@
-import json
+import builtins
+import dataclasses
 import logging
+import math
 import os
 import sys
+import time
+import traceback
 from datetime import datetime
-from logging import Logger, LogRecord, StreamHandler
-from typing import NoReturn, Union
+from functools import lru_cache
+from itertools import islice
+from logging import Formatter, Handler, Logger, LogRecord, StreamHandler
+from threading import Lock
+from types import CodeType, FrameType, ModuleType, TracebackType
+from typing import Callable, Iterable, NoReturn, Optional, Union
 
 from pythonjsonlogger.jsonlogger import JsonFormatter
 
 from trafalgar_log.app import SETTINGS, DEFAULT_FIELDS_TO_SHAMBLE
+from trafalgar_log.core.collector import get_collector_handler
+from trafalgar_log.core.encoders import JsonBackend, get_json_backend
 from trafalgar_log.core.enums import LogFields
+from trafalgar_log.core.handlers import (
+    get_buffered_handler,
+    get_file_handler,
+    get_queue_handler,
+)
+from trafalgar_log.core.limiter import set_deduplication_filter
+from trafalgar_log.core.shambles import ShambleMatcher, compile_shambles
+from trafalgar_log.core.stats import FORMAT_STAGE, PAYLOAD_STAGE, STATS
 
 APP: str = LogFields.APP.value
 FLOW: str = LogFields.FLOW.value
@@ -24,13 +42,48 @@ PAYLOAD: str = LogFields.PAYLOAD.value
 SEVERITY: str = LogFields.SEVERITY.value
 TIMESTAMP: str = LogFields.TIMESTAMP.value
 STACKTRACE: str = "stacktrace"
-ALL_FIELDS_TO_SHAMBLE: list = DEFAULT_FIELDS_TO_SHAMBLE
-ALL_FIELDS_TO_SHAMBLE.extend(SETTINGS.get("SHAMBLES").split(","))
-FIELDS_TO_SHAMBLE: list = [
-    field.strip().lower() for field in ALL_FIELDS_TO_SHAMBLE
-]
+TRACEBACK_HEADER: str = "Traceback (most recent call last):\n"
+ALL_FIELDS_TO_SHAMBLE: list = []
+FIELDS_TO_SHAMBLE: list = []
+SHAMBLES: Optional[ShambleMatcher] = None
+OS_PATHS: Optional[list] = None
 SHAMBLE_CHARACTER: str = "*"
 NOT_SET: str = "NOT_SET"
+FAST_FORMATTER: str = "FAST"
+TRUNCATED_KEY: str = "..."
+TRUNCATED_ITEMS: str = "[{} more items]"
+TRUNCATED_STRING: str = "...[{} more characters]"
+MAX_DEPTH_REACHED: str = "[max depth reached]"
+MAX_SIZE_REACHED: str = "[max payload size reached]"
+CIRCULAR_REFERENCE: str = "[circular reference]"
+_HANDLERS: list = []
+_JSON_PRIMITIVES: frozenset = frozenset({str, int, float, bool, type(None)})
+_MAX_CODE_LINES: int = 4096
+_MAX_PLANS: int = 1024
+_PLANS: dict = {}
+_PLANS_LOCK: Lock = Lock()
+_DATE_TIME_PREFIX: tuple = (None, "")
+_EXCEPTION_GROUPS: tuple = getattr(builtins, "BaseExceptionGroup", ())
+_MAX_STACKTRACES: int = 1024
+_STACKTRACES: dict = {}
+_STACKTRACES_LOCK: Lock = Lock()
+_STACKTRACE_LIMIT: Optional[int] = None
+_SKIP_EMPTY_STACKTRACE: bool = False
+_CACHE_STACKTRACES: bool = True
+_CODE_LINE: bool = True
+_UNKNOWN_CALLER: tuple = ("(unknown file)", 0, "(unknown function)")
+_MAX_CALLERS: int = 4096
+_CALLERS: dict = {}
+_CALLERS_LOCK: Lock = Lock()
+_STATIC_FIELDS: dict = {APP: None, DOMAIN: None}
+_FRAGMENTS: dict = {}
+_INSTANCE_ID_KEY: str = f',"{INSTANCE_ID}":'
+_SPLICEABLE_TYPES: tuple = (str, type(None))
+_SETTINGS_APPLIED: bool = False
+_FLOAT_CONSTANTS: dict = {
+    float("inf"): "Infinity",
+    float("-inf"): "-Infinity",
+}
 
 
 class TrafalgarLogFormatter(JsonFormatter):
@@ -42,9 +95,62 @@ class TrafalgarLogFormatter(JsonFormatter):
     Its only function add_fields or any other functions that may be
     implemented on this class should never be called, since this is a class
     used automatically by the logging package.
+    The log events are encoded by the JSON backend of TRA_LOG_JSON_BACKEND,
+    with the app and domain fields spliced as pre-encoded JSON fragments
+    (see _dumps_log_fields).
 
     """
 
+    def __init__(self, *args, **kwargs):
+        super(TrafalgarLogFormatter, self).__init__(*args, **kwargs)
+        _ensure_settings()
+        self.json_backend = get_json_backend(SETTINGS.get("JSON_BACKEND"))
+
+    def format(self, record: LogRecord) -> str:
+        """
+        The format function formats the log event with python-json-logger,
+        which calls add_fields, recording the format stage and the bytes of
+        the log event when TRA_LOG_STATS is set.
+
+        :param record: LogRecord: The log record of the log event.
+        :returns: The log event as a JSON string.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if not STATS.enabled:
+            return super(TrafalgarLogFormatter, self).format(record)
+
+        start = time.perf_counter_ns()
+        text = super(TrafalgarLogFormatter, self).format(record)
+        STATS.add_time(FORMAT_STAGE, start)
+        STATS.count_bytes(text)
+
+        return text
+
+    def jsonify_log_record(self, log_record: dict) -> str:
+        """
+        The jsonify_log_record function encodes the log event to JSON with
+        the JSON backend of the formatter.
+
+        :param log_record: dict: The fields of the log event.
+        :returns: The log event as a JSON string.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        return _dumps_log_fields(log_record, self.json_backend)
+
+    def formatException(self, ei: tuple) -> str:
+        """
+        The formatException function formats the exception of the log event
+        following the stacktrace settings (see _format_exception).
+
+        :param ei: tuple: The exc_info of the log record.
+        :returns: The stacktrace as a string.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        return _format_exception(ei)
+
     def add_fields(
         self,
         log_record: dict,
@@ -68,25 +174,349 @@ class TrafalgarLogFormatter(JsonFormatter):
         :doc-author: Trelent and this project contributors.
         """
 
-        from trafalgar_log.core.logger import Logger
-
         super(TrafalgarLogFormatter, self).add_fields(
             log_record, record, message_dict
         )
 
-        log_record[APP] = SETTINGS.get("APP_NAME")
-        log_record[FLOW] = Logger.get_flow()
-        log_record[CODE_LINE] = _get_code_line(record)
-        log_record[CORRELATION_ID] = Logger.get_correlation_id()
-        log_record[DATE_TIME] = _get_date_time(record)
-        log_record[DOMAIN] = SETTINGS.get(DOMAIN)
-        log_record[INSTANCE_ID] = Logger.get_instance_id()
-        log_record[LOG_MESSAGE] = record.message
-        log_record[TIMESTAMP] = _get_timestamp(record)
+        log_record.update(_get_log_fields(record))
 
         _set_stacktrace(log_record)
 
 
+class TrafalgarLogFastFormatter(Formatter):
+    """
+    This is the class responsible for formatting the log record of the log
+    event to the format of Trafalgar Log without python-json-logger
+    (TRA_LOG_FORMATTER=FAST).
+    Since the fields of the log event are always the LogFields, it builds
+    the log event directly in their order, with no format string to parse
+    and no generic merging of the attributes of the log record, writing the
+    same JSON as the TrafalgarLogFormatter. The only difference is that
+    extra attributes of log records not created by Trafalgar Log are not
+    written.
+    The log events are encoded by the JSON backend of TRA_LOG_JSON_BACKEND,
+    with the app and domain fields spliced as pre-encoded JSON fragments
+    (see _dumps_log_fields).
+    This class is instantiated only one time at the boot of an application
+    through the initialize_logger function.
+    """
+
+    def __init__(self):
+        super(TrafalgarLogFastFormatter, self).__init__()
+        _ensure_settings()
+        self.json_backend = get_json_backend(SETTINGS.get("JSON_BACKEND"))
+
+    def format(self, record: LogRecord) -> str:
+        """
+        The format function is the function responsible for the formatting
+        process. This method should not be called in any circumstances,
+        because it is called automatically each time a log event is created.
+
+        :param record: LogRecord: The log record of the log event.
+        :returns: The log event as a JSON string.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if not STATS.enabled:
+            return self._format(record)
+
+        start = time.perf_counter_ns()
+        text = self._format(record)
+        STATS.add_time(FORMAT_STAGE, start)
+        STATS.count_bytes(text)
+
+        return text
+
+    def formatException(self, ei: tuple) -> str:
+        """
+        The formatException function formats the exception of the log event
+        following the stacktrace settings (see _format_exception).
+
+        :param ei: tuple: The exc_info of the log record.
+        :returns: The stacktrace as a string.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        return _format_exception(ei)
+
+    def _format(self, record: LogRecord) -> str:
+        """
+        The _format function builds the log event from the fields of the log
+        record and encodes it to JSON.
+
+        :param record: LogRecord: The log record of the log event.
+        :returns: The log event as a JSON string.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        record.message = record.getMessage()
+        log_record = _get_log_fields(record)
+
+        if record.stack_info:
+            log_record["stack_info"] = self.formatStack(record.stack_info)
+
+        exc_text = None
+
+        if record.exc_info:
+            exc_text = self.formatException(record.exc_info)
+
+        if not exc_text:
+            exc_text = record.exc_text
+
+        if exc_text:
+            log_record[STACKTRACE] = exc_text.split("\n")
+
+        return _dumps_log_fields(log_record, self.json_backend)
+
+
+class _StaticFragments(object):
+    """
+    This is the class of the JSON fragments of the app and domain fields,
+    encoded only once by a JSON backend, e.g.: '{"app":"my-app",' and
+    ',"domain":"my-domain"'.
+
+    :ivar fields: The _STATIC_FIELDS the fragments were encoded from.
+    :ivar app: The start of the log event, with the app field.
+    :ivar domain: The domain field, preceded by a comma.
+    """
+
+    __slots__ = ("fields", "app", "domain")
+
+    def __init__(self, fields: dict, json_backend: JsonBackend):
+        self.fields = fields
+        self.app = f"{{{json_backend.dumps({APP: fields[APP]})[1:-1]},"
+        self.domain = f",{json_backend.dumps({DOMAIN: fields[DOMAIN]})[1:-1]}"
+
+
+def _dumps_log_fields(log_record: dict, json_backend: JsonBackend) -> str:
+    """
+    The _dumps_log_fields function encodes the fields of a log event to
+    JSON. The app and domain fields never change after the settings are
+    loaded, so, when the log event has them, they are left out of the
+    encoding and their pre-encoded fragments are spliced into the JSON:
+    the app one replaces the opening brace, since app is the first field,
+    and the domain one is inserted right before the instance_id field,
+    whose key can't be found earlier, since the quotes inside the encoded
+    strings are escaped. The fields before instance_id can be set by the
+    application, so the fragments are only spliced when the flow and the
+    correlation_id are strings (or None) and the instance_id is a string;
+    a dict flow, for instance, may have an instance_id key of its own. The
+    JSON is the same as encoding every field.
+
+    :param log_record: dict: The fields of the log event, in the order of
+            the LogFields, which may be changed.
+    :param json_backend: JsonBackend: The JSON backend of the formatter.
+    :returns: The log event as a JSON string.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    fields = _STATIC_FIELDS
+
+    if (
+        log_record.get(APP) is not fields[APP]
+        or log_record.get(DOMAIN) is not fields[DOMAIN]
+        or not isinstance(log_record.get(INSTANCE_ID), str)
+        or not isinstance(log_record.get(FLOW), _SPLICEABLE_TYPES)
+        or not isinstance(log_record.get(CORRELATION_ID), _SPLICEABLE_TYPES)
+        or next(iter(log_record)) != APP
+    ):
+        return json_backend.dumps(log_record)
+
+    fragments = _FRAGMENTS.get(json_backend.name)
+
+    if fragments is None or fragments.fields is not fields:
+        fragments = _FRAGMENTS[json_backend.name] = _StaticFragments(
+            fields, json_backend
+        )
+
+    del log_record[APP], log_record[DOMAIN]
+    text = json_backend.dumps(log_record)
+    position = text.index(_INSTANCE_ID_KEY)
+
+    return "".join(
+        (fragments.app, text[1:position], fragments.domain, text[position:])
+    )
+
+
+def _get_log_fields(record: LogRecord) -> dict:
+    """
+    The _get_log_fields function builds the fields of the log event from the
+    log record, in the order of the LogFields.
+
+    :param record: LogRecord: The log record of the log event; its message
+            must have already been formatted.
+    :returns: A dict with every field of the log event.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    from trafalgar_log.core.logger import Logger
+
+    return {
+        APP: _get_context_field(record, APP, _get_app_name),
+        FLOW: _get_context_field(record, FLOW, Logger.get_flow),
+        CODE_LINE: _get_code_line(record),
+        CORRELATION_ID: _get_context_field(
+            record, CORRELATION_ID, Logger.get_correlation_id
+        ),
+        DATE_TIME: _get_date_time(record),
+        DOMAIN: _get_context_field(record, DOMAIN, _get_domain),
+        INSTANCE_ID: _get_context_field(
+            record, INSTANCE_ID, Logger.get_instance_id
+        ),
+        LOG_CODE: getattr(record, LOG_CODE, None),
+        LOG_MESSAGE: record.message,
+        PAYLOAD: _get_payload_field(record),
+        SEVERITY: getattr(record, SEVERITY, None),
+        TIMESTAMP: _get_timestamp(record),
+    }
+
+
+def _get_context_field(
+    record: LogRecord, field: str, get_field: Callable[[], str]
+) -> str:
+    """
+    The _get_context_field function returns a field of the log event that
+    is shared by the log events of the same context (app, flow,
+    correlation_id, domain or instance_id). The optional fields are
+    captured by Logger._do_log when the log event is created, since the log
+    record may be formatted later, on another thread, and a LogBatch
+    captures all of them once for the whole batch; log records created
+    elsewhere fall back to the current value of the field.
+
+    :param record: LogRecord: The log record of the log event.
+    :param field: str: The name of the field.
+    :param get_field: Callable: The function that returns the current value
+            of the field.
+    :returns: The value of the field.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    value = getattr(record, field, None)
+
+    return get_field() if value is None else value
+
+
+def _get_app_name() -> str:
+    """
+    The _get_app_name function returns the app field of the log events.
+
+    :returns: The TRA_LOG_APP_NAME setting.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    return _STATIC_FIELDS[APP]
+
+
+def _get_domain() -> str:
+    """
+    The _get_domain function returns the domain field of the log events.
+
+    :returns: The TRA_LOG_DOMAIN setting.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    return _STATIC_FIELDS[DOMAIN]
+
+
+def _set_static_fields() -> NoReturn:
+    """
+    The _set_static_fields function reads the app and domain fields of the
+    log events from their settings. They are read only once, since they
+    never change unless the settings are reloaded, and replaced by a new
+    dict, so the JSON fragments encoded from the previous one are encoded
+    again.
+
+    :returns: Nothing.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    global _STATIC_FIELDS
+
+    _STATIC_FIELDS = {
+        APP: SETTINGS.get("APP_NAME"),
+        DOMAIN: SETTINGS.get(DOMAIN),
+    }
+
+
+def _set_shambles() -> NoReturn:
+    """
+    The _set_shambles function compiles the default fields to shamble and
+    the ones of TRA_LOG_SHAMBLES, clearing the plans built with the
+    previous ones.
+
+    :returns: Nothing.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    global ALL_FIELDS_TO_SHAMBLE, SHAMBLES
+
+    ALL_FIELDS_TO_SHAMBLE = DEFAULT_FIELDS_TO_SHAMBLE + SETTINGS.get(
+        "SHAMBLES"
+    ).split(",")
+    FIELDS_TO_SHAMBLE[:] = [
+        field.strip().lower() for field in ALL_FIELDS_TO_SHAMBLE
+    ]
+    SHAMBLES = compile_shambles(ALL_FIELDS_TO_SHAMBLE)
+    _clear_plans()
+
+
+def apply_settings() -> NoReturn:
+    """
+    The apply_settings function applies the settings read by this module:
+    the app and domain fields, the fields to shamble, the limits of the
+    payloads, the stacktrace policy, the code_line capture and the stats.
+    It is called on the first use of the settings (see _ensure_settings),
+    not on import, and by Logger.reload_settings.
+
+    :returns: Nothing.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    global _SETTINGS_APPLIED
+
+    _set_static_fields()
+    _set_shambles()
+    _set_payload_limits()
+    _set_stacktrace_policy()
+    _set_code_line_policy()
+    STATS.enabled = SETTINGS.get("STATS")
+    STATS.interval = SETTINGS.get("STATS_INTERVAL")
+    _SETTINGS_APPLIED = True
+
+
+def _ensure_settings() -> NoReturn:
+    """
+    The _ensure_settings function applies the settings if they were not
+    applied yet. It is called by initialize_logger, by the formatters and
+    by get_payload, so importing Trafalgar Log never loads the settings.
+
+    :returns: Nothing.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    if not _SETTINGS_APPLIED:
+        apply_settings()
+
+
+def _get_payload_field(record: LogRecord) -> object:
+    """
+    The _get_payload_field function returns the payload of the log event,
+    converting it to JSON only now if Logger._do_log stored it as a
+    LazyPayload.
+
+    :param record: LogRecord: The log record of the log event.
+    :returns: The payload converted to JSON.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    payload = getattr(record, PAYLOAD, None)
+
+    if isinstance(payload, LazyPayload):
+        return payload.resolve()
+
+    return payload
+
+
 def _get_os_paths() -> list:
     """
     The _get_os_paths function returns a list of all the paths in sys.path
@@ -127,9 +557,33 @@ def _find_relative_path(record: LogRecord) -> str:
     :doc-author: Trelent and this project contributors.
     """
 
+    return _get_relative_path(record.pathname, record.filename)
+
+
+@lru_cache(maxsize=_MAX_CODE_LINES)
+def _get_relative_path(pathname: str, filename: str) -> str:
+    """
+    The _get_relative_path function finds the relative path of a file from
+    the longest of the os_paths that contains it. Since the answer never
+    changes for the same file, it is memoized. The os_paths are only
+    computed on the first call, so importing Trafalgar Log doesn't scan
+    sys.path.
+
+    :param pathname: str: The absolute path of the file.
+    :param filename: str: The basename of the file.
+    :returns: The relative path of the file from the os_paths or its
+            basename if no os_path contains it.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    global OS_PATHS
+
+    if OS_PATHS is None:
+        OS_PATHS = _get_os_paths()
+
     # ensure that the path separator is always the os separator
-    pathname = record.pathname.replace("/", os.sep)
-    file_name = os.path.basename(record.filename)
+    pathname = pathname.replace("/", os.sep)
+    file_name = os.path.basename(filename)
 
     try:
         return next(
@@ -139,7 +593,7 @@ def _find_relative_path(record: LogRecord) -> str:
             and file_name != os.path.relpath(pathname, path)
         )
     except StopIteration:
-        return record.filename
+        return filename
 
 
 def _get_code_line(record: LogRecord) -> str:
@@ -156,22 +610,157 @@ def _get_code_line(record: LogRecord) -> str:
     :returns: A string that contains the relative path to the file where the
             log record was created, followed by a dash, and then it returns a
             string containing the function name and line number of code where
-            the log record was created.
+            the log record was created, or None if TRA_LOG_CODE_LINE is
+            false.
     :doc-author: Trelent and this project contributors.
     """
 
-    relativepath = _find_relative_path(record)
+    if not _CODE_LINE:
+        return None
 
-    return (
-        f"{relativepath.replace(os.sep, '/')} - "
-        f"{record.funcName}:{record.lineno}"
+    return _build_code_line(
+        record.pathname, record.filename, record.funcName, record.lineno
     )
 
 
+@lru_cache(maxsize=_MAX_CODE_LINES)
+def _build_code_line(
+    pathname: str, filename: str, func_name: str, lineno: int
+) -> str:
+    """
+    The _build_code_line function builds the code_line field of a log event.
+    Since the code_line of a given file, function and line never changes,
+    it is memoized, so after the first log event of a code line it only
+    costs a dictionary lookup.
+
+    :param pathname: str: The absolute path of the file of the log event.
+    :param filename: str: The basename of the file of the log event.
+    :param func_name: str: The function of the log event.
+    :param lineno: int: The line of the log event.
+    :returns: The code_line, e.g.: mypackage/module.py - myfunc:10
+    :doc-author: Trelent and this project contributors.
+    """
+
+    relativepath = _get_relative_path(pathname, filename)
+
+    return f"{relativepath.replace(os.sep, '/')} - {func_name}:{lineno}"
+
+
+def _get_caller(depth: int, frame: Optional[FrameType] = None) -> tuple:
+    """
+    The _get_caller function finds the caller of a log event, as the
+    findCaller of the logging package does for the stacklevel argument, but
+    without walking the frames: the frame is taken directly by its depth,
+    and its path and function name are cached by its code object, so only
+    the line is read for each log event.
+    When TRA_LOG_CODE_LINE is false, the caller is not captured at all.
+
+    :param depth: int: The number of frames between the caller of this
+            function and the caller of the log event.
+    :param frame: FrameType: The frame of the caller of the log event, if
+            it is already known.
+    :returns: A tuple with the path, the line and the function name of the
+            caller of the log event.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    if not _CODE_LINE:
+        return _UNKNOWN_CALLER
+
+    if frame is None:
+        frame = sys._getframe(depth + 1)
+
+    code = frame.f_code
+    caller = _CALLERS.get(code)
+
+    if caller is None:
+        caller = _cache_caller(code)
+
+    return caller[0], frame.f_lineno, caller[1]
+
+
+def _cache_caller(code: CodeType) -> tuple:
+    """
+    The _cache_caller function caches the path and the name of the
+    function of a code object, as findCaller reports them, dropping the
+    oldest ones when the cache holds _MAX_CALLERS of them.
+
+    :param code: CodeType: The code object of the caller of a log event.
+    :returns: A tuple with the path and the function name of the code.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    caller = (code.co_filename, code.co_name)
+
+    with _CALLERS_LOCK:
+        while len(_CALLERS) >= _MAX_CALLERS:
+            del _CALLERS[next(iter(_CALLERS))]
+        _CALLERS[code] = caller
+
+    return caller
+
+
+def _set_code_line_policy(enabled: Optional[bool] = None) -> NoReturn:
+    """
+    The _set_code_line_policy function sets if the caller of the log events
+    is captured for their code_line field. If enabled is not given, it is
+    read from TRA_LOG_CODE_LINE.
+
+    :param enabled: bool: False to skip the capture and write a null
+            code_line.
+    :returns: Nothing.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    global _CODE_LINE
+
+    if enabled is None:
+        enabled = SETTINGS.get("CODE_LINE")
+
+    _CODE_LINE = enabled
+
+
+def warm_up_code_lines(modules: Optional[Iterable[ModuleType]] = None) -> int:
+    """
+    The warm_up_code_lines function resolves, ahead of the first log event,
+    the relative paths used on the code_line field for the files of the
+    given modules (by default, every module already imported). It can be
+    called at the startup of an application, after its modules are
+    imported, so the first log event of each file does not pay for it.
+
+    :param modules: Iterable[ModuleType]: The modules to have their files
+            resolved; defaults to all modules on sys.modules.
+    :returns: The number of files resolved.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    if modules is None:
+        modules = list(sys.modules.values())
+
+    resolved = 0
+
+    for module in modules:
+        pathname = getattr(module, "__file__", None)
+
+        if isinstance(pathname, str):
+            _get_relative_path(pathname, os.path.basename(pathname))
+            resolved += 1
+
+    return resolved
+
+
 def _get_date_time(record: LogRecord) -> str:
     """
     The _get_date_time function returns a string representation of the log
     event date and time.
+    Most log events of a busy application are created on the same second,
+    so the date and time until the seconds is formatted once per second
+    and cached; only the milliseconds are added to it for each log event.
+    The timestamp is split as datetime.fromtimestamp does (microseconds
+    rounded half to even, carrying to the next second), so the result is
+    exactly the same of
+    datetime.fromtimestamp(created).isoformat(" ", "milliseconds"), on
+    any timezone.
 
     :param record: LogRecord: The log record of the log event.
     :returns: A string of the date and time in ISO 8601 format
@@ -179,9 +768,24 @@ def _get_date_time(record: LogRecord) -> str:
     :doc-author: Trelent and this project contributors.
     """
 
-    return datetime.fromtimestamp(record.created, tz=None).isoformat(
-        sep=" ", timespec="milliseconds"
-    )
+    global _DATE_TIME_PREFIX
+
+    fraction, second = math.modf(record.created)
+    microseconds = round(fraction * 1e6)
+
+    if microseconds >= 1000000:
+        second += 1
+        microseconds -= 1000000
+
+    cached_second, prefix = _DATE_TIME_PREFIX
+
+    if second != cached_second:
+        prefix = datetime.fromtimestamp(second).isoformat(
+            sep=" ", timespec="seconds"
+        )
+        _DATE_TIME_PREFIX = (second, prefix)
+
+    return f"{prefix}.{microseconds // 1000:03d}"
 
 
 def _get_timestamp(record: LogRecord) -> int:
@@ -203,13 +807,135 @@ def _set_stacktrace(log_record: dict) -> NoReturn:
     logging.Formatter class to set the stacktrace field of each log record.
 
     :param log_record: dict: Set the stacktrace key in the log_record:dict
-    parameter if the log record has "exc_info" key.
+    parameter if the log record has a non empty "exc_info" key, which is
+    always removed.
     :returns: Nothing.
     :doc-author: Trelent and this project contributors.
     """
 
-    if log_record.get("exc_info"):
-        log_record[STACKTRACE] = log_record.pop("exc_info").split("\n")
+    exc_info = log_record.pop("exc_info", None)
+
+    if exc_info:
+        log_record[STACKTRACE] = exc_info.split("\n")
+
+
+def _format_exception(exc_info: tuple) -> str:
+    """
+    The _format_exception function formats the exception of a log event as
+    logging.Formatter.formatException does, following the stacktrace
+    settings:
+    - TRA_LOG_STACKTRACE_FRAMES keeps only the innermost frames of the
+      traceback, where the exception was raised;
+    - TRA_LOG_SKIP_EMPTY_STACKTRACE returns an empty string, so there is
+      no stacktrace field, when an ERROR or CRITICAL log event is logged
+      without an exception being handled ("NoneType: None");
+    - TRA_LOG_CACHE_STACKTRACES caches the formatted frames by the
+      exception type and the code location (code object and last
+      instruction) of each frame, so failures repeated on the same place do
+      not read the source lines and format the same frames again; only the
+      message of the exception is formatted each time. Chained exceptions
+      and exception groups are always formatted in full.
+
+    :param exc_info: tuple: The exc_info of the log record.
+    :returns: The stacktrace as a string, without the last line break.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    exc_type, exc_value, tb = exc_info
+
+    if exc_type is None and _SKIP_EMPTY_STACKTRACE:
+        return ""
+
+    if (
+        not _CACHE_STACKTRACES
+        or tb is None
+        or exc_value.__cause__ is not None
+        or (
+            exc_value.__context__ is not None
+            and not exc_value.__suppress_context__
+        )
+        or isinstance(exc_value, _EXCEPTION_GROUPS)
+    ):
+        stacktrace = "".join(
+            traceback.format_exception(
+                exc_type, exc_value, tb, limit=_STACKTRACE_LIMIT
+            )
+        )
+    else:
+        stacktrace = (
+            TRACEBACK_HEADER
+            + _get_stacktrace_frames(exc_type, tb)
+            + "".join(traceback.format_exception_only(exc_type, exc_value))
+        )
+
+    return stacktrace[:-1] if stacktrace[-1:] == "\n" else stacktrace
+
+
+def _get_stacktrace_frames(exc_type: type, tb: TracebackType) -> str:
+    """
+    The _get_stacktrace_frames function formats the frames of a traceback,
+    caching them by the exception type and the code location of each frame.
+    The cache holds up to _MAX_STACKTRACES tracebacks; when it is full, the
+    oldest one is evicted.
+
+    :param exc_type: type: The type of the exception.
+    :param tb: TracebackType: The traceback of the exception.
+    :returns: The formatted frames.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    signature = []
+    frame = tb
+
+    while frame is not None:
+        signature.append((frame.tb_frame.f_code, frame.tb_lasti))
+        frame = frame.tb_next
+
+    key = (exc_type, tuple(signature))
+    frames = _STACKTRACES.get(key)
+
+    if frames is None:
+        frames = "".join(traceback.extract_tb(tb, _STACKTRACE_LIMIT).format())
+
+        with _STACKTRACES_LOCK:
+            while len(_STACKTRACES) >= _MAX_STACKTRACES:
+                del _STACKTRACES[next(iter(_STACKTRACES))]
+            _STACKTRACES[key] = frames
+
+    return frames
+
+
+def _set_stacktrace_policy(
+    frames: Optional[int] = None,
+    skip_empty: Optional[bool] = None,
+    cache: Optional[bool] = None,
+) -> NoReturn:
+    """
+    The _set_stacktrace_policy function sets how the exceptions of the log
+    events are formatted, clearing the cached stacktraces. Each argument
+    that is not given is read from its setting.
+
+    :param frames: int: The number of innermost frames kept (0 keeps all).
+    :param skip_empty: bool: True to omit the stacktrace when there is no
+            exception being handled.
+    :param cache: bool: True to cache the formatted frames.
+    :returns: Nothing.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    global _STACKTRACE_LIMIT, _SKIP_EMPTY_STACKTRACE, _CACHE_STACKTRACES
+
+    if frames is None:
+        frames = SETTINGS.get("STACKTRACE_FRAMES")
+    if skip_empty is None:
+        skip_empty = SETTINGS.get("SKIP_EMPTY_STACKTRACE")
+    if cache is None:
+        cache = SETTINGS.get("CACHE_STACKTRACES")
+
+    _STACKTRACE_LIMIT = -frames if frames else None
+    _SKIP_EMPTY_STACKTRACE = skip_empty
+    _CACHE_STACKTRACES = cache
+    _STACKTRACES.clear()
 
 
 def _get_format() -> str:
@@ -227,18 +953,23 @@ def _get_format() -> str:
     return " ".join([f"%({log_field.value})" for log_field in LogFields])
 
 
-def _get_formatter() -> TrafalgarLogFormatter:
+def _get_formatter() -> Formatter:
     """
     The _get_formatter function returns an instance of the
     TrafalgarLogFormatter class, which is then passed to the logging
     module's basicConfig function as the formatter keyword argument. This
     allows us to configure how our log messages are formatted before they are
     written out by setting attributes on this object.
+    If TRA_LOG_FORMATTER is FAST, an instance of the
+    TrafalgarLogFastFormatter class is returned instead.
 
-    :returns: A TrafalgarLogFormatter object.
+    :returns: A TrafalgarLogFormatter or a TrafalgarLogFastFormatter object.
     :doc-author: Trelent and this project contributors.
     """
 
+    if SETTINGS.get("FORMATTER").upper() == FAST_FORMATTER:
+        return TrafalgarLogFastFormatter()
+
     return TrafalgarLogFormatter(_get_format())
 
 
@@ -257,165 +988,864 @@ def _remove_handlers() -> NoReturn:
             root.removeHandler(handler)
 
 
-def _get_handler() -> StreamHandler:
+def _close_handlers() -> NoReturn:
+    """
+    The _close_handlers function removes and closes the handlers added by
+    previous calls of initialize_logger, so a queue handler has its queue
+    drained and no log event is printed twice.
+
+    :returns: Nothing.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    while _HANDLERS:
+        logger, handler = _HANDLERS.pop()
+        logger.removeHandler(handler)
+        handler.close()
+
+
+def _reinitialize_handlers() -> NoReturn:
+    """
+    The _reinitialize_handlers function is called on the child process
+    right after a fork (e.g.: of a gunicorn worker or of a multiprocessing
+    process). It calls the after_fork function of the handlers added by
+    initialize_logger, so they drop the connections, buffers, queues and
+    threads inherited from the parent process instead of sharing them.
+
+    :returns: Nothing.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    for _, handler in _HANDLERS:
+        if hasattr(handler, "after_fork"):
+            handler.after_fork()
+
+
+def _get_handler() -> Handler:
     """
     The _get_handler function creates a StreamHandler object and sets the
     formatter to the _get_formatter function.
+    If the collector mode is enabled (TRA_LOG_COLLECTOR), a
+    TrafalgarCollectorHandler is created instead, which sends log events to
+    the collector process. Otherwise, if a file is set (TRA_LOG_FILE), a
+    TrafalgarRotatingFileHandler is created, which writes the log events to
+    the file and rotates it, or, if the buffered mode is enabled
+    (TRA_LOG_BUFFERED), a TrafalgarBufferedHandler is created, so log events
+    are written together instead of one write per log event.
+    If the asynchronous mode is enabled (TRA_LOG_ASYNC), the StreamHandler
+    is wrapped by a queue handler, so it only formats and writes log events
+    on a background thread.
     It then returns this handler.
 
-    :returns: A StreamHandler object.
+    :returns: A StreamHandler, a TrafalgarCollectorHandler, a
+            TrafalgarRotatingFileHandler, a TrafalgarBufferedHandler or a
+            TrafalgarQueueHandler object.
     :doc-author: Trelent and this project contributors.
     """
 
-    log_handler = StreamHandler()
+    if SETTINGS.get("COLLECTOR"):
+        log_handler = get_collector_handler(
+            SETTINGS.get("COLLECTOR_ADDRESS")
+        )
+    elif SETTINGS.get("FILE"):
+        log_handler = get_file_handler(
+            SETTINGS.get("FILE"),
+            SETTINGS.get("FILE_MAX_BYTES"),
+            SETTINGS.get("FILE_ROTATION"),
+            SETTINGS.get("FILE_BACKUP_COUNT"),
+            SETTINGS.get("FILE_COMPRESSION"),
+        )
+    elif SETTINGS.get("BUFFERED"):
+        log_handler = get_buffered_handler(
+            SETTINGS.get("BUFFER_SIZE"), SETTINGS.get("FLUSH_INTERVAL")
+        )
+    else:
+        log_handler = StreamHandler()
+
     log_handler.setFormatter(_get_formatter())
+
+    if SETTINGS.get("ASYNC"):
+        return get_queue_handler(
+            log_handler,
+            SETTINGS.get("QUEUE_SIZE"),
+            SETTINGS.get("QUEUE_OVERFLOW"),
+        )
+
     return log_handler
 
 
-def _shamble_list(value: list) -> list:
+class _PayloadWalk(object):
+    """
+    This is the class that holds the state of the conversion of a payload,
+    so its limits (TRA_LOG_MAX_DEPTH, TRA_LOG_MAX_ITEMS,
+    TRA_LOG_MAX_STRING_LENGTH and TRA_LOG_MAX_PAYLOAD_SIZE) are enforced
+    while the payload is walked, instead of after it is converted. A new
+    instance is created for each payload; the limits are class attributes,
+    set by _set_payload_limits, so creating it stays cheap.
+
+    :ivar markers: The ids of the containers being converted, used to
+        detect circular references.
+    :ivar depth: The number of containers being converted.
+    :ivar size: The approximate number of characters of the converted
+        payload: the length of its strings plus one per item.
+    :ivar max_depth: The maximum number of nested containers.
+    :ivar max_items: The maximum number of items of each container.
+    :ivar max_string_length: The maximum number of characters of a string.
+    :ivar max_size: The maximum approximate size of the payload.
     """
-    The _shamble_list function takes a list and returns a new list with the
-    same elements, but with each element replaced by SHAMBLE_CHARACTER. This
-    is used to hide potentially sensitive information in the log event.
 
-    :param value: list: Tell the function the list to shamble its values.
-    :returns: The list of the parameter with its contents shambled.
+    __slots__ = ("markers", "depth", "size")
+
+    max_depth: int = sys.maxsize
+    max_items: int = sys.maxsize
+    max_string_length: int = sys.maxsize
+    max_size: int = sys.maxsize
+
+    def __init__(self):
+        self.markers = set()
+        self.depth = 0
+        self.size = 0
+
+    def reject(self, container: object) -> Optional[str]:
+        """
+        The reject function checks if a container that is about to be
+        converted is already being converted (i.e., it references itself),
+        is deeper than max_depth or comes after max_size is reached. The
+        converters only call it when their inline check fails, so it is not
+        called for the containers that are converted.
+
+        :param container: object: The container that is about to be
+                converted.
+        :returns: The marker that replaces the container
+                (CIRCULAR_REFERENCE, MAX_DEPTH_REACHED or MAX_SIZE_REACHED),
+                or None if it can be converted.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if id(container) in self.markers:
+            return CIRCULAR_REFERENCE
+        if self.depth >= self.max_depth:
+            return MAX_DEPTH_REACHED
+        if self.size > self.max_size:
+            return MAX_SIZE_REACHED
+
+        return None
+
+    def truncate(self, value: str) -> str:
+        """
+        The truncate function counts a string on the size of the payload
+        and cuts it with _truncate if it is too long.
+
+        :param value: str: The string to be truncated.
+        :returns: The string itself or the truncated string.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        length = len(value)
+        self.size += length
+
+        if length > self.max_string_length or self.size > self.max_size:
+            return _truncate(value, self.size)
+
+        return value
+
+
+def _set_payload_limits(
+    max_depth: Optional[int] = None,
+    max_items: Optional[int] = None,
+    max_string_length: Optional[int] = None,
+    max_size: Optional[int] = None,
+) -> NoReturn:
+    """
+    The _set_payload_limits function sets the limits of the conversion of
+    the payloads. Each limit that is not given is read from its setting
+    (e.g.: TRA_LOG_MAX_DEPTH) and 0 means no limit.
+
+    :param max_depth: int: The maximum number of nested containers.
+    :param max_items: int: The maximum number of items of each container.
+    :param max_string_length: int: The maximum number of characters of a
+            string.
+    :param max_size: int: The maximum approximate size of a payload.
+    :returns: Nothing.
     :doc-author: Trelent and this project contributors.
     """
 
-    return [SHAMBLE_CHARACTER for _ in value]
+    limits = {
+        "max_depth": (max_depth, "MAX_DEPTH"),
+        "max_items": (max_items, "MAX_ITEMS"),
+        "max_string_length": (max_string_length, "MAX_STRING_LENGTH"),
+        "max_size": (max_size, "MAX_PAYLOAD_SIZE"),
+    }
+
+    for attribute, (limit, setting) in limits.items():
+        if limit is None:
+            limit = SETTINGS.get(setting)
+        setattr(_PayloadWalk, attribute, limit or sys.maxsize)
 
 
-# noinspection PyTypeChecker
-def _is_iterable(obj: object) -> bool:
+def _truncate(value: str, size: int) -> str:
     """
-    The _is_iterable function is a helper function that is used to determine
-    if an object is iterable.
-    It does this by attempting to use the built-in Python iter() function on
-    the object. If it succeeds, then _is_iterable returns True; otherwise it
-    returns False.
+    The _truncate function cuts a string to TRA_LOG_MAX_STRING_LENGTH
+    characters or, if it makes the payload reach TRA_LOG_MAX_PAYLOAD_SIZE,
+    to the characters that still fit, ending it with TRUNCATED_STRING.
 
-    :param obj: object: The object to be tested if it is iterable.
-    :returns: True if the object is iterable, False otherwise.
+    :param value: str: The string to be cut.
+    :param size: int: The size of the payload, counting the string.
+    :returns: The truncated string.
     :doc-author: Trelent and this project contributors.
     """
 
-    try:
-        iter(obj)
-        return True
-    except TypeError:
-        return False
+    length = len(value)
+    kept = min(
+        _PayloadWalk.max_string_length,
+        max(_PayloadWalk.max_size - size + length, 0),
+    )
+
+    return value[:kept] + TRUNCATED_STRING.format(length - kept)
+
+
+def _shamble_list(
+    value: Union[list, tuple], nodes: tuple, walk: _PayloadWalk
+) -> Union[list, str]:
+    """
+    The _shamble_list function converts the list of a key that should be
+    shambled, replacing each of its primitive items (and the ones of its
+    nested lists) by SHAMBLE_CHARACTER. Dictionaries and objects on the list
+    are kept, with their own fields shambled. This is used to hide
+    potentially sensitive information in the log event.
+
+    :param value: list: Tell the function the list to shamble its values.
+    :param nodes: tuple: The nodes of the dotted paths that reached the
+            list.
+    :param walk: _PayloadWalk: The state of the conversion of the payload.
+    :returns: The list of the parameter with its contents shambled, or the
+            marker that replaces it (see _PayloadWalk.reject).
+    :doc-author: Trelent and this project contributors.
+    """
+
+    marker = id(value)
+    markers = walk.markers
+
+    if (
+        marker in markers
+        or walk.depth >= walk.max_depth
+        or walk.size > walk.max_size
+    ):
+        return walk.reject(value)
+
+    markers.add(marker)
+    walk.depth += 1
+
+    processed = len(value)
+    items = value
+
+    if processed > walk.max_items:
+        processed = walk.max_items
+        items = islice(items, processed)
+
+    walk.size += processed
+    new_value = []
+
+    for item in items:
+        if type(item) in _JSON_PRIMITIVES:
+            item = SHAMBLE_CHARACTER
+        elif isinstance(item, (list, tuple)):
+            item = _shamble_list(item, nodes, walk)
+        else:
+            item = _convert(item, nodes, walk)
+
+            if _is_primitive(item):
+                item = SHAMBLE_CHARACTER
+        new_value.append(item)
+
+    if processed < len(value):
+        new_value.append(TRUNCATED_ITEMS.format(len(value) - processed))
+
+    walk.depth -= 1
+    markers.remove(marker)
+
+    return new_value
 
 
 def _is_primitive(obj: object) -> bool:
     """
     The _is_primitive function is a helper function for the
-    _should_shamble_primitive_value function.
-    It returns True if obj is a primitive type (str, int, float), and False o
-    therwise.
+    _dict_replace_value function.
+    Since it only receives values already converted by _to_json, it returns
+    True if obj is anything but a JSON object or array (str, int, float, bool
+    or None), and False otherwise.
 
     :param obj: object: The object that should be checked if it is primitive.
-    :returns: True if the object is a primitive (str, int, float or bool).
+    :returns: True if the object is a primitive (str, int, float, bool or
+            None).
     :doc-author: Trelent and this project contributors.
     """
 
-    return isinstance(obj, str) or (
-        not hasattr(obj, "__dict__") and not _is_iterable(obj)
-    )
+    return not isinstance(obj, (dict, list))
 
 
-def _should_shamble_primitive_value(key: str, value: object) -> bool:
+def _to_json_key(key: object) -> Optional[str]:
+    """
+    The _to_json_key function converts a dictionary key to the string that
+    the json package would use for it: strings are kept, floats, integers,
+    booleans and None are converted to their JSON representation and any
+    other key is skipped (the same behaviour of json.dumps with
+    skipkeys=True).
+
+    :param key: object: The dictionary key to be converted.
+    :returns: The key as a string or None if the key should be skipped.
+    :doc-author: Trelent and this project contributors.
     """
-    The _should_shamble_primitive_value function is used to determine whether
-    a primitive value should be shambled. Primitive values are those that are
-    not complex objects, such as lists or dictionaries.
-    The _should_shamble_primitive_value function returns True if the key of
-    the given value is in the list of keys to shambler, and False otherwise.
 
-    :param key: str: The key of the value to check if it should be shambled.
-    :param value: object: The value that should be validated if it is
-            primitive.
-    :returns: True if the value is a primitive, and it's key is in
-            FIELDS_TO_SHAMBLE.
+    if isinstance(key, str):
+        return key
+    if isinstance(key, float):
+        if key != key:
+            return "NaN"
+        return _FLOAT_CONSTANTS.get(key) or float.__repr__(key)
+    if key is True:
+        return "true"
+    if key is False:
+        return "false"
+    if key is None:
+        return "null"
+    if isinstance(key, int):
+        return int.__repr__(key)
+
+    return None
+
+
+def _dict_replace_value(
+    payload: dict,
+    nodes: Optional[tuple] = (),
+    walk: Optional[_PayloadWalk] = None,
+) -> Union[dict, str]:
+    """
+    # refs.: https://stackoverflow.com/a/60776516/7973282
+    The _dict_replace_value function converts a dictionary to a JSON object
+    and, unless nodes is None, replaces the values of the fields matched by
+    SHAMBLES with the SHAMBLE_CHARACTER character in the same traversal.
+    This is done to prevent sensitive information from being exposed in the
+    log event.
+    The conversion is copy-on-write: if no key nor value of the dictionary
+    changes, the dictionary itself is returned, and a new one is only
+    created from the first key or value that changes on, so only the
+    subtrees that lead to shambled or converted values are copied.
+    Only the first TRA_LOG_MAX_ITEMS items are kept; the remaining ones are
+    replaced by the TRUNCATED_KEY key.
+
+    :param payload: dict: The payload to be have its field replaced with a
+            new value.
+    :param nodes: tuple: The nodes of the dotted paths of SHAMBLES that
+            reached the dictionary, or None if nothing should be shambled.
+    :param walk: _PayloadWalk: The state of the conversion of the payload.
+    :returns: The dictionary, if it is already JSON and has nothing to
+            shamble, a new dictionary with all values converted to JSON
+            and, if requested, shambled, or the marker that replaces it (see
+            _PayloadWalk.reject).
     :doc-author: Trelent and this project contributors.
     """
 
-    return key.lower() in FIELDS_TO_SHAMBLE and _is_primitive(value)
+    if walk is None:
+        walk = _PayloadWalk()
+
+    marker = id(payload)
+    markers = walk.markers
+
+    if (
+        marker in markers
+        or walk.depth >= walk.max_depth
+        or walk.size > walk.max_size
+    ):
+        return walk.reject(payload)
+
+    markers.add(marker)
+    walk.depth += 1
+
+    memo = SHAMBLES.memo
+    has_paths = SHAMBLES.has_paths
+    max_string_length = walk.max_string_length
+    max_size = walk.max_size
+    processed = len(payload)
+    items = payload.items()
+
+    if processed > walk.max_items:
+        processed = walk.max_items
+        items = islice(items, processed)
+
+    size = walk.size + processed
+    child_nodes = nodes
+    new_payload = None if type(payload) is dict else {}
+    unchanged = 0
+
+    for payload_key, payload_value in items:
+        key = payload_key
+        value = payload_value
+
+        if type(key) is not str:
+            key = _to_json_key(key)
+
+        if key is None:
+            pass
+        elif nodes is None:
+            if type(value) is str:
+                length = len(value)
+                size += length
+
+                if length > max_string_length or size > max_size:
+                    value = _truncate(value, size)
+            elif type(value) not in _JSON_PRIMITIVES:
+                walk.size = size
+                value = _convert(value, None, walk)
+                size = walk.size
+        else:
+            should_shamble = memo.get(key)
+
+            if should_shamble is None:
+                should_shamble = SHAMBLES.is_shambled(key)
+            if has_paths:
+                path_shambled, child_nodes = SHAMBLES.descend(nodes, key)
+                should_shamble = should_shamble or path_shambled
+
+            if type(value) in _JSON_PRIMITIVES:
+                if should_shamble:
+                    value = SHAMBLE_CHARACTER
+                elif type(value) is str:
+                    length = len(value)
+                    size += length
+
+                    if length > max_string_length or size > max_size:
+                        value = _truncate(value, size)
+            else:
+                walk.size = size
+
+                if should_shamble and isinstance(value, (list, tuple)):
+                    value = _shamble_list(value, child_nodes, walk)
+                else:
+                    value = _convert(value, child_nodes, walk)
+
+                    if should_shamble and _is_primitive(value):
+                        value = SHAMBLE_CHARACTER
+                size = walk.size
+
+        if new_payload is None:
+            if key is payload_key and value is payload_value:
+                unchanged += 1
+                continue
+            new_payload = dict(islice(payload.items(), unchanged))
+        if key is not None:
+            new_payload[key] = value
+
+    if processed < len(payload):
+        if new_payload is None:
+            new_payload = dict(islice(payload.items(), unchanged))
+        new_payload[TRUNCATED_KEY] = TRUNCATED_ITEMS.format(
+            len(payload) - processed
+        )
+
+    walk.size = size
+    walk.depth -= 1
+    markers.remove(marker)
+
+    return payload if new_payload is None else new_payload
 
 
-def _shamble_fields(payload: object) -> Union[dict, object]:
+def _list_replace_value(
+    payload: Union[list, tuple], nodes: Optional[tuple], walk: _PayloadWalk
+) -> Union[list, str]:
+    """
+    The _list_replace_value function converts a list or a tuple to a JSON
+    array. Its items are kept, but the fields of its dictionaries and
+    objects are shambled as any other. As on _dict_replace_value, a list
+    whose items do not change is returned as it is, and only its first
+    TRA_LOG_MAX_ITEMS items are kept.
+
+    :param payload: list: The list or tuple to be converted.
+    :param nodes: tuple: The nodes of the dotted paths of SHAMBLES that
+            reached the list, or None if nothing should be shambled.
+    :param walk: _PayloadWalk: The state of the conversion of the payload.
+    :returns: The list itself, a new list with all items converted to JSON
+            or the marker that replaces it (see _PayloadWalk.reject).
+    :doc-author: Trelent and this project contributors.
     """
-    The _shamble_fields function is a helper function that is used to replace
-    the values of the fields in the payload with random values. This is done
-    by using a dictionary comprehension to iterate through each key and
-    value pair in the payload. The result of this function will be passed
-    into _dict_replace_value which will recursively call itself on any nested
-    dictionaries or lists.
 
-    :param payload: object: The payload to have its field replaced with a
-            new value.
-    :returns: A dictionary with the same keys and values as the payload
-            argument, except that all the values have been replaced by a new
-            value or the payload itself if it is not a dictionary.
+    marker = id(payload)
+    markers = walk.markers
+
+    if (
+        marker in markers
+        or walk.depth >= walk.max_depth
+        or walk.size > walk.max_size
+    ):
+        return walk.reject(payload)
+
+    markers.add(marker)
+    walk.depth += 1
+
+    max_string_length = walk.max_string_length
+    max_size = walk.max_size
+    processed = len(payload)
+    items = payload
+
+    if processed > walk.max_items:
+        processed = walk.max_items
+        items = islice(items, processed)
+
+    size = walk.size + processed
+    new_payload = None if type(payload) is list else []
+
+    for index, payload_value in enumerate(items):
+        value_type = type(payload_value)
+        value = payload_value
+
+        if value_type is str:
+            length = len(value)
+            size += length
+
+            if length > max_string_length or size > max_size:
+                value = _truncate(value, size)
+        elif value_type not in _JSON_PRIMITIVES:
+            walk.size = size
+            value = _convert(payload_value, nodes, walk)
+            size = walk.size
+
+        if new_payload is None:
+            if value is payload_value:
+                continue
+            new_payload = payload[:index]
+        new_payload.append(value)
+
+    if processed < len(payload):
+        if new_payload is None:
+            new_payload = payload[:processed]
+        new_payload.append(TRUNCATED_ITEMS.format(len(payload) - processed))
+
+    walk.size = size
+    walk.depth -= 1
+    markers.remove(marker)
+
+    return payload if new_payload is None else new_payload
+
+
+class _SerializationPlan(object):
+    """
+    This is the class that holds how the instances of a type are converted
+    to JSON, so the type is only inspected the first time it is seen.
+    The attribute names known ahead (the attributes or known_attributes)
+    are checked against SHAMBLES when the plan is built, so their answers
+    are already memoized when the instances are converted.
+
+    :ivar convert: The function that converts an instance of the type.
+    :ivar attributes: The names of the attributes of the instances, for
+        dataclasses and classes with __slots__ but without __dict__; None
+        when the attributes are read from __dict__.
+    """
+
+    __slots__ = ("convert", "attributes")
+
+    def __init__(
+        self,
+        convert: Callable,
+        attributes: Optional[tuple] = None,
+        known_attributes: tuple = (),
+    ):
+        self.convert = convert
+        self.attributes = attributes
+
+        for name in attributes or known_attributes:
+            SHAMBLES.is_shambled(name)
+
+
+def _convert_str(
+    value: str,
+    plan: _SerializationPlan,
+    nodes: Optional[tuple],
+    walk: _PayloadWalk,
+) -> str:
+    return walk.truncate(str.__str__(value))
+
+
+def _convert_int(value: int, plan: _SerializationPlan, *_) -> int:
+    return int.__int__(value)
+
+
+def _convert_float(value: float, plan: _SerializationPlan, *_) -> float:
+    return float.__float__(value)
+
+
+def _convert_list(
+    value: Union[list, tuple],
+    plan: _SerializationPlan,
+    nodes: Optional[tuple],
+    walk: _PayloadWalk,
+) -> Union[list, str]:
+    return _list_replace_value(value, nodes, walk)
+
+
+def _convert_dict(
+    value: dict,
+    plan: _SerializationPlan,
+    nodes: Optional[tuple],
+    walk: _PayloadWalk,
+) -> Union[dict, str]:
+    return _dict_replace_value(value, nodes, walk)
+
+
+def _convert_to_str(
+    value: object,
+    plan: _SerializationPlan,
+    nodes: Optional[tuple],
+    walk: _PayloadWalk,
+) -> str:
+    return walk.truncate(str(value))
+
+
+def _convert_attributes(
+    value: object,
+    plan: _SerializationPlan,
+    nodes: Optional[tuple],
+    walk: _PayloadWalk,
+) -> object:
+    """
+    The _convert_attributes function converts an object to a JSON object
+    with its attributes, read from __dict__ or, for dataclasses and classes
+    with __slots__ but without __dict__, from the attribute names of its
+    plan.
+
+    :param value: object: The object to be converted.
+    :param plan: _SerializationPlan: The plan of the type of the object.
+    :param nodes: tuple: The nodes of the dotted paths of SHAMBLES that
+            reached the object, or None if nothing should be shambled.
+    :param walk: _PayloadWalk: The state of the conversion of the payload.
+    :returns: The JSON compatible representation of the object.
     :doc-author: Trelent and this project contributors.
     """
 
-    if isinstance(payload, dict):
-        return _dict_replace_value(payload)
+    marker = id(value)
+    markers = walk.markers
 
-    return payload
+    if marker in markers:
+        return CIRCULAR_REFERENCE
+
+    markers.add(marker)
+
+    if plan.attributes is None:
+        attributes = value.__dict__
+    else:
+        attributes = {
+            name: getattr(value, name)
+            for name in plan.attributes
+            if hasattr(value, name)
+        }
 
+    if type(attributes) is dict:
+        converted = _dict_replace_value(attributes, nodes, walk)
+    else:
+        converted = _convert(attributes, nodes, walk)
 
-def _dict_replace_value(payload: dict) -> dict:
+    markers.remove(marker)
+
+    return converted
+
+
+def _get_slots(value_type: type) -> tuple:
     """
-    # refs.: https://stackoverflow.com/a/60776516/7973282
-    The _dict_replace_value function replaces all values in a dictionary with
-    the SHAMBLE_CHARACTER character. This is done to prevent sensitive
-    information from being exposed in the log event.
+    The _get_slots function returns the attribute names declared on the
+    __slots__ of a class and its parents, with private names mangled.
 
-    :param payload: dict: The payload to be have its field replaced with a
-            new value.
-    :returns: A new dictionary with all values that are dictionaries replaced
-            by a shambled version of the value.
+    :param value_type: type: The class to have its slots listed.
+    :returns: A tuple with the attribute names.
     :doc-author: Trelent and this project contributors.
     """
 
-    new_payload = {}
+    slots = []
+
+    for cls in reversed(value_type.__mro__):
+        cls_slots = cls.__dict__.get("__slots__", ())
+
+        for name in [cls_slots] if isinstance(cls_slots, str) else cls_slots:
+            if name in ("__dict__", "__weakref__"):
+                continue
+            if name.startswith("__") and not name.endswith("__"):
+                name = f"_{cls.__name__.lstrip('_')}{name}"
+            if name not in slots:
+                slots.append(name)
+
+    return tuple(slots)
+
+
+def _has_default_str(value_type: type) -> bool:
+    """
+    The _has_default_str function checks if a class keeps the __str__ and
+    __repr__ of object, which means its string representation is useless
+    on a log event.
+
+    :param value_type: type: The class to be checked.
+    :returns: True if the class does not override __str__ nor __repr__.
+    :doc-author: Trelent and this project contributors.
+    """
 
-    for key, value in payload.items():
-        if isinstance(value, dict):
-            value = _dict_replace_value(value)
-        elif isinstance(value, list):
-            value = _shamble_list(value)
-        elif _should_shamble_primitive_value(key, value):
-            value = SHAMBLE_CHARACTER
-        new_payload[key] = value
-    return new_payload
+    return (
+        value_type.__str__ is object.__str__
+        and value_type.__repr__ is object.__repr__
+    )
 
 
-def _to_json(payload: object) -> dict:
+def _build_plan(value_type: type, value: object) -> _SerializationPlan:
     """
-    The _to_json function is a helper function that converts an object to JSON.
+    The _build_plan function inspects a type, following the same rules of
+    json.dumps(skipkeys=True, default=lambda o: o.__dict__ or str(o)), and
+    returns its plan:
+    - subclasses of str, int, float, list, tuple and dict are converted to
+      the type they extend;
+    - objects with __dict__ are converted with their attributes, with the
+      fields of dataclasses and the annotations of classes known ahead;
+    - dataclasses with __slots__ are converted with their fields;
+    - classes with __slots__ that have no string representation of their
+      own are converted with their slots;
+    - everything else is converted to string.
+
+    :param value_type: type: The type to have its plan built.
+    :param value: object: An instance of the type.
+    :returns: The plan of the type.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    if issubclass(value_type, str):
+        return _SerializationPlan(_convert_str)
+    if issubclass(value_type, int):
+        return _SerializationPlan(_convert_int)
+    if issubclass(value_type, float):
+        return _SerializationPlan(_convert_float)
+    if issubclass(value_type, (list, tuple)):
+        return _SerializationPlan(_convert_list)
+    if issubclass(value_type, dict):
+        return _SerializationPlan(_convert_dict)
+
+    is_dataclass = dataclasses.is_dataclass(value_type)
+    fields = (
+        tuple(field.name for field in dataclasses.fields(value_type))
+        if is_dataclass
+        else ()
+    )
+
+    if hasattr(value, "__dict__"):
+        known_attributes = fields or tuple(
+            getattr(value_type, "__annotations__", None) or ()
+        )
+
+        return _SerializationPlan(
+            _convert_attributes, known_attributes=known_attributes
+        )
+    if is_dataclass:
+        return _SerializationPlan(_convert_attributes, attributes=fields)
+    if _has_default_str(value_type):
+        slots = _get_slots(value_type)
+
+        if slots:
+            return _SerializationPlan(_convert_attributes, attributes=slots)
+
+    return _SerializationPlan(_convert_to_str)
+
+
+def _get_plan(value_type: type, value: object) -> _SerializationPlan:
+    """
+    The _get_plan function returns the plan of a type from the plans cache,
+    building it on the first time the type is seen. The cache is bounded by
+    _MAX_PLANS; when it is full, the oldest plan is evicted, so classes
+    created dynamically cannot grow it forever.
+
+    :param value_type: type: The type of the object to be converted.
+    :param value: object: The object to be converted.
+    :returns: The plan of the type.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    plan = _PLANS.get(value_type)
+
+    if plan is None:
+        plan = _build_plan(value_type, value)
+
+        with _PLANS_LOCK:
+            while len(_PLANS) >= _MAX_PLANS:
+                del _PLANS[next(iter(_PLANS))]
+            _PLANS[value_type] = plan
+
+    return plan
+
+
+def _clear_plans() -> NoReturn:
+    """
+    The _clear_plans function clears the plans cache and the memo of the
+    keys that should be shambled, which must be done every time SHAMBLES
+    changes.
+
+    :returns: Nothing.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    with _PLANS_LOCK:
+        _PLANS.clear()
+        SHAMBLES.memo.clear()
+
+
+def _convert(
+    value: object, nodes: Optional[tuple], walk: _PayloadWalk
+) -> object:
+    """
+    The _convert function converts any object to its JSON compatible
+    representation, with the same rules of
+    json.dumps(skipkeys=True, default=lambda o: o.__dict__ or str(o)):
+    primitives are kept, lists and tuples become lists, dictionaries and
+    objects with __dict__ become dictionaries and everything else becomes a
+    string. Any type other than the JSON ones is converted through its
+    cached plan (see _build_plan).
+
+    :param value: object: The object to be converted.
+    :param nodes: tuple: The nodes of the dotted paths of SHAMBLES that
+            reached the object, or None if nothing should be shambled.
+    :param walk: _PayloadWalk: The state of the conversion of the payload.
+    :returns: The JSON compatible representation of the object.
+    :doc-author: Trelent and this project contributors.
+    """
+
+    value_type = type(value)
+
+    if value_type is str:
+        return walk.truncate(value)
+    if value_type in _JSON_PRIMITIVES:
+        return value
+    if value_type is dict:
+        return _dict_replace_value(value, nodes, walk)
+    if value_type is list or value_type is tuple:
+        return _list_replace_value(value, nodes, walk)
+
+    plan = _PLANS.get(value_type) or _get_plan(value_type, value)
+
+    return plan.convert(value, plan, nodes, walk)
+
+
+def _to_json(payload: object, shamble: bool = False) -> object:
+    """
+    The _to_json function is a helper function that converts an object to
+    JSON in a single traversal, without serializing it to a string.
     The _to_json function will convert all attributes within an object to
     key-value pairs and return a dict.
     If there are any nested objects, they will also be converted to dicts and
     so on.
-    The skipkeys attribute is set to True so that if there are any
-    unserializable attributes (which would happen if using default=lambda),
-    they can be skipped instead of causing an infity loop.
+    Keys that cannot be represented on JSON are skipped and unserializable
+    values are converted to strings, exactly as json.dumps would do.
+    The payload is cut by the limits of _PayloadWalk while it is walked
+    and circular references are replaced by CIRCULAR_REFERENCE.
 
     :param payload: object: The payload to be converted to JSON object.
+    :param shamble: bool: Whether the fields of the payload should be
+            shambled while it is converted.
     :returns: The JSON object.
     :doc-author: Trelent and this project contributors.
     """
 
-    return json.loads(
-        json.dumps(
-            payload,
-            skipkeys=True,
-            default=lambda o: o.__dict__ if hasattr(o, "__dict__") else str(o),
-        )
-    )
+    return _convert(payload, () if shamble else None, _PayloadWalk())
 
 
 def get_payload(payload: object) -> Union[object, dict]:
@@ -424,6 +1854,13 @@ def get_payload(payload: object) -> Union[object, dict]:
     returns a dictionary. The get_payload function is used to convert the
     payload from a Python object into a JSON-serializable dictionary. This
     allows the user to pass in any arbitrary Python object as the payload.
+    The conversion and the shambling of the fields are done in a single
+    traversal of the payload. The dictionaries and lists of the payload
+    that have nothing to convert nor to shamble are not copied, so the
+    result may share them with the payload and should not be mutated.
+    Huge payloads are cut while they are walked, with explicit markers, by
+    TRA_LOG_MAX_DEPTH, TRA_LOG_MAX_ITEMS, TRA_LOG_MAX_STRING_LENGTH and
+    TRA_LOG_MAX_PAYLOAD_SIZE.
 
     :param payload: object: Pass in the object that is to be converted into
             a JSON object.
@@ -432,7 +1869,57 @@ def get_payload(payload: object) -> Union[object, dict]:
     :doc-author: Trelent and this project contributors.
     """
 
-    return _shamble_fields(_to_json(payload))
+    if not _SETTINGS_APPLIED:
+        apply_settings()
+
+    if not STATS.enabled:
+        return _to_json(payload, shamble=True)
+
+    start = time.perf_counter_ns()
+    payload = _to_json(payload, shamble=True)
+    STATS.add_time(PAYLOAD_STAGE, start)
+
+    return payload
+
+
+class LazyPayload(object):
+    """
+    This is the class used by Logger._do_log to store the payload on the log
+    record without converting it. The payload is only converted (and
+    shambled) by get_payload when a handler actually formats the log event,
+    so log events dropped by filters, levels or queues never pay for it and,
+    with the asynchronous mode, the conversion happens on the background
+    thread.
+    The conversion happens only once, even if more than one handler formats
+    the log event. Since the payload is kept by reference until then, it
+    should not be mutated after it is logged.
+    """
+
+    __slots__ = ("payload", "_value", "_resolved")
+
+    def __init__(self, payload: object):
+        self.payload = payload
+        self._value = None
+        self._resolved = False
+
+    def resolve(self) -> Union[object, dict]:
+        """
+        The resolve function converts the payload with get_payload on its
+        first call and returns the same result on the next ones.
+
+        :returns: The payload converted to JSON.
+        :doc-author: Trelent and this project contributors.
+        """
+
+        if not self._resolved:
+            self._value = get_payload(self.payload)
+            self._resolved = True
+            self.payload = None
+
+        return self._value
+
+    def __repr__(self) -> str:
+        return repr(self.resolve())
 
 
 def initialize_logger() -> Logger:
@@ -443,18 +1930,26 @@ def initialize_logger() -> Logger:
     messages.
     It removes handlers to avoid conflict and log duplication.
     refs.: https://stackoverflow.com/a/45624044/7973282
+    When TRA_LOG_DEDUPLICATION_WINDOW is set, it also adds a filter that
+    suppresses the repetitions of identical log events.
 
     :returns: A logger object.
     :doc-author: Trelent and this project contributors.
     """
 
+    _ensure_settings()
     _remove_handlers()
+    _close_handlers()
 
     logger = logging.getLogger(SETTINGS.get("APP_NAME"))
-    logger.addHandler(_get_handler())
+    handler = _get_handler()
+    logger.addHandler(handler)
+    _HANDLERS.append((logger, handler))
     logger.setLevel(logging.getLevelName(SETTINGS.get("HAKI").upper()))
+    set_deduplication_filter(logger)
 
     return logger
 
 
-OS_PATHS = _get_os_paths()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinitialize_handlers)